@@ -21,7 +21,16 @@
 
 from kam.modules.exceptions.exceptions import KamFunctionNotImplemented
 
+import time
+
 class BaseCheck:
+	## \brief The fields each check section can have, they are read by the check runner and not by the check
+	CONFIG_ITEM_DEADLINE = "deadline"
+	CONFIG_ITEM_INTERVAL = "interval"
+	RESERVED_CONFIG_ITEMS = [ CONFIG_ITEM_DEADLINE, CONFIG_ITEM_INTERVAL ]
+	## \brief True when check() compares counters with the previous check(), so skipping a check() changes its result
+	MEASURES_RATE = False
+
 	## \brief The constructor
 	#
 	# Note this constructor is actually 'protected', so you should not create a object of the class BaseCheck, but you should use a subclass that uses BaseCheck as base class.
@@ -29,6 +38,10 @@ class BaseCheck:
 	def __init__(self):
 		self._keep_alive = False
 		self._is_enabled = False
+		self._is_unknown = False
+		self._is_stale = False
+		self._alive_time = None
+		self._result_time = None
 
 	## Call this method to check if the machine is alive
 	#
@@ -75,21 +88,73 @@ class BaseCheck:
 	# \public
 	# \return True if alive, otherwise False
 	def isAlive(self):
-		return self._keep_alive and self._is_enabled
+		return self._keep_alive and self._is_enabled and not self._is_stale
 
 	## \brief Tell the base class the machine is alive.
 	#
 	# This is a helper function, so subclasses can notify the machine is alive.
 	#
 	# \protected
-	def _alive(self):
+	# \param when The time of the activity from time.monotonic(), when it is known more precisely than now
+	def _alive(self, when=None):
 		self._keep_alive = True
+		self._is_unknown = False
+		self._is_stale = False
+		self._result_time = time.monotonic()
+		self._alive_time = when if when is not None else self._result_time
+
+	## \brief Returns the time of the activity found by the last check() which was alive.
+	#
+	# \public
+	# \return The time from time.monotonic(), or None when the check was never alive
+	def getAliveTime(self):
+		return self._alive_time
 
 	## \brief same as _alive(), but the machine is dead.
 	#
 	# \protected
 	def _dead(self):
 		self._keep_alive = False
+		self._is_unknown = False
+		self._is_stale = False
+		self._result_time = time.monotonic()
+
+	## \brief Mark the result of the check as unknown, it is not alive.
+	#
+	# The check runner calls this function when check() did not finish before its deadline.
+	# The next _alive() or _dead() makes the result known again.
+	#
+	# \public
+	# \param since A result of _alive() or _dead() from this time or later is kept, from time.monotonic()
+	def setUnknown(self, since=None):
+		if since is not None and self._result_time is not None and self._result_time >= since:
+			return
+
+		self._keep_alive = False
+		self._is_unknown = True
+
+	## \brief Returns if the result of the last check() is unknown, because it did not finish in time.
+	#
+	# \public
+	# \return True if unknown, otherwise False
+	def isUnknown(self):
+		return self._is_unknown and self._is_enabled
+
+	## \brief Mark the result of the check as stale, it is not alive.
+	#
+	# The check runner calls this function when the ordered mode skipped check() in this round.
+	# The next _alive() or _dead() makes the result fresh again.
+	#
+	# \public
+	def setStale(self):
+		self._is_stale = True
+
+	## \brief Returns if the result of the last check() is stale, because check() was skipped in this round.
+	#
+	# \public
+	# \return True if stale, otherwise False
+	def isStale(self):
+		return self._is_stale and self._is_enabled
 
 	## \brief a function prototype to load a config from a parsed config file
 	#
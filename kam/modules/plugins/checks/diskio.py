@@ -0,0 +1,228 @@
+##\package diskio
+# \brief This plugin checks the current disk activity.
+#
+# In the config file you can define a section [disk] with the fields read_speed and write_speed.
+# They define thresholds and when more bytes per second are read or written, the machine is kept alive.
+# The fields read_iops and write_iops do the same for the amount of completed reads and writes per second.
+# This plugin calculates the rates between two successive calls of check(), so the first check() is a calibration.
+#
+# The counters are read from /proc/diskstats. The thresholds are compared with the sum of the disks
+# which match the glob patterns of \e devices and do not match the patterns of \e ignore_devices.
+# Partitions are never part of the sum, their I/O is already counted by their disk.
+# A threshold for one device is defined by appending its name, for example write_speed_sda.
+# The rates can be smoothed with \e smoothing (none, ewma or window) over \e smoothing_window rounds.
+#
+# In the fields you can use the suffixes K and M.
+# 1K = 1024bytes, 1M = 1024 * 1024 bytes
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+from kam.modules.plugins.checks.basecheck import BaseCheck
+from kam.utils.ratemeter import RateMeter
+import kam.utils.ratemeter as ratemeter
+import kam.utils.utils as utils
+
+import fnmatch
+import os
+import time
+
+## \brief The counters of a device, in the order they are returned by _readCounters()
+COUNTERS = [ "read_speed", "read_iops", "write_speed", "write_iops" ]
+
+## \brief The sectors of /proc/diskstats are always 512 bytes, whatever the sector size of the disk is
+SECTOR_SIZE = 512
+
+class DiskIOCheck(BaseCheck):
+	CONFIG_NAME = "disk"
+	MEASURES_RATE = True
+	CONFIG_ITEM_DEVICES = "devices"
+	CONFIG_ITEM_IGNORE_DEVICES = "ignore_devices"
+	CONFIG_ITEM_SMOOTHING = "smoothing"
+	CONFIG_ITEM_SMOOTHING_WINDOW = "smoothing_window"
+
+	PROC_DISKSTATS = "/proc/diskstats"
+	SYS_BLOCK = "/sys/class/block"
+
+	DEFAULT_DEVICES = "*"
+	DEFAULT_IGNORE_DEVICES = "loop*, ram*, zram*, sr*, dm-*"
+
+	def __init__(self, data_dict):
+		super().__init__()
+		self._debug = data_dict["debug"]
+		self._log = data_dict["log"]
+
+		self._meter = RateMeter(len(COUNTERS))
+		self._included = {}
+
+	def _run(self):
+		now = time.clock_gettime(time.CLOCK_MONOTONIC)
+		totals = [ 0.0 ] * len(COUNTERS)
+		devices = []
+
+		for (name, values) in self._readCounters():
+			included = self._isIncluded(name)
+			thresholds = self._device_thresholds.get(name)
+			if not included and thresholds is None:
+				continue
+
+			rates = self._meter.update(name, values, now)
+			if rates is None:
+				continue # a new device, it has no rate yet
+
+			if included:
+				for i in range(len(COUNTERS)):
+					totals[i] += rates[i]
+
+			devices.append((name, rates, thresholds is not None and self._exceeds(rates, thresholds)))
+
+		self._meter.sweep()
+
+		if self._exceeds(totals, self._thresholds) or any([ alive for (_, _, alive) in devices ]):
+			self._alive()
+		else:
+			self._dead()
+
+		if self._debug:
+			for (i, counter) in enumerate(COUNTERS):
+				if self._thresholds[i] is not None:
+					self._debug.log(self._debug.TYPE_CHECK, self,\
+					                counter, totals[i], "", totals[i] >= self._thresholds[i])
+
+			if self._debug.wants(self._debug.TYPE_CHECK, self, self._debug.LEVEL_TRACE):
+				for (name, rates, alive) in devices:
+					self._debug.log(self._debug.TYPE_CHECK, self, name,\
+					                dict(zip(COUNTERS, rates)), "", alive, self._debug.LEVEL_TRACE)
+
+	## \brief Check if one of the rates reaches its threshold
+	def _exceeds(self, rates, thresholds):
+		for i in range(len(COUNTERS)):
+			if thresholds[i] is not None and rates[i] >= thresholds[i]:
+				return True
+
+		return False
+
+	## \brief Check if the device is used for the totals, the result is cached
+	#
+	# A device is a partition when its directory in /sys/class/block has a file \e partition.
+	def _isIncluded(self, name):
+		included = self._included.get(name)
+		if included is None:
+			included = any([ fnmatch.fnmatchcase(name, pattern) for pattern in self._devices ]) and\
+			           not any([ fnmatch.fnmatchcase(name, pattern) for pattern in self._ignore_devices ]) and\
+			           not os.path.exists(os.path.join(self.SYS_BLOCK, name, "partition"))
+			self._included[name] = included
+
+		return included
+
+	## \brief Read the counters of all devices
+	#
+	# \return A list of tuples (name, [ bytes read, reads, bytes written, writes ])
+	def _readCounters(self):
+		with open(self.PROC_DISKSTATS, "rb") as f:
+			lines = f.read().splitlines()
+
+		counters = []
+		for line in lines:
+			# major minor name reads merged sectors ms writes merged sectors ms ...
+			fields = line.split()
+			if len(fields) < 11:
+				continue
+
+			counters.append((fields[2].decode(), [ int(fields[5]) * SECTOR_SIZE, int(fields[3]),\
+			                                       int(fields[9]) * SECTOR_SIZE, int(fields[7]) ]))
+
+		return counters
+
+	def loadConfig(self, config):
+		err_value = ""
+		self._thresholds = [ None ] * len(COUNTERS)
+		self._device_thresholds = {}
+		self._included = {}
+		devices = self.DEFAULT_DEVICES
+		ignore_devices = self.DEFAULT_IGNORE_DEVICES
+		smoothing = ratemeter.SMOOTHING_NONE
+		window = 1
+
+		try:
+			section = config[self.CONFIG_NAME]
+		except KeyError as ex:
+			err_value = str(ex) + "; "
+			section = None
+
+		if section:
+			for (key, value) in section.items():
+				for (i, counter) in enumerate(COUNTERS):
+					if key == counter:
+						name = None
+					elif key.startswith(counter + "_"):
+						name = key[len(counter) + 1:]
+					else:
+						continue
+
+					try:
+						threshold = float(utils.toSize(value)) if value.strip() else None
+					except ValueError as ex:
+						err_value += "{0}: {1}; ".format(key, str(ex))
+						continue
+
+					if name is None:
+						self._thresholds[i] = threshold
+					elif threshold is not None:
+						self._device_thresholds.setdefault(name, [ None ] * len(COUNTERS))[i] = threshold
+
+			devices = section.get(self.CONFIG_ITEM_DEVICES, devices)
+			ignore_devices = section.get(self.CONFIG_ITEM_IGNORE_DEVICES, ignore_devices)
+			smoothing = section.get(self.CONFIG_ITEM_SMOOTHING, smoothing).strip()
+			try:
+				window = int(section.get(self.CONFIG_ITEM_SMOOTHING_WINDOW, "1"))
+			except ValueError as ex:
+				err_value += str(ex) + "; "
+
+		self._devices = [ pattern.strip() for pattern in devices.split(",") if pattern.strip() ]
+		self._ignore_devices = [ pattern.strip() for pattern in ignore_devices.split(",") if pattern.strip() ]
+
+		try:
+			self._meter = RateMeter(len(COUNTERS), smoothing, window)
+		except ValueError as ex:
+			err_value += str(ex) + "; "
+			smoothing = ratemeter.SMOOTHING_NONE
+			self._meter = RateMeter(len(COUNTERS))
+
+		if any([ threshold is not None for threshold in self._thresholds ]) or len(self._device_thresholds) > 0:
+			self._enable()
+		else:
+			self._disable()
+
+		if self._debug:
+			for (i, counter) in enumerate(COUNTERS):
+				self._debug.log(self._debug.TYPE_CONFIG, self, counter,\
+				                self._thresholds[i], err_value, self.isEnabled() and self._thresholds[i] is not None)
+			for (name, thresholds) in self._device_thresholds.items():
+				self._debug.log(self._debug.TYPE_CONFIG, self, name,\
+				                dict(zip(COUNTERS, thresholds)), "", self.isEnabled())
+
+		if self._log:
+			self._log.log(self, "Config file read.\nenabled = {0}\nread_speed = {1}\nwrite_speed = {2}\n"\
+			                    "read_iops = {3}\nwrite_iops = {4}\ndevices = {5}\nignore_devices = {6}\n"\
+			                    "per device = {7}\nsmoothing = {8} ({9})\n{10}\n".format(\
+			              self.isEnabled(), self._thresholds[0], self._thresholds[2], self._thresholds[1], self._thresholds[3],\
+			              self._devices, self._ignore_devices, self._device_thresholds, smoothing, window, err_value))
+
+def createInstance(data_dict):
+	return DiskIOCheck(data_dict)
@@ -26,48 +26,49 @@
 # along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
 
 from kam.modules.plugins.checks.basecheck import BaseCheck
-from threading import Lock
+import kam.utils.udevmonitor as udevmonitor
+import kam.utils.inputdevices as inputdevices
 
 import os
+import time
 
 class KeyboardCheck(BaseCheck):
 	CONFIG_NAME = "keyboard"
 	CONFIG_ITEM_KEYBOARDS = "keyboards"
 
+	INPUT_PATH = "/dev/input"
+
 	def __init__(self, data_dict):
 		super().__init__()
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
-		self._pollmanager = data_dict["pollmanager"]
-		self._files = []
+		self._inputtracker = data_dict["inputtracker"]
+		self._inputdevices = data_dict["inputdevices"]
 		self._keyboards = []
+		self._configured = []
+		self._auto = False
 		self._first_after_config = False
 
+		self._last_run = time.monotonic()
+
 		self._udevmonitor = data_dict["udevmonitor"]
-		self._udevmonitor.addCallback(self._udev_event)
+		self._udevmonitor.addListener(self._udev_event)
 
 	def _run(self):
 		read_from = []
+		last_activity = None
 
-		for f in self._files:
-			try: # There is a change the file does not exist anymore!
-				if self._pollmanager.hasInput(f.fileno()):
-					self._flush_input(f)
-					read_from.append(f.name)
-			except:
-				if not os.path.exists(f.name):
-					try:
-						f.close()
-					except:
-						# TODO: propably this is not necessary, check if we should close a file that does not exist anymore.
-						pass
-
-				self._files.remove(f)
+		for keyboard in self._keyboards:
+			activity = self._inputtracker.lastActivity(self._path(keyboard))
+			if activity is not None and activity > self._last_run:
+				read_from.append(keyboard)
+				last_activity = activity if last_activity is None else max(activity, last_activity)
 
+		self._last_run = time.monotonic()
 
 		if len(read_from) > 0 or self._first_after_config:
 			self._first_after_config = False
-			self._alive()
+			self._alive(last_activity)
 		else:
 			self._dead()
 
@@ -75,23 +76,81 @@ class KeyboardCheck(BaseCheck):
 			self._debug.log(self._debug.TYPE_CHECK, self, "read from: ", read_from, "", super().isAlive())
 
 
-	def _flush_input(self, f):
-		while self._pollmanager.hasInput(f.fileno()):
-			_ = f.read1(100)
+	def _path(self, keyboard):
+		return os.path.join(self.INPUT_PATH, keyboard)
+
+	## \brief Track the new keyboards and stop tracking the old ones
+	#
+	# \return The errors as a string
+	def _setKeyboards(self, keyboards):
+		err_value = ""
+		tracked = []
+
+		# Track the new keyboards first, so a keyboard in both lists keeps its state
+		for keyboard in keyboards:
+			try:
+				self._inputtracker.track(self._path(keyboard))
+				tracked.append(keyboard)
+			except OSError as ex:
+				err_value += str(ex) + "; "
+
+		for keyboard in self._keyboards:
+			self._inputtracker.untrack(self._path(keyboard))
+
+		self._keyboards = tracked
+		return err_value
 
+	## \brief Open or close a single keyboard when an input device is plugged in or unplugged
+	#
+	# When device events were lost, all keyboards are found again.
+	def _udev_event(self, event):
+		keyboard = event.getName()
 
-	def _udev_event(self):
-		self.loadConfig(self._config)
+		if event.getAction() == udevmonitor.ACTION_REMOVE:
+			if keyboard not in self._keyboards:
+				return
+
+			self._keyboards.remove(keyboard)
+			self._inputtracker.untrack(self._path(keyboard))
+		elif event.getAction() == udevmonitor.ACTION_ADD:
+			if keyboard in self._keyboards or not (keyboard in self._configured or (self._auto and self._isKeyboard(keyboard))):
+				return
+
+			try:
+				self._inputtracker.track(self._path(keyboard))
+			except OSError as ex:
+				if self._log:
+					self._log.log(self, "Cannot open keyboard {0}: {1}\n".format(keyboard, str(ex)))
+				return
+
+			self._keyboards.append(keyboard)
+			# Plugging in a keyboard is activity too
+			self._first_after_config = True
+		elif event.getAction() == udevmonitor.ACTION_RESCAN:
+			keyboards = list(self._configured)
+			if self._auto:
+				keyboards += [ keyboard for keyboard in self._findKeyboards() if keyboard not in keyboards ]
+
+			if any([ keyboard not in self._keyboards for keyboard in keyboards ]):
+				self._first_after_config = True
+
+			err_value = self._setKeyboards(keyboards)
+			if err_value and self._log:
+				self._log.log(self, "Cannot open all {0}: {1}\n".format(self.CONFIG_ITEM_KEYBOARDS, err_value))
+		else:
+			return
+
+		if self._log:
+			self._log.log(self, "Device event {0}: keyboards={1}\n".format(event, self._keyboards))
 
 	def loadConfig(self, config):
-		self._config = config
 		err_value = ""
 
 		try:
 			section = config[self.CONFIG_NAME]
 		except KeyError as e:
 			section = None
-			err_value = e
+			err_value = str(e) + "; "
 			s_keyboards = None
 
 		if section:
@@ -99,41 +158,33 @@ class KeyboardCheck(BaseCheck):
 		else:
 			s_keyboards = None
 
+		self._configured = []
+		self._auto = False
 		keyboards = []
 		if s_keyboards:
 			a_keyboards = s_keyboards.split(",")
 			for s_keyboard in a_keyboards:
 				s_keyboard = s_keyboard.strip()
 				if s_keyboard == "auto":
+					self._auto = True
 					a_keyboard = self._findKeyboards()
 				else:
+					self._configured.append(s_keyboard)
 					a_keyboard = [ s_keyboard ]
 
 				for keyboard in a_keyboard:
 					if not keyboard in keyboards:
 						keyboards.append(keyboard)
 
-		if len(keyboards) > 0:
+		if self._auto or len(self._configured) > 0:
 			self._enable()
 
 			if self._newKeyboardsFound(keyboards):
 				self._first_after_config = True
-
-				for f in self._files:
-					try:
-						f.close()
-					except:
-						pass
-
-				self._keyboards = keyboards
-				self._files = []
-
-				for keyboard in keyboards:
-					input_path = "/dev/input/{0}".format(keyboard)
-					f = open(input_path, "rb")
-					self._files.append(f)
+				err_value += self._setKeyboards(keyboards)
 		else:
 			self._disable()
+			self._setKeyboards([])
 
 		if self._debug:
 			self._debug.log(self._debug.TYPE_CONFIG, self, self.CONFIG_ITEM_KEYBOARDS,\
@@ -143,22 +194,10 @@ class KeyboardCheck(BaseCheck):
 			self._log.log(self, "Config loaded: enabled={0}; trigger_alive={2}; keyboards={1}\n".format(self.isEnabled(), keyboards, self._first_after_config))
 
 	def _findKeyboards(self):
-		keyboards = []
-		sys_path = "/sys/class/input"
-		for event in os.listdir(sys_path):
-			event_path = os.path.join(sys_path, event)
-			device_path = os.path.join(event_path, "device")
-			if os.path.exists(device_path):
-				name_path = os.path.join(device_path, "name")
-				if os.path.exists(name_path):
-					with open(name_path, "r") as name_file:
-						name = name_file.read().lower()
-
-					if "keyboard" in name or "keyboard" in name_path:
-						keyboards.append(event)
-
-		return keyboards
+		return self._inputdevices.find([ inputdevices.TYPE_KEYBOARD ])
 
+	def _isKeyboard(self, event):
+		return not self._inputdevices.classify(event).isdisjoint([ inputdevices.TYPE_KEYBOARD ])
 
 	def _newKeyboardsFound(self, newKeyboards):
 		for keyboard in self._keyboards:
@@ -174,4 +213,3 @@ class KeyboardCheck(BaseCheck):
 
 def createInstance(data_dict):
 	return KeyboardCheck(data_dict)
-
@@ -10,6 +10,15 @@
 #
 # This way you can implement a sort of "kick" mechanism, where the creation of a file from the list is a kick.
 #
+# The field \e directories contains a list of kick directories: any file created in them is a kick.
+#
+# With the field \e mode set to \e inotify (the default), the parent directories of the files and the kick
+# directories are watched with inotify. The kicks are recorded with their time when they happen and
+# consumed by the next round, so the idle time starts at the kick itself. With \e poll, the files are
+# checked each round. When inotify is not available or a directory cannot be watched, its files are polled.
+# A directory which cannot be watched, or which was removed, is watched again as soon as it exists.
+# Directories created in the watched directories are not kicks.
+#
 # \author Philip Luyckx
 # \copyright GNU Public License
 
@@ -29,28 +38,69 @@
 # along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import time
+from threading import Lock
 
 from kam.modules.plugins.checks.basecheck import BaseCheck
+import kam.utils.inotify as inotify
 
 class KickCheck(BaseCheck):
 	CONFIG_NAME = "kick"
 	CONFIG_ITEM_FILES = "files"
+	CONFIG_ITEM_DIRECTORIES = "directories"
+	CONFIG_ITEM_MODE = "mode"
+
+	## \brief Watch the directories with inotify
+	MODE_INOTIFY = "inotify"
+	## \brief Check the files each round
+	MODE_POLL = "poll"
+
+	WATCH_MASK = inotify.IN_CREATE | inotify.IN_MOVED_TO | inotify.IN_ONLYDIR
 
 	def __init__(self, data_dict):
 		super().__init__()
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
+		self._pollmanager = data_dict["pollmanager"]
+
+		self._files = []
+		self._directories = []
+		self._inotify = None
+
+		# Shared with the thread of the pollmanager
+		self._lock = Lock()
+		self._watches = {}
+		self._kicks = {}
+		self._overflow = False
+		# The directories which should be watched
+		self._watch_directories = set()
 
 	def _run(self):
-		alive = []
+		with self._lock:
+			kicks = self._kicks
+			self._kicks = {}
+			watched = set(self._watches.values())
+			poll_all = self._overflow or self._inotify is None
+			self._overflow = False
 
-		for f in self._files:
-			if os.path.exists(f):
-				alive.append(f)
-				os.remove(f)
+		self._rewatch()
+
+		# Poll the files of the directories which are not watched
+		now = time.monotonic()
+		for path in self._poll([ f for f in self._files if poll_all or os.path.dirname(f) not in watched ],\
+		                       [ d for d in self._directories if poll_all or d not in watched ]):
+			kicks.setdefault(path, now)
+
+		alive = []
+		for path in kicks:
+			alive.append(path)
+			try:
+				os.remove(path)
+			except OSError:
+				pass # it is removed already, the kick still counts
 
 		if len(alive) > 0:
-			self._alive()
+			self._alive(max(kicks.values()))
 		else:
 			self._dead()
 
@@ -58,46 +108,173 @@ class KickCheck(BaseCheck):
 			self._debug.log(self._debug.TYPE_CHECK, self,\
 			                self.CONFIG_ITEM_FILES, alive, "", "")
 
+	## \brief Get the kick files which exist
+	def _poll(self, files, directories):
+		found = []
+
+		for f in files:
+			if os.path.exists(f):
+				found.append(f)
+
+		for directory in directories:
+			try:
+				with os.scandir(directory) as entries:
+					for entry in entries:
+						if not entry.is_dir(follow_symlinks=False):
+							found.append(entry.path)
+			except OSError:
+				pass
+
+		return found
+
+	## \brief Record the kicks, called by the pollmanager when inotify has events
+	def _onInotify(self, fd, events):
+		now = time.monotonic()
+		files = self._file_set
+
+		with self._lock:
+			for (wd, mask, name) in self._inotify.events():
+				if mask & inotify.IN_Q_OVERFLOW:
+					# Events are lost, poll all files in the next round
+					self._overflow = True
+					continue
+
+				directory = self._watches.get(wd)
+				if directory is None:
+					continue
+
+				if mask & inotify.IN_IGNORED:
+					# The directory is removed, its files are polled until it is watched again
+					del self._watches[wd]
+					continue
+
+				if mask & inotify.IN_ISDIR:
+					continue # a new subdirectory is not a kick
+
+				path = os.path.join(directory, name)
+				if directory in self._directories or path in files:
+					self._kicks.setdefault(path, now)
+
+	## \brief Watch the directories again which were removed or could not be watched
+	#
+	# The files of these directories are still polled in this round, so kicks before the watch are not lost.
+	def _rewatch(self):
+		if self._inotify is None:
+			return
+
+		with self._lock:
+			unwatched = self._watch_directories - set(self._watches.values())
+
+		for directory in unwatched:
+			try:
+				wd = self._inotify.addWatch(directory, self.WATCH_MASK)
+			except OSError:
+				continue # it does not exist (yet), try again next round
+
+			with self._lock:
+				self._watches[wd] = directory
+			if self._log:
+				self._log.log(self, "Watching {0} again\n".format(directory))
+
+	## \brief Watch the directories with inotify
+	#
+	# \return An error string, empty when everything is watched
+	def _watch(self):
+		err_value = ""
+
+		if self._inotify:
+			self._pollmanager.unregister(self._inotify)
+			self._inotify.close()
+			self._inotify = None
+
+		with self._lock:
+			self._watches = {}
+			self._kicks = {}
+			# Files which exist now are kicks which happened before the watches were added
+			self._overflow = True
+
+		if self._mode != self.MODE_INOTIFY or (len(self._files) == 0 and len(self._directories) == 0):
+			return err_value
+
+		try:
+			self._inotify = inotify.Inotify()
+		except OSError as ex:
+			return "inotify is not available ({0}), falling back to mode {1}; ".format(str(ex), self.MODE_POLL)
+
+		watches = {}
+		self._watch_directories = set([ os.path.dirname(f) for f in self._files ] + self._directories)
+		for directory in self._watch_directories:
+			try:
+				watches[self._inotify.addWatch(directory, self.WATCH_MASK)] = directory
+			except OSError as ex:
+				err_value += "Cannot watch {0} ({1}), polling it; ".format(directory, str(ex))
+
+		with self._lock:
+			self._watches = watches
+
+		self._pollmanager.register(self._inotify, self._onInotify)
+		return err_value
+
 	def loadConfig(self, config):
 		self._files = []
+		self._directories = []
+		self._mode = self.MODE_INOTIFY
 		err_value = ""
 
 		try:
 			section = config[self.CONFIG_NAME]
 		except KeyError as e:
 			section = None
-			err_value = str(e)
+			err_value = str(e) + "; "
 		
 		if section:
-			files = section.get(self.CONFIG_ITEM_FILES).strip()
+			files = section.get(self.CONFIG_ITEM_FILES, "").strip()
+			directories = section.get(self.CONFIG_ITEM_DIRECTORIES, "").strip()
+			self._mode = section.get(self.CONFIG_ITEM_MODE, self.MODE_INOTIFY).strip()
 		else:
 			files = None
+			directories = None
 
 		if files:
 			files = files.split(",")
 			for f in files:
-				self._files.append(f.strip())
+				self._files.append(os.path.abspath(f.strip()))
+
+		if directories:
+			for directory in directories.split(","):
+				self._directories.append(os.path.abspath(directory.strip()))
+
+		if self._mode not in [ self.MODE_INOTIFY, self.MODE_POLL ]:
+			err_value += "Unknown mode {0}, using {1}; ".format(self._mode, self.MODE_INOTIFY)
+			self._mode = self.MODE_INOTIFY
+
+		self._file_set = set(self._files)
+		err_value += self._watch()
 
-		if len(self._files) > 0:
+		if len(self._files) > 0 or len(self._directories) > 0:
 			self._enable()
 		else:
 			self._disable()
 
 		if self._log:
 			self._log.log(self,\
-			              "Config loaded, enabled={0}; files specified: {1}\n"\
-			                .format(self.isEnabled(), self._files))
+			              "Config loaded, enabled={0}; files specified: {1}; directories: {2}; mode={3}; {4}\n"\
+			                .format(self.isEnabled(), self._files, self._directories,\
+			                        self.MODE_INOTIFY if self._inotify else self.MODE_POLL, err_value))
 		
 		if self._debug:
-                        self._debug.log(self._debug.TYPE_CONFIG, self,\
+			self._debug.log(self._debug.TYPE_CONFIG, self,\
 			                self.CONFIG_ITEM_FILES, self._files,\
 			                err_value, self.isEnabled())
+			self._debug.log(self._debug.TYPE_CONFIG, self,\
+			                self.CONFIG_ITEM_DIRECTORIES, self._directories,\
+			                "", self.isEnabled())
 
 
 ## \brief Create an instance of this class
 #
 # \public
-# \param data_dict This dictionary must contain the keys "log" and "config" and optionally "debug". They contain an object of the type Log, configparser and Debug respectively.
+# \param data_dict This dictionary must contain the keys "log", "pollmanager" and "config" and optionally "debug". They contain an object of the type Log, PollManager, configparser and Debug respectively.
 # \return An object of the type KickCheck
 def createInstance(data_dict):
 	return KickCheck(data_dict)
@@ -0,0 +1,397 @@
+##\package lease
+# \brief This plugin keeps the machine alive while applications hold a lease.
+#
+# In the config file you can create a section [lease] with the field \e socket, the path of a Unix socket.
+# Applications connect to this socket and send commands, one on each line:
+# - \e ACQUIRE ttl [label]: acquire a new lease, the answer is "OK id ttl"
+# - \e RENEW id ttl: extend a lease, the answer is "OK id ttl"
+# - \e RELEASE id: release a lease, the answer is "OK id"
+# - \e LIST: the answer is a line "LEASE id ttl label" for each lease, followed by "END"
+#
+# The ttl is a number of seconds, or a number followed by s, m or h. A lease never lives longer than
+# \e max_ttl minutes. When a command fails, the answer is "ERR message".
+# Only the user who acquired a lease, or root, can renew or release it.
+# The socket is owned by root and the group \e group, with the permissions \e permissions (default 660).
+# As long as one lease did not expire or was not released, the machine is kept alive.
+#
+# The leases are kept in a heap on their expiry time, so each round only looks at the leases which expired.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import grp
+import heapq
+import math
+import os
+import socket
+import struct
+import time
+from threading import Lock
+
+from kam.modules.plugins.checks.basecheck import BaseCheck
+
+## \brief The longest command line a client may send
+MAX_LINE = 1024
+
+_TTL_UNITS = { "s": 1, "m": 60, "h": 3600 }
+_PEERCRED = struct.Struct("=iII")
+
+## \brief Parse a ttl: a number of seconds, or a number followed by s, m or h
+#
+# \throws ValueError when the ttl cannot be parsed or is not positive
+def parseTtl(value):
+	unit = 1
+	if len(value) > 0 and value[-1].lower() in _TTL_UNITS:
+		unit = _TTL_UNITS[value[-1].lower()]
+		value = value[:-1]
+
+	ttl = float(value) * unit
+	if not math.isfinite(ttl) or ttl <= 0:
+		raise ValueError("The ttl must be a number larger than 0")
+
+	return ttl
+
+class Lease:
+	__slots__ = ("_id", "_label", "_expires", "_uid")
+
+	def __init__(self, lease_id, label, expires, uid):
+		self._id = lease_id
+		self._label = label
+		self._expires = expires
+		self._uid = uid
+
+	def getId(self):
+		return self._id
+
+	def getLabel(self):
+		return self._label
+
+	## \brief The time the lease expires, from time.monotonic()
+	def getExpires(self):
+		return self._expires
+
+	## \brief The uid of the process which acquired the lease, -1 when unknown
+	def getUid(self):
+		return self._uid
+
+	def __str__(self):
+		return "{0} ({1})".format(self._label, self._id)
+
+	def __repr__(self):
+		return str(self)
+
+class LeaseCheck(BaseCheck):
+	CONFIG_NAME = "lease"
+	CONFIG_ITEM_SOCKET = "socket"
+	CONFIG_ITEM_PERMISSIONS = "permissions"
+	CONFIG_ITEM_GROUP = "group"
+	CONFIG_ITEM_MAX_TTL = "max_ttl"
+
+	def __init__(self, data_dict):
+		super().__init__()
+		self._debug = data_dict["debug"]
+		self._log = data_dict["log"]
+		self._pollmanager = data_dict["pollmanager"]
+
+		self._server = None
+		self._path = None
+		self._max_ttl = 24 * 3600
+
+		# Shared with the thread of the pollmanager
+		self._lock = Lock()
+		self._clients = {}
+		self._leases = {}
+		self._heap = []
+		self._next_id = 1
+		self._pending_log = []
+
+	def _run(self):
+		now = time.monotonic()
+		expired = []
+
+		with self._lock:
+			heap = self._heap
+			while len(heap) > 0 and heap[0][0] <= now:
+				(expires, lease_id) = heapq.heappop(heap)
+				lease = self._leases.get(lease_id)
+				# A renewed or released lease leaves an old entry in the heap, skip it
+				if lease is not None and lease.getExpires() == expires:
+					del self._leases[lease_id]
+					expired.append(lease)
+
+			leases = list(self._leases.values())
+
+		if self._log:
+			for lease in expired:
+				self._log.log(self, "Lease {0} expired\n".format(lease))
+
+		if len(leases) > 0:
+			self._alive()
+		else:
+			self._dead()
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_CHECK, self,\
+			                "leases", leases, "", "expired={0}".format(expired))
+
+	## \brief Execute one command of a client
+	#
+	# Call this function with the lock held.
+	# \return The answer, without the last newline
+	def _execute(self, line, uid):
+		args = line.split(None, 2)
+		if len(args) == 0:
+			return "ERR empty command"
+
+		command = args[0].upper()
+		now = time.monotonic()
+
+		try:
+			if command == "ACQUIRE" and len(args) >= 2:
+				ttl = min(parseTtl(args[1]), self._max_ttl)
+				lease = Lease(self._next_id, args[2] if len(args) > 2 else "", now + ttl, uid)
+				self._next_id += 1
+				self._addLease(lease)
+				self._logLater("Lease {0} acquired by uid {1} for {2:.0f} seconds\n".format(lease, uid, ttl))
+				return "OK {0} {1:.0f}".format(lease.getId(), ttl)
+			elif command == "RENEW" and len(args) == 3:
+				lease = self._leases.get(int(args[1]))
+				if lease is None:
+					return "ERR unknown lease {0}".format(args[1])
+				if not self._mayChange(lease, uid):
+					return "ERR lease {0} is not yours".format(args[1])
+
+				ttl = min(parseTtl(args[2]), self._max_ttl)
+				self._addLease(Lease(lease.getId(), lease.getLabel(), now + ttl, lease.getUid()))
+				return "OK {0} {1:.0f}".format(lease.getId(), ttl)
+			elif command == "RELEASE" and len(args) == 2:
+				lease = self._leases.get(int(args[1]))
+				if lease is None:
+					return "ERR unknown lease {0}".format(args[1])
+				if not self._mayChange(lease, uid):
+					return "ERR lease {0} is not yours".format(args[1])
+
+				del self._leases[lease.getId()]
+
+				self._logLater("Lease {0} released\n".format(lease))
+				return "OK {0}".format(lease.getId())
+			elif command == "LIST" and len(args) == 1:
+				lines = [ "LEASE {0} {1:.0f} {2}".format(lease.getId(), lease.getExpires() - now, lease.getLabel())\
+				          for lease in sorted(self._leases.values(), key=lambda lease: lease.getId()) ]
+				return "\n".join(lines + [ "END" ])
+			else:
+				return "ERR unknown command or wrong arguments: {0}".format(line)
+		except ValueError as ex:
+			return "ERR {0}".format(str(ex))
+
+	## \brief Check if a client may renew or release a lease: root, or the user who acquired it
+	def _mayChange(self, lease, uid):
+		return uid == 0 or (uid >= 0 and uid == lease.getUid())
+
+	def _addLease(self, lease):
+		self._leases[lease.getId()] = lease
+		heapq.heappush(self._heap, (lease.getExpires(), lease.getId()))
+
+		# Drop the old entries of renewed and released leases when they are the majority
+		if len(self._heap) > 2 * len(self._leases) + 64:
+			self._heap = [ (lease.getExpires(), lease.getId()) for lease in self._leases.values() ]
+			heapq.heapify(self._heap)
+
+	def _logLater(self, msg):
+		self._pending_log.append(msg)
+
+	## \brief Accept a new client, called by the pollmanager
+	def _onAccept(self, fd, events):
+		while True:
+			try:
+				(client, _) = self._server.accept()
+			except BlockingIOError:
+				return
+			except OSError as ex:
+				if self._log:
+					self._log.log(self, "Accepting a client failed: {0}\n".format(str(ex)))
+				return
+
+			client.setblocking(False)
+			try:
+				(_, uid, _) = _PEERCRED.unpack(client.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _PEERCRED.size))
+			except OSError:
+				uid = -1
+
+			with self._lock:
+				self._clients[client.fileno()] = (client, bytearray(), uid)
+			self._pollmanager.register(client, self._onClient)
+
+	## \brief Read and execute the commands of a client, called by the pollmanager
+	def _onClient(self, fd, events):
+		with self._lock:
+			entry = self._clients.get(fd)
+		if entry is None:
+			return
+
+		(client, buf, uid) = entry
+		closed = False
+		try:
+			while True:
+				data = client.recv(4096)
+				if not data:
+					closed = True
+					break
+				buf.extend(data)
+		except BlockingIOError:
+			pass
+		except OSError:
+			closed = True
+
+		answers = []
+		self._pending_log = []
+		with self._lock:
+			while True:
+				end = buf.find(b"\n")
+				if end < 0:
+					break
+
+				line = bytes(buf[:end]).decode("utf-8", "replace").strip()
+				del buf[:end + 1]
+				answers.append(self._execute(line, uid))
+
+		if len(buf) > MAX_LINE:
+			answers.append("ERR line too long")
+			closed = True
+
+		try:
+			if len(answers) > 0:
+				# The answers are short, they fit in the socket buffer of a client which reads them
+				client.sendall(("\n".join(answers) + "\n").encode())
+		except OSError:
+			closed = True
+
+		if self._log:
+			for msg in self._pending_log:
+				self._log.log(self, msg)
+
+		if closed:
+			self._closeClient(fd)
+
+	def _closeClient(self, fd):
+		with self._lock:
+			entry = self._clients.pop(fd, None)
+
+		if entry is not None:
+			self._pollmanager.unregister(fd)
+			entry[0].close()
+
+	## \brief Stop listening and disconnect all clients. The leases are kept.
+	def _close(self):
+		for fd in list(self._clients):
+			self._closeClient(fd)
+
+		if self._server:
+			self._pollmanager.unregister(self._server)
+			self._server.close()
+			self._server = None
+
+			try:
+				os.unlink(self._path)
+			except OSError:
+				pass
+
+	## \brief Listen on the socket
+	#
+	# \return An error string, empty when the socket is listening
+	# \param gid The group of the socket, -1 to keep the group of kamd
+	def _listen(self, path, permissions, gid):
+		self._path = path
+
+		try:
+			os.makedirs(os.path.dirname(path), exist_ok=True)
+			try:
+				os.unlink(path) # left behind by a previous run
+			except FileNotFoundError:
+				pass
+
+			server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM | socket.SOCK_CLOEXEC | socket.SOCK_NONBLOCK)
+			try:
+				server.bind(path)
+				os.chown(path, -1, gid)
+				os.chmod(path, permissions)
+				server.listen(16)
+			except:
+				server.close()
+				raise
+		except OSError as ex:
+			return "Cannot listen on {0}: {1}; ".format(path, str(ex))
+
+		self._server = server
+		self._pollmanager.register(server, self._onAccept)
+		return ""
+
+	def loadConfig(self, config):
+		err_value = ""
+		path = None
+		permissions = 0o660
+		group = None
+		gid = -1
+		self._max_ttl = 24 * 3600
+
+		try:
+			section = config[self.CONFIG_NAME]
+		except KeyError as e:
+			section = None
+			err_value = str(e) + "; "
+
+		if section:
+			path = section.get(self.CONFIG_ITEM_SOCKET, "").strip()
+			try:
+				permissions = int(section.get(self.CONFIG_ITEM_PERMISSIONS, "660"), 8)
+				self._max_ttl = int(section.get(self.CONFIG_ITEM_MAX_TTL, "1440")) * 60
+			except ValueError as ex:
+				err_value += str(ex) + "; "
+
+			group = section.get(self.CONFIG_ITEM_GROUP, "").strip()
+			if group:
+				try:
+					gid = int(group) if group.isdigit() else grp.getgrnam(group).gr_gid
+				except KeyError:
+					err_value += "Unknown group {0}; ".format(group)
+
+		self._close()
+		if path:
+			err_value += self._listen(path, permissions, gid)
+
+		if self._server:
+			self._enable()
+		else:
+			self._disable()
+
+		if self._log:
+			self._log.log(self, "Config loaded, enabled={0}; socket={1}; permissions={2:o}; group={3}; max_ttl={4}; {5}\n".format(\
+			              self.isEnabled(), path, permissions, group, self._max_ttl, err_value))
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_CONFIG, self,\
+			                self.CONFIG_ITEM_SOCKET, path,\
+			                err_value, self.isEnabled())
+
+## \brief Create an instance of this class
+#
+# \public
+# \param data_dict This dictionary must contain the keys "log", "debug" and "pollmanager".
+# \return An object of the type LeaseCheck
+def createInstance(data_dict):
+	return LeaseCheck(data_dict)
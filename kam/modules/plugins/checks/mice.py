@@ -26,47 +26,49 @@
 # along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
 
 from kam.modules.plugins.checks.basecheck import BaseCheck
-from threading import Lock
+import kam.utils.udevmonitor as udevmonitor
+import kam.utils.inputdevices as inputdevices
 
 import os
+import time
 
 class MiceCheck(BaseCheck):
 	CONFIG_NAME = "mouse"
 	CONFIG_ITEM_MICE = "mice"
 
+	INPUT_PATH = "/dev/input"
+
 	def __init__(self, data_dict):
 		super().__init__()
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
-		self._pollmanager = data_dict["pollmanager"]
-		self._files = []
+		self._inputtracker = data_dict["inputtracker"]
+		self._inputdevices = data_dict["inputdevices"]
 		self._mice = []
+		self._configured = []
+		self._auto = False
 		self._first_after_config = False
 
+		self._last_run = time.monotonic()
+
 		self._udevmonitor = data_dict["udevmonitor"]
-		self._udevmonitor.addCallback(self._udev_event)
+		self._udevmonitor.addListener(self._udev_event)
 
 	def _run(self):
 		read_from = []
+		last_activity = None
 
-		for f in self._files:
-			try: # There is a change the file does not exist anymore!
-				if self._pollmanager.hasInput(f.fileno()):
-					self._flush_input(f)
-					read_from.append(f.name)
-			except:
-				if not os.path.exists(f.name):
-					try:
-						f.close()
-					except:
-						# TODO: propably this is not necessary, check if we should close a file that does not exist anymore.
-						pass
-
-				self._files.remove(f)
+		for mouse in self._mice:
+			activity = self._inputtracker.lastActivity(self._path(mouse))
+			if activity is not None and activity > self._last_run:
+				read_from.append(mouse)
+				last_activity = activity if last_activity is None else max(activity, last_activity)
+
+		self._last_run = time.monotonic()
 
 		if len(read_from) > 0 or self._first_after_config:
 			self._first_after_config = False
-			self._alive()
+			self._alive(last_activity)
 		else:
 			self._dead()
 
@@ -74,24 +76,81 @@ class MiceCheck(BaseCheck):
 			self._debug.log(self._debug.TYPE_CHECK, self, "read from: ", read_from, "", super().isAlive())
 
 
-	def _flush_input(self, f):
-		while self._pollmanager.hasInput(f.fileno()):
-			_ = f.read1(100)
+	def _path(self, mouse):
+		return os.path.join(self.INPUT_PATH, mouse)
+
+	## \brief Track the new mice and stop tracking the old ones
+	#
+	# \return The errors as a string
+	def _setMice(self, mice):
+		err_value = ""
+		tracked = []
 
-	def _udev_event(self):
-		self.loadConfig(self._config)
+		# Track the new mice first, so a mouse in both lists keeps its state
+		for mouse in mice:
+			try:
+				self._inputtracker.track(self._path(mouse))
+				tracked.append(mouse)
+			except OSError as ex:
+				err_value += str(ex) + "; "
 
+		for mouse in self._mice:
+			self._inputtracker.untrack(self._path(mouse))
 
-	def loadConfig(self, config):
-		self._config = config
+		self._mice = tracked
+		return err_value
+
+	## \brief Open or close a single mouse when an input device is plugged in or unplugged
+	#
+	# When device events were lost, all mice are found again.
+	def _udev_event(self, event):
+		mouse = event.getName()
+
+		if event.getAction() == udevmonitor.ACTION_REMOVE:
+			if mouse not in self._mice:
+				return
+
+			self._mice.remove(mouse)
+			self._inputtracker.untrack(self._path(mouse))
+		elif event.getAction() == udevmonitor.ACTION_ADD:
+			if mouse in self._mice or not (mouse in self._configured or (self._auto and self._isMouse(mouse))):
+				return
+
+			try:
+				self._inputtracker.track(self._path(mouse))
+			except OSError as ex:
+				if self._log:
+					self._log.log(self, "Cannot open mouse {0}: {1}\n".format(mouse, str(ex)))
+				return
+
+			self._mice.append(mouse)
+			# Plugging in a mouse is activity too
+			self._first_after_config = True
+		elif event.getAction() == udevmonitor.ACTION_RESCAN:
+			mice = list(self._configured)
+			if self._auto:
+				mice += [ mouse for mouse in self._findMice() if mouse not in mice ]
+
+			if any([ mouse not in self._mice for mouse in mice ]):
+				self._first_after_config = True
+
+			err_value = self._setMice(mice)
+			if err_value and self._log:
+				self._log.log(self, "Cannot open all {0}: {1}\n".format(self.CONFIG_ITEM_MICE, err_value))
+		else:
+			return
+
+		if self._log:
+			self._log.log(self, "Device event {0}: mice={1}\n".format(event, self._mice))
 
+	def loadConfig(self, config):
 		err_value = ""
 
 		try:
 			section = config[self.CONFIG_NAME]
 		except KeyError as e:
 			section = None
-			err_value = e
+			err_value = str(e) + "; "
 			s_mice = None
 
 		if section:
@@ -99,41 +158,33 @@ class MiceCheck(BaseCheck):
 		else:
 			s_mice = None
 
+		self._configured = []
+		self._auto = False
 		mice = []
 		if s_mice:
 			a_mice = s_mice.split(",")
 			for s_mouse in a_mice:
 				s_mouse = s_mouse.strip()
 				if s_mouse == "auto":
+					self._auto = True
 					a_mouse = self._findMice()
 				else:
+					self._configured.append(s_mouse)
 					a_mouse = [ s_mouse ]
 
 				for mouse in a_mouse:
 					if not mouse in mice:
 						mice.append(mouse)
 
-		if len(mice) > 0:
+		if self._auto or len(self._configured) > 0:
 			self._enable()
 
 			if self._newMiceFound(mice):
 				self._first_after_config = True
-					
-				for f in self._files:
-					try:
-						f.close()
-					except:
-						pass
-
-				self._mice = mice
-				self._files = []
-
-				for mouse in mice:
-					input_path = "/dev/input/{0}".format(mouse)
-					f = open(input_path, "rb")
-					self._files.append(f)
+				err_value += self._setMice(mice)
 		else:
 			self._disable()
+			self._setMice([])
 
 		if self._debug:
 			self._debug.log(self._debug.TYPE_CONFIG, self, self.CONFIG_ITEM_MICE,\
@@ -143,21 +194,10 @@ class MiceCheck(BaseCheck):
 			self._log.log(self, "Config loaded: enabled={0}; trigger_alive={2}; mice={1}\n".format(self.isEnabled(), mice, self._first_after_config))
 
 	def _findMice(self):
-		mice = []
-		sys_path = "/sys/class/input"
-		for event in os.listdir(sys_path):
-			event_path = os.path.join(sys_path, event)
-			device_path = os.path.join(event_path, "device")
-			if os.path.exists(device_path):
-				name_path = os.path.join(device_path, "name")
-				if os.path.exists(name_path):
-					with open(name_path, "r") as name_file:
-						name = name_file.read().lower()
+		return self._inputdevices.find(inputdevices.POINTER_TYPES)
 
-					if "mouse" in name or "mice" in name or "mouse" in name_path or "mice" in name_path:
-						mice.append(event)
-
-		return mice
+	def _isMouse(self, event):
+		return not self._inputdevices.classify(event).isdisjoint(inputdevices.POINTER_TYPES)
 
 	def _newMiceFound(self, newMice):
 		for mouse in self._mice:
@@ -173,4 +213,3 @@ class MiceCheck(BaseCheck):
 
 def createInstance(data_dict):
 	return MiceCheck(data_dict)
-
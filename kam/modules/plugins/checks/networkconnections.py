@@ -3,8 +3,23 @@
 #
 # In the config file you can define a section [network] with the field connections.
 # This field contains a list of ip-addresses (a.b.c.d/32) or network ranges (a.b.c.d/n, n < 32) separated by commas.
+# IPv6 networks (for example fd00::/8) can be used too.
+# The field \e connections_file names a file with more networks, one on each line. Lines starting with # are comments.
 # If one connection is found within a range defined in the list, the machine is kept alive.
 #
+# The networks are compiled in a CidrIndex when the config is loaded, so the cost to check a connection
+# hardly depends on the amount of networks.
+#
+# The connections are read from the socket tables in /proc/net. The fields \e protocols and \e states
+# define which tables are read and which sockets are used.
+#
+# With the field \e backend set to \e diag, the TCP sockets are queried through netlink (inet_diag) instead.
+# The kernel filters the sockets on their state and on the configured networks, and reports the bytes
+# each socket sent and received. A connection only keeps the machine alive when it transferred at least
+# \e min_bytes (default 4K) since the previous round, so an idle session is not counted.
+# A new connection only counts from the round after it was first seen.
+# When the netlink socket cannot be used, the plugin falls back to /proc/net.
+#
 # \author Philip Luyckx
 # \copyright GNU Public License
 
@@ -25,37 +40,60 @@
 
 
 from kam.modules.plugins.checks.basecheck import BaseCheck
+import kam.utils.netsockets as netsockets
+import kam.utils.inetdiag as inetdiag
+import kam.utils.utils as utils
+from kam.utils.cidrindex import CidrIndex
 
-import re, subprocess
+import ipaddress
 
 class NetworkConnectionsCheck(BaseCheck):
 	CONFIG_NAME = "network"
+	MEASURES_RATE = True
 	CONFIG_ITEM_CONNECTIONS = "connections"
+	CONFIG_ITEM_CONNECTIONS_FILE = "connections_file"
+	CONFIG_ITEM_PROTOCOLS = "protocols"
+	CONFIG_ITEM_STATES = "states"
+	CONFIG_ITEM_BACKEND = "backend"
+	CONFIG_ITEM_MIN_BYTES = "min_bytes"
+
+	## \brief Read the socket tables in /proc/net
+	BACKEND_PROC = "proc"
+	## \brief Query the TCP sockets through netlink
+	BACKEND_DIAG = "diag"
+
+	## \brief A connection of the diag backend which transferred less since the previous round is idle
+	DEFAULT_MIN_BYTES = "4K"
 
 	def __init__(self, data_dict):
 		super().__init__()
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
 
+		self._diag = None
+		self._counters = {}
+
 	def _run(self):
-		netstat_out = subprocess.getoutput("netstat --inet -a | grep ESTABLISHED | awk '{print $5}'")
-		connections = netstat_out.split("\n")
+		connections = None
+		if self._diag:
+			try:
+				connections = self._activeConnections()
+			except OSError as ex:
+				if self._log:
+					self._log.log(self, "Cannot query the sockets ({0}), reading {1} instead\n".format(str(ex), netsockets.PROC_PATH))
 
-		for i in range(0, len(connections)):
-			connections[i] = connections[i][:connections[i].find(":")]
+		if connections is None:
+			connections = netsockets.readRemoteAddresses(self._protocols, self._state_filter)
 
 		alive = []
+		# Only look for all matching connections when they are written to the debug output
+		find_all = self._debug and self._debug.wants(self._debug.TYPE_CHECK, self)
 
-		for addr in self._addresses:
-			for connection in connections:
-				if addr.isIpInNetwork(connection):
-					self._alive()
-					alive.append((addr, connection))
-					if not self._debug:
-						break
-			
-			if not self._debug and len(alive) > 0:
-				break
+		for (version, connection) in connections:
+			if self._index.contains(version, connection):
+				alive.append((version, connection))
+				if not find_all:
+					break
 
 		if len(alive) == 0:
 			self._dead()
@@ -63,13 +101,78 @@ class NetworkConnectionsCheck(BaseCheck):
 			self._alive()
 
 		if self._debug:
-                        self._debug.log(self._debug.TYPE_CHECK, self,\
+			self._debug.log(self._debug.TYPE_CHECK, self,\
 			                self.CONFIG_ITEM_CONNECTIONS,\
-			                alive, "", self.isAlive())
+			                lambda: [ self._describe(version, connection) for (version, connection) in alive ], "", self.isAlive())
+
+	## \brief Get the TCP connections which transferred at least min_bytes since the previous round
+	#
+	# A connection which was not seen in the previous round is not active yet, its bytes are only the baseline
+	# of the next round. Otherwise a long idle session would count with all bytes it ever transferred.
+	# \return A list of tuples (version, address)
+	# \throws OSError when the sockets cannot be queried
+	def _activeConnections(self):
+		sockets = self._diag.query(self._protocols, self._state_mask, self._bytecode)
+
+		active = []
+		counters = {}
+		for sock in sockets:
+			if sock.bytes_acked is None:
+				# The kernel is too old to report the byte counters
+				active.append((sock.version, sock.address))
+				continue
+
+			total = sock.bytes_acked + sock.bytes_received
+			counters[sock.cookie] = total
+			previous = self._counters.get(sock.cookie)
+			if previous is not None and total - previous >= self._min_bytes:
+				active.append((sock.version, sock.address))
+
+		self._counters = counters
+		return active
+
+	## \brief Open the netlink socket when the diag backend is configured
+	#
+	# \return An error string, empty when the diag backend is opened or not configured
+	def _openDiag(self, backend, states):
+		if self._diag:
+			self._diag.close()
+			self._diag = None
+		self._counters = {}
+
+		if backend != self.BACKEND_DIAG:
+			return ""
+
+		try:
+			self._state_mask = inetdiag.stateMask(states)
+			networks = []
+			for version in (4, 6):
+				networks += ipaddress.collapse_addresses([ addr.getNetwork() for addr in self._addresses if addr.getVersion() == version ])
+			# When the filter is too large, the sockets are only filtered by the index in _run()
+			self._bytecode = inetdiag.compileFilter(networks)
+			self._diag = inetdiag.InetDiag()
+		except OSError as ex:
+			return "Cannot query the sockets ({0}), falling back to backend {1}; ".format(str(ex), self.BACKEND_PROC)
+
+		return ""
+
+	## \brief Find the configured network of a connection, only used for the debug output
+	def _describe(self, version, connection):
+		ip = ipaddress.IPv4Address(connection) if version == 4 else ipaddress.IPv6Address(connection)
+		for addr in self._addresses:
+			if addr.contains(version, connection):
+				return (addr, ip)
+
+		return (None, ip)
 
 
 	def loadConfig(self, config):
 		self._addresses = []
+		self._protocols = netsockets.PROTOCOLS
+		states = [ "ESTABLISHED" ]
+		self._state_filter = netsockets.stateFilter(states)
+		backend = self.BACKEND_PROC
+		self._min_bytes = utils.toSize(self.DEFAULT_MIN_BYTES)
 		err_value = ""
 
 		try:
@@ -82,27 +185,78 @@ class NetworkConnectionsCheck(BaseCheck):
 			addresses = section.get(self.CONFIG_ITEM_CONNECTIONS)
 
 			if addresses:
-				addresses = addresses.split(",")
-				for address in addresses:
-					try:
-						addr = NetworkAddress(address)
-						self._addresses.append(addr)
-					except Exception as ex:
-						log.log(str(ex) + "\n")
-						err_value += str(s) + "; "
-
-		if len(self._addresses) > 0:
+				err_value += self._addAddresses(addresses.split(","))
+
+			connections_file = section.get(self.CONFIG_ITEM_CONNECTIONS_FILE)
+			if connections_file:
+				try:
+					with open(connections_file.strip(), "r") as f:
+						lines = [ line.strip() for line in f ]
+					err_value += self._addAddresses([ line for line in lines if line and not line.startswith("#") ])
+				except OSError as ex:
+					if self._log:
+						self._log.log(self, str(ex) + "\n")
+					err_value += str(ex) + "; "
+
+			protocols = section.get(self.CONFIG_ITEM_PROTOCOLS)
+			if protocols:
+				self._protocols = []
+				for protocol in protocols.split(","):
+					protocol = protocol.strip()
+					if protocol in netsockets.PROTOCOLS:
+						self._protocols.append(protocol)
+					else:
+						err_value += "Unknown protocol {0}; ".format(protocol)
+
+			s_states = section.get(self.CONFIG_ITEM_STATES)
+			if s_states:
+				try:
+					self._state_filter = netsockets.stateFilter([ state.strip() for state in s_states.split(",") ])
+					states = s_states.split(",")
+				except KeyError as ex:
+					err_value += "Unknown state {0}; ".format(str(ex))
+
+			backend = section.get(self.CONFIG_ITEM_BACKEND, self.BACKEND_PROC).strip()
+			try:
+				self._min_bytes = utils.toSize(section.get(self.CONFIG_ITEM_MIN_BYTES, self.DEFAULT_MIN_BYTES))
+			except ValueError as ex:
+				err_value += str(ex) + "; "
+
+		self._index = CidrIndex([ addr.getRange() for addr in self._addresses ])
+		err_value += self._openDiag(backend, states)
+
+		if len(self._addresses) > 0 and len(self._protocols) > 0:
 			self._enable()
 		else:
 			self._disable()
 
 		if self._log:
-			self._log.log(self, "Config loaded: enabled={0}; addresses={1}\n".format(self.isEnabled(), self._addresses))
+			self._log.log(self, "Config loaded: enabled={0}; addresses={1}; ranges={2}; protocols={3}; backend={4}; {5}\n".format(\
+			              self.isEnabled(), len(self._addresses), self._index.rangeCount(4) + self._index.rangeCount(6), self._protocols,\
+			              self.BACKEND_DIAG if self._diag else self.BACKEND_PROC, err_value))
 
 		if self._debug:
-                        self._debug.log(self._debug.TYPE_CONFIG, self,\
+			self._debug.log(self._debug.TYPE_CONFIG, self,\
 			                self.CONFIG_ITEM_CONNECTIONS,\
 			                self._addresses, err_value, "")
+			self._debug.log(self._debug.TYPE_CONFIG, self, self.CONFIG_ITEM_BACKEND,\
+			                self.BACKEND_DIAG if self._diag else self.BACKEND_PROC, "", "min_bytes={0}".format(self._min_bytes))
+
+	## \brief Parse networks and add them to the list of addresses
+	#
+	# \param addresses A list of networks as strings
+	# \return The errors as a string
+	def _addAddresses(self, addresses):
+		err_value = ""
+		for address in addresses:
+			try:
+				self._addresses.append(NetworkAddress(address))
+			except Exception as ex:
+				if self._log:
+					self._log.log(self, str(ex) + "\n")
+				err_value += str(ex) + "; "
+
+		return err_value
 
 
 class NetworkAddress:
@@ -113,13 +267,15 @@ class NetworkAddress:
 		if slash_pos == -1:
 			raise ValueError("No slash found in network address! Format = a.b.c.d/subnet")
 
-		subnet = ip[slash_pos+1:]
+		network = ipaddress.ip_network(ip, strict=False)
 
 		self._s_ip = ip[:slash_pos]
-		self._ip = self._ipToInt(self._s_ip)
-		self._subnet = int(subnet)
-		self._netmask = 0xFFFFFFFF << (32 - self._subnet)
-		self._ip_masked = self._ip & self._netmask
+		self._version = network.version
+		self._ip = int(ipaddress.ip_address(self._s_ip))
+		self._subnet = network.prefixlen
+		self._netmask = int(network.netmask)
+		self._ip_masked = int(network.network_address)
+		self._network = network
 
 	def getIp(self):
 		return self._ip
@@ -130,18 +286,35 @@ class NetworkAddress:
 	def getNetmask(self):
 		return self._subnet
 
+	## \brief 4 for an IPv4 network, 6 for an IPv6 network
+	def getVersion(self):
+		return self._version
+
+	## \brief Check if an address, as an integer, is in this network
+	#
+	# \param version 4 or 6
+	# \param ip The address as an integer
+	def contains(self, version, ip):
+		return version == self._version and (ip & self._netmask) == self._ip_masked
+
+	## \brief The network as an ipaddress.IPv4Network or ipaddress.IPv6Network object
+	def getNetwork(self):
+		return self._network
+
+	## \brief The first and the last address of this network
+	#
+	# \return A tuple (version, first, last), the addresses as integers
+	def getRange(self):
+		bits = 32 if self._version == 4 else 128
+		return (self._version, self._ip_masked, self._ip_masked | (~self._netmask & ((1 << bits) - 1)))
+
 	def isIpInNetwork(self, s_ip):
-		ip = self._ipToInt(s_ip)
-		return (ip & self._netmask) == self._ip_masked
-		
-	def _ipToInt(self, ip):
-		pattern = "^([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})\.([0-9]{1,3})$"
-
-		match = re.search(pattern, ip)
-		if match:
-			return (int(match.group(1)) << 24) | (int(match.group(2)) << 16) | (int(match.group(3)) << 8) | int(match.group(4))
-		else:
-			return 0
+		try:
+			ip = ipaddress.ip_address(s_ip.strip())
+		except ValueError:
+			return False
+
+		return self.contains(ip.version, int(ip))
 
 	def __str__(self):
 		return "{0}/{1}".format(self._s_ip, self._subnet)
@@ -3,10 +3,17 @@
 #
 # In the config file you can define a section [network] with the fields upload_speed and download_speed.
 # They define thresholds and when more bandwidth is used, the machine is kept alive.
+# The fields upload_packets and download_packets do the same for the amount of packets per second.
 # This plugin calculates the bandwidth between two successive calls of check().
 # So the first check() is actually a calibration and if needed, you should ignore the value of isAlive().
 # Starting from the second call of check(), isAlive() contains a valid value.
 #
+# The counters are read from /proc/net/dev. The thresholds are compared with the sum of the interfaces
+# which match the glob patterns of \e interfaces and do not match the patterns of \e ignore_interfaces,
+# so traffic which passes a bridge or a veth of a container is not counted twice.
+# A threshold for one interface is defined by appending its name, for example upload_speed_eth0.
+# The rates can be smoothed with \e smoothing (none, ewma or window) over \e smoothing_window rounds.
+#
 # In the fields you can use the suffixes K and M.
 # 1K = 1024bytes, 1M = 1024 * 1024 bytes
 #
@@ -29,124 +36,190 @@
 # along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
 
 from kam.modules.plugins.checks.basecheck import BaseCheck
-import psutil
+from kam.utils.ratemeter import RateMeter
+import kam.utils.ratemeter as ratemeter
+import kam.utils.utils as utils
+
+import fnmatch
 import time
 
+## \brief The counters of an interface, in the order they are read from /proc/net/dev
+COUNTERS = [ "download_speed", "download_packets", "upload_speed", "upload_packets" ]
+
 class NetworkSpeedCheck(BaseCheck):
 	CONFIG_NAME = "network"
+	MEASURES_RATE = True
 	CONFIG_ITEM_UP_SPEED = "upload_speed"
 	CONFIG_ITEM_DOWN_SPEED = "download_speed"
+	CONFIG_ITEM_UP_PACKETS = "upload_packets"
+	CONFIG_ITEM_DOWN_PACKETS = "download_packets"
+	CONFIG_ITEM_INTERFACES = "interfaces"
+	CONFIG_ITEM_IGNORE_INTERFACES = "ignore_interfaces"
+	CONFIG_ITEM_SMOOTHING = "smoothing"
+	CONFIG_ITEM_SMOOTHING_WINDOW = "smoothing_window"
+
+	PROC_NET_DEV = "/proc/net/dev"
+
+	DEFAULT_INTERFACES = "*"
+	DEFAULT_IGNORE_INTERFACES = "lo, veth*, docker*, br-*, virbr*"
 
 	def __init__(self, data_dict):
 		super().__init__()
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
 
-		self._last_check = time.clock_gettime(time.CLOCK_MONOTONIC)
-		self._prev_down = 0
-		self._prev_up = 0
-
+		self._meter = RateMeter(len(COUNTERS))
+		self._included = {}
 
 	def _run(self):
-		network = psutil.net_io_counters(True)
-		network_dl = 0
-		network_up = 0
+		now = time.clock_gettime(time.CLOCK_MONOTONIC)
+		totals = [ 0.0 ] * len(COUNTERS)
+		interfaces = []
 
-		for k in network:
-			if k != "lo":
-				network_dl += network[k].bytes_recv
-				network_up += network[k].bytes_sent
+		for (name, values) in self._readCounters():
+			included = self._isIncluded(name)
+			thresholds = self._interface_thresholds.get(name)
+			if not included and thresholds is None:
+				continue
 
-		now = time.clock_gettime(time.CLOCK_MONOTONIC)
-		delta = now - self._last_check
+			rates = self._meter.update(name, values, now)
+			if rates is None:
+				continue # a new interface, it has no rate yet
+
+			if included:
+				for i in range(len(COUNTERS)):
+					totals[i] += rates[i]
 
-		dl = (network_dl - self._prev_down) / delta
-		up = (network_up - self._prev_up) / delta
+			interfaces.append((name, rates, thresholds is not None and self._exceeds(rates, thresholds)))
 
-		self._last_check = now
-		self._prev_down = network_dl
-		self._prev_up = network_up
+		self._meter.sweep()
 
-		if (self._down is not None and dl >= self._down) or \
-		   (self._up is not None and up >= self._up):
+		if self._exceeds(totals, self._thresholds) or any([ alive for (_, _, alive) in interfaces ]):
 			self._alive()
 		else:
 			self._dead()
 
 		if self._debug:
-			if self._up is not None:
-				self._debug.log(self._debug.TYPE_CHECK, self,\
-				                "upload_speed", up, "", up >= self._up)
-			if self._down is not None:
-				self._debug.log(self._debug.TYPE_CHECK, self,\
-				                "download_speed", dl, "", dl >= self._down)
+			for (i, counter) in enumerate(COUNTERS):
+				if self._thresholds[i] is not None:
+					self._debug.log(self._debug.TYPE_CHECK, self,\
+					                counter, totals[i], "", totals[i] >= self._thresholds[i])
+
+			if self._debug.wants(self._debug.TYPE_CHECK, self, self._debug.LEVEL_TRACE):
+				for (name, rates, alive) in interfaces:
+					self._debug.log(self._debug.TYPE_CHECK, self, name,\
+					                dict(zip(COUNTERS, rates)), "", alive, self._debug.LEVEL_TRACE)
+
+	## \brief Check if one of the rates reaches its threshold
+	def _exceeds(self, rates, thresholds):
+		for i in range(len(COUNTERS)):
+			if thresholds[i] is not None and rates[i] >= thresholds[i]:
+				return True
+
+		return False
+
+	## \brief Check if the interface is used for the totals, the result of the glob patterns is cached
+	def _isIncluded(self, name):
+		included = self._included.get(name)
+		if included is None:
+			included = any([ fnmatch.fnmatchcase(name, pattern) for pattern in self._interfaces ]) and\
+			           not any([ fnmatch.fnmatchcase(name, pattern) for pattern in self._ignore_interfaces ])
+			self._included[name] = included
+
+		return included
+
+	## \brief Read the counters of all interfaces
+	#
+	# \return A list of tuples (name, [ received bytes, received packets, sent bytes, sent packets ])
+	def _readCounters(self):
+		with open(self.PROC_NET_DEV, "rb") as f:
+			lines = f.read().splitlines()
+
+		counters = []
+		for line in lines[2:]:
+			(name, _, fields) = line.partition(b":")
+			fields = fields.split()
+			if len(fields) < 10:
+				continue
+
+			counters.append((name.strip().decode(), [ int(fields[0]), int(fields[1]), int(fields[8]), int(fields[9]) ]))
+
+		return counters
 
 	def loadConfig(self, config):
 		err_value = ""
-		err_up = ""
-		err_down = ""
+		self._thresholds = [ None ] * len(COUNTERS)
+		self._interface_thresholds = {}
+		self._included = {}
+		interfaces = self.DEFAULT_INTERFACES
+		ignore_interfaces = self.DEFAULT_IGNORE_INTERFACES
+		smoothing = ratemeter.SMOOTHING_NONE
+		window = 1
 
 		try:
 			section = config[self.CONFIG_NAME]
 		except KeyError as ex:
-			err_value = ex
+			err_value = str(ex) + "; "
 			section = None
 
 		if section:
-			down = self._convertToFloat(section.get(self.CONFIG_ITEM_DOWN_SPEED))
-			up = self._convertToFloat(section.get(self.CONFIG_ITEM_UP_SPEED))
+			for (key, value) in section.items():
+				for (i, counter) in enumerate(COUNTERS):
+					if key == counter:
+						name = None
+					elif key.startswith(counter + "_"):
+						name = key[len(counter) + 1:]
+					else:
+						continue
+
+					try:
+						threshold = float(utils.toSize(value)) if value.strip() else None
+					except ValueError as ex:
+						err_value += "{0}: {1}; ".format(key, str(ex))
+						continue
+
+					if name is None:
+						self._thresholds[i] = threshold
+					elif threshold is not None:
+						self._interface_thresholds.setdefault(name, [ None ] * len(COUNTERS))[i] = threshold
+
+			interfaces = section.get(self.CONFIG_ITEM_INTERFACES, interfaces)
+			ignore_interfaces = section.get(self.CONFIG_ITEM_IGNORE_INTERFACES, ignore_interfaces)
+			smoothing = section.get(self.CONFIG_ITEM_SMOOTHING, smoothing).strip()
+			try:
+				window = int(section.get(self.CONFIG_ITEM_SMOOTHING_WINDOW, "1"))
+			except ValueError as ex:
+				err_value += str(ex) + "; "
 
-		if isinstance(down, float):
-			self._down = down
-		else:
-			err_down = down
-			self._down = None
+		self._interfaces = [ pattern.strip() for pattern in interfaces.split(",") if pattern.strip() ]
+		self._ignore_interfaces = [ pattern.strip() for pattern in ignore_interfaces.split(",") if pattern.strip() ]
 
-		if isinstance(up, float):
-			self._up = up
-		else:
-			err_up = up
-			self._up = None
+		try:
+			self._meter = RateMeter(len(COUNTERS), smoothing, window)
+		except ValueError as ex:
+			err_value += str(ex) + "; "
+			smoothing = ratemeter.SMOOTHING_NONE
+			self._meter = RateMeter(len(COUNTERS))
 
-		if self._down != None or self._up != None:
+		if any([ threshold is not None for threshold in self._thresholds ]) or len(self._interface_thresholds) > 0:
 			self._enable()
 		else:
 			self._disable()
 
 		if self._debug:
-			self._debug.log(self._debug.TYPE_CONFIG, self, self.CONFIG_ITEM_DOWN_SPEED,\
-			                self._down, err_value + ";" + err_down, self.isEnabled() and self._down is not None)
-			self._debug.log(self._debug.TYPE_CONFIG, self, self.CONFIG_ITEM_UP_SPEED,\
-			                self._up, err_value + ";" + err_up, self.isEnabled() and self._up is not None)
-
+			for (i, counter) in enumerate(COUNTERS):
+				self._debug.log(self._debug.TYPE_CONFIG, self, counter,\
+				                self._thresholds[i], err_value, self.isEnabled() and self._thresholds[i] is not None)
+			for (name, thresholds) in self._interface_thresholds.items():
+				self._debug.log(self._debug.TYPE_CONFIG, self, name,\
+				                dict(zip(COUNTERS, thresholds)), "", self.isEnabled())
 
 		if self._log:
-			self._log.log(self, "Config file read.\nenabled = {0}\ndownload_speed = {1}\nupload_speed = {2}\n".format(self.isEnabled(), self._down, self._up))
-
-	def _convertToFloat(self, s):
-		if not s:
-			return "Parameter is \"{0}\"".format(s)
-
-		last_ch = s[len(s)-1]
-		if last_ch.isdigit():
-			try:
-				f = float(s)
-				return f
-			except ValueError as e:
-				return str(e)
-		else:
-			try:
-				value = float(s[:len(s)-1])
-			except ValueError as e:
-				return str(e)
-
-			if last_ch == 'K':
-				value *= 1024
-			elif last_ch == 'M':
-				value *= 1024 * 1024
-
-			return value
+			self._log.log(self, "Config file read.\nenabled = {0}\ndownload_speed = {1}\nupload_speed = {2}\n"\
+			                    "download_packets = {3}\nupload_packets = {4}\ninterfaces = {5}\nignore_interfaces = {6}\n"\
+			                    "per interface = {7}\nsmoothing = {8} ({9})\n{10}\n".format(\
+			              self.isEnabled(), self._thresholds[0], self._thresholds[2], self._thresholds[1], self._thresholds[3],\
+			              self._interfaces, self._ignore_interfaces, self._interface_thresholds, smoothing, window, err_value))
 
 def createInstance(data_dict):
 	return NetworkSpeedCheck(data_dict)
-
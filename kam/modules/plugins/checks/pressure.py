@@ -0,0 +1,182 @@
+##\package pressure
+# \brief This plugin checks the pressure stall information (PSI) and the run queue of the kernel.
+#
+# In the config file you can define a section [pressure].
+# The fields are named \e resource_kind_window, for example \e cpu_some_avg10:
+# - \e resource is cpu, io or memory
+# - \e kind is some (at least one task was stalled) or full (all tasks were stalled)
+# - \e window is avg10, avg60 or avg300, the average over the last 10, 60 or 300 seconds
+#
+# The value is a threshold in percent of the time tasks were stalled on the resource.
+# Unlike the processor load, this does not become smaller on machines with more cores:
+# one job which waits for its core is as visible on 64 cores as on 2 cores.
+#
+# The fields \e load1, \e load5 and \e load15 are thresholds for the load averages of /proc/loadavg
+# and \e running is a threshold for the amount of runnable tasks, kam itself included.
+# When one value reaches its threshold, the machine is kept alive.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from kam.modules.plugins.checks.basecheck import BaseCheck
+
+RESOURCES = [ "cpu", "io", "memory" ]
+KINDS = [ "some", "full" ]
+WINDOWS = [ "avg10", "avg60", "avg300" ]
+
+## \brief The fields of /proc/loadavg, in the order of the file
+LOADAVG = [ "load1", "load5", "load15", "running" ]
+
+class PressureCheck(BaseCheck):
+	CONFIG_NAME = "pressure"
+
+	PRESSURE_PATH = "/proc/pressure"
+	LOADAVG_PATH = "/proc/loadavg"
+
+	def __init__(self, data_dict):
+		super().__init__()
+		self._debug = data_dict["debug"]
+		self._log = data_dict["log"]
+
+		self._pressure = {}
+		self._loadavg = {}
+
+	def _run(self):
+		alive = []
+
+		for (resource, thresholds) in self._pressure.items():
+			try:
+				values = self._readPressure(resource)
+			except OSError:
+				continue
+
+			for (name, kind, window, threshold) in thresholds:
+				value = values.get((kind, window))
+				if value is not None and value >= threshold:
+					alive.append((name, value))
+
+		if len(self._loadavg) > 0:
+			values = self._readLoadavg()
+			for (name, threshold) in self._loadavg.items():
+				if values[name] >= threshold:
+					alive.append((name, values[name]))
+
+		if len(alive) > 0:
+			self._alive()
+		else:
+			self._dead()
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_CHECK, self,\
+			                self.CONFIG_NAME, alive, "", self.isAlive())
+
+	## \brief Read the averages of a resource
+	#
+	# \return A dictionary which maps (kind, window) to the percentage
+	# \throws OSError when the file cannot be read
+	def _readPressure(self, resource):
+		with open("{0}/{1}".format(self.PRESSURE_PATH, resource), "rb") as f:
+			lines = f.read().splitlines()
+
+		values = {}
+		for line in lines:
+			# some avg10=0.00 avg60=0.00 avg300=0.00 total=0
+			fields = line.split()
+			if len(fields) == 0:
+				continue
+
+			kind = fields[0].decode()
+			for field in fields[1:]:
+				(window, _, value) = field.partition(b"=")
+				values[(kind, window.decode())] = float(value)
+
+		return values
+
+	## \brief Read the load averages and the amount of runnable tasks
+	def _readLoadavg(self):
+		with open(self.LOADAVG_PATH, "rb") as f:
+			# 0.07 0.07 0.02 2/72 7886
+			fields = f.read().split()
+
+		return { "load1": float(fields[0]),\
+		         "load5": float(fields[1]),\
+		         "load15": float(fields[2]),\
+		         "running": int(fields[3].partition(b"/")[0]) }
+
+	def loadConfig(self, config):
+		self._pressure = {}
+		self._loadavg = {}
+		err_value = ""
+
+		try:
+			section = config[self.CONFIG_NAME]
+		except KeyError as e:
+			section = None
+			err_value = str(e) + "; "
+
+		if section:
+			for (key, value) in section.items():
+				if not value.strip() or key in self.RESERVED_CONFIG_ITEMS:
+					continue
+
+				try:
+					threshold = float(value)
+				except ValueError as ex:
+					err_value += "{0}: {1}; ".format(key, str(ex))
+					continue
+
+				parts = key.split("_")
+				if key in LOADAVG:
+					self._loadavg[key] = threshold
+				elif len(parts) == 3 and parts[0] in RESOURCES and parts[1] in KINDS and parts[2] in WINDOWS:
+					self._pressure.setdefault(parts[0], []).append((key, parts[1], parts[2], threshold))
+				else:
+					err_value += "Unknown field {0}; ".format(key)
+
+		for resource in list(self._pressure):
+			if not os.path.exists("{0}/{1}".format(self.PRESSURE_PATH, resource)):
+				# The kernel is too old or was booted with psi=0
+				err_value += "No pressure information for {0}; ".format(resource)
+				del self._pressure[resource]
+
+		if len(self._pressure) > 0 or len(self._loadavg) > 0:
+			self._enable()
+		else:
+			self._disable()
+
+		if self._log:
+			self._log.log(self,\
+			              "Config loaded, enabled={0}; pressure={1}; loadavg={2}; {3}\n"\
+			                .format(self.isEnabled(), self._pressure, self._loadavg, err_value))
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_CONFIG, self,\
+			                self.CONFIG_NAME, [ threshold for thresholds in self._pressure.values() for threshold in thresholds ],\
+			                err_value, self.isEnabled())
+			self._debug.log(self._debug.TYPE_CONFIG, self,\
+			                "loadavg", self._loadavg, "", self.isEnabled())
+
+## \brief Create an instance of this class
+#
+# \public
+# \param data_dict This dictionary must contain the keys "log" and "debug".
+# \return An object of the type PressureCheck
+def createInstance(data_dict):
+	return PressureCheck(data_dict)
@@ -10,6 +10,15 @@
 # When connected, two more <em>ssh deamons</em> are started for each connection.
 # So to keep the machine alive when connected through \e ssh, you should use: <em>min_sshd = 2</em>
 #
+# By default a process matches when its name starts with the name in the list. For each process in the list
+# you can instead define the fields comm_{process_name}, cmdline_{process_name}, exe_{process_name} and
+# user_{process_name}. A process matches when it matches all of them, see procmatch for the patterns.
+#
+# With the field \e backend set to \e events, the plugin does not scan all processes each round.
+# It follows the fork, exec and exit events of the kernel and keeps the counts up to date.
+# Each \e reconcile minutes, all processes are scanned to correct events which were missed.
+# When the events cannot be received, the plugin falls back to scanning each round.
+#
 # \author Philip Luyckx
 # \copyright GNU Public License
 
@@ -29,45 +38,65 @@
 # along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
 
 from kam.modules.plugins.checks.basecheck import BaseCheck
+import kam.utils.procmatch as procmatch
+import kam.utils.procconnector as procconnector
+from kam.utils.procconnector import ProcConnector, ProcConnectorOverrun
 
-import psutil
+import re
+import time
 
 class ProcessesCheck(BaseCheck):
 	CONFIG_NAME = "process"
 	CONFIG_ITEM_PROCESSES = "processes"
 	CONFIG_ITEM_MIN_COUNT = "min_{0}"
+	## \brief The field to define a condition of a process, formatted with the field and the process name
+	CONFIG_ITEM_CONDITION = "{0}_{1}"
+	CONFIG_ITEM_BACKEND = "backend"
+	CONFIG_ITEM_RECONCILE = "reconcile"
+
+	## \brief Scan all processes each round
+	BACKEND_SCAN = "scan"
+	## \brief Follow the process events of the kernel
+	BACKEND_EVENTS = "events"
 
 	def __init__(self, data_dict):
 		super().__init__()
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
+		self._proctable = data_dict["proctable"]
+
+		self._processes = []
+		self._connector = None
+		self._pid_rules = {}
+		self._satisfied = 0
+		self._last_reconcile = None
 
 	def _run(self):
 		if len(self._processes) == 0:
 			self._dead()
 			return
 
+		if self._connector:
+			self._runEvents()
+			return
+
 		for cnf_process in self._processes:
 			cnf_process.resetCount()
 		
-		found_processes = []
-		for process in psutil.process_iter():
-			try:
-				found_processes.append(process.name())
-			except psutil._error.NoSuchProcess:
-				pass
-				# just ignore the error, the process is stopped between the process_iter() call and append call
+		self._proctable.scan()
 
 		alive = None
+		# Only count all processes when the counts are written to the debug output
+		count_all = self._debug and self._debug.wants(self._debug.TYPE_CHECK, self)
+
+		for process in self._proctable.processes():
+			for rule_id in self._matcher.match(process):
+				cnf_process = self._processes[rule_id]
+				cnf_process.incCount()
+				if not alive and cnf_process.getCount() >= cnf_process.getMinCount():
+					alive = cnf_process
 
-		for process in found_processes:
-			for cnf_process in self._processes:
-				if cnf_process.isProcess(process):
-					cnf_process.incCount()
-					if cnf_process.getCount() >= cnf_process.getMinCount():
-						alive = cnf_process
-						break
-			if alive:
+			if alive and not count_all:
 				break
 
 		if alive:
@@ -77,17 +106,131 @@ class ProcessesCheck(BaseCheck):
 
 		if self._debug:
 			self._debug.log(self._debug.TYPE_CHECK, self,\
-			                "processes", self._processes, "", alive)
+			                "processes", lambda: [ "{0}: {1}".format(p, p.getCount()) for p in self._processes ], "", alive)
+
+	## \brief Apply the process events since the last round, or scan all processes when it is time to reconcile
+	def _runEvents(self):
+		now = time.monotonic()
+		reconciled = False
+
+		if now - self._last_reconcile >= self._reconcile:
+			self._reconcileEvents()
+			reconciled = True
+		else:
+			try:
+				events = self._connector.events()
+			except ProcConnectorOverrun as ex:
+				if self._log:
+					self._log.log(self, "{0}, scanning all processes".format(str(ex)))
+				events = None
+
+			if events is None:
+				self._reconcileEvents()
+				reconciled = True
+			else:
+				self._applyEvents(events)
+
+		alive = self._satisfied > 0
+		if alive:
+			self._alive()
+		else:
+			self._dead()
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_CHECK, self,\
+			                "processes", lambda: [ "{0}: {1}".format(p, p.getCount()) for p in self._processes ],\
+			                "", "alive={0}; reconciled={1}".format(alive, reconciled))
+
+	## \brief Update the counts with a list of events
+	#
+	# Only the last event of each process matters. A process which exited is just removed,
+	# the other processes are read again.
+	def _applyEvents(self, events):
+		changed = {}
+		for (event, pid) in events:
+			changed[pid] = event != procconnector.EVENT_EXIT
+
+		for (pid, exists) in changed.items():
+			self._untrack(pid)
+
+			if exists:
+				info = self._proctable.lookup(pid)
+				if info:
+					self._track(info)
+			else:
+				self._proctable.forget(pid)
+
+	## \brief Scan all processes and count them again
+	def _reconcileEvents(self):
+		# Drop the events which are queued now, the scan contains their result
+		try:
+			self._connector.events()
+		except ProcConnectorOverrun:
+			pass
+
+		for cnf_process in self._processes:
+			cnf_process.resetCount()
+		self._pid_rules = {}
+		self._satisfied = 0
+
+		self._proctable.scan()
+		for info in self._proctable.processes():
+			self._track(info)
+
+		self._last_reconcile = time.monotonic()
+
+	def _track(self, info):
+		rule_ids = self._matcher.match(info)
+		if len(rule_ids) == 0:
+			return
+
+		self._pid_rules[info.getPid()] = rule_ids
+		for rule_id in rule_ids:
+			cnf_process = self._processes[rule_id]
+			cnf_process.incCount()
+			if cnf_process.getCount() == cnf_process.getMinCount():
+				self._satisfied += 1
+
+	def _untrack(self, pid):
+		rule_ids = self._pid_rules.pop(pid, None)
+		if rule_ids is None:
+			return
+
+		for rule_id in rule_ids:
+			cnf_process = self._processes[rule_id]
+			if cnf_process.getCount() == cnf_process.getMinCount():
+				self._satisfied -= 1
+			cnf_process.decCount()
+
+	## \brief Open the process events when the events backend is configured
+	#
+	# \return An error string, empty when the events backend is opened or not configured
+	def _openConnector(self, backend):
+		if self._connector:
+			self._connector.close()
+			self._connector = None
+
+		if backend != self.BACKEND_EVENTS or len(self._processes) == 0:
+			return ""
+
+		try:
+			self._connector = ProcConnector()
+		except OSError as ex:
+			return "Cannot receive process events ({0}), falling back to backend {1};".format(str(ex), self.BACKEND_SCAN)
+
+		self._reconcileEvents()
+		return ""
 
 	def loadConfig(self, config):
 		self._processes = []
+		self._matcher = procmatch.ProcessMatcher([])
 		err_value = ""
 
 		try:
 			section = config[self.CONFIG_NAME]
 		except KeyError as e:
 			section = None
-			err_value = e
+			err_value = str(e) + ";"
 
 		if section:
 			s_processes = section.get(self.CONFIG_ITEM_PROCESSES)
@@ -98,17 +241,47 @@ class ProcessesCheck(BaseCheck):
 			s_processes = s_processes.split(",")
 			for s_process in s_processes:
 				s_process = s_process.strip()
-				min_count = config[self.CONFIG_NAME].get(self.CONFIG_ITEM_MIN_COUNT.format(s_process))
+				if not s_process:
+					continue
+
+				min_count = section.get(self.CONFIG_ITEM_MIN_COUNT.format(s_process))
 				if min_count:
 					try:
 						min_count = int(min_count)
 					except Exception as ex:
 						err_value += str(ex) + ";"
+						min_count = None
 
 				if not min_count:
 					min_count = 1
 
-				self._processes.append(Process(s_process, min_count))
+				conditions = {}
+				for field in procmatch.FIELDS:
+					pattern = section.get(self.CONFIG_ITEM_CONDITION.format(field, s_process))
+					if pattern:
+						conditions[field] = pattern.strip()
+
+				if len(conditions) == 0:
+					conditions[procmatch.FIELD_COMM] = s_process
+
+				self._processes.append(Process(s_process, min_count, conditions))
+
+		try:
+			self._matcher = procmatch.ProcessMatcher([ process.getConditions() for process in self._processes ])
+		except (ValueError, re.error) as ex:
+			err_value += str(ex) + ";"
+			self._processes = []
+
+		backend = self.BACKEND_SCAN
+		self._reconcile = 600
+		if section:
+			backend = section.get(self.CONFIG_ITEM_BACKEND, self.BACKEND_SCAN).strip()
+			try:
+				self._reconcile = int(section.get(self.CONFIG_ITEM_RECONCILE, "10")) * 60
+			except ValueError as ex:
+				err_value += str(ex) + ";"
+
+		err_value += self._openConnector(backend)
 
 		if len(self._processes) > 0:
 			self._enable()
@@ -118,19 +291,24 @@ class ProcessesCheck(BaseCheck):
 		if self._debug:
 			self._debug.log(self._debug.TYPE_CONFIG, self, self.CONFIG_ITEM_PROCESSES,\
 			                self._processes, err_value, self.isEnabled())
+			self._debug.log(self._debug.TYPE_CONFIG, self, self.CONFIG_ITEM_BACKEND,\
+			                self.BACKEND_EVENTS if self._connector else self.BACKEND_SCAN, err_value, self.isEnabled())
 
 		if self._log:
-			self._log.log(self, "Config loaded: enabled={0}; processes={1}\n".format(self.isEnabled(), self._processes))
+			self._log.log(self, "Config loaded: enabled={0}; processes={1}; backend={2}; {3}\n".format(\
+			              self.isEnabled(), self._processes, self.BACKEND_EVENTS if self._connector else self.BACKEND_SCAN, err_value))
 
 
 class Process:
-	def __init__(self, name, min_count):
+	def __init__(self, name, min_count, conditions):
 		self._name = name
 		self._min_count = min_count
+		self._conditions = conditions
 		self._count = 0
 
-	def isProcess(self, name):
-		return self._name.startswith(name)
+	## \brief The conditions of this process, a dictionary which maps a field of procmatch.FIELDS to a pattern
+	def getConditions(self):
+		return self._conditions
 
 	def getCount(self):
 		return self._count
@@ -144,12 +322,15 @@ class Process:
 	def incCount(self):
 		self._count += 1
 
+	def decCount(self):
+		self._count -= 1
+
 	def __str__(self):
-		return "{0} ({1})".format(self._name, self._min_count)
+		conditions = ", ".join([ "{0}:{1}".format(field, pattern) for (field, pattern) in self._conditions.items() ])
+		return "{0} [{1}] ({2})".format(self._name, conditions, self._min_count)
 
 	def __repr__(self):
 		return str(self)
 
 def createInstance(data_dict):
 	return ProcessesCheck(data_dict)
-
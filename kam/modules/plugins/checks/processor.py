@@ -11,6 +11,12 @@
 # The \e per_cpu_load is a threshold per cpu.
 # This value is also between 0 and 100.
 #
+# The times are read from /proc/stat and kept per cpu id, so cpus which go offline or come back are handled.
+# Only the cpus kam is allowed to run on are used. With \e cpus and \e ignore_cpus the set can be limited
+# further, for example to ignore housekeeping cores. With \e window, the load is averaged over the last rounds,
+# so a single spike does not keep the machine alive.
+# The first round has no previous sample, so it evaluates nothing.
+#
 # Look at the documentatino of the config file for more information.
 #
 # \author Philip Luyckx
@@ -32,15 +38,21 @@
 # along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import time
 
 from kam.modules.plugins.checks.basecheck import BaseCheck
-
-import psutil
+from kam.utils.ratemeter import RateMeter
+import kam.utils.ratemeter as ratemeter
+import kam.utils.cpustat as cpustat
 
 class ProcessorCheck(BaseCheck):
 	CONFIG_NAME = "processor"
+	MEASURES_RATE = True
 	CONFIG_ITEM_TOTAL = "total_load"
 	CONFIG_ITEM_PER_CPU = "per_cpu_load"
+	CONFIG_ITEM_CPUS = "cpus"
+	CONFIG_ITEM_IGNORE_CPUS = "ignore_cpus"
+	CONFIG_ITEM_WINDOW = "window"
 
 	def __init__(self, data_dict):
 		super().__init__()
@@ -49,45 +61,45 @@ class ProcessorCheck(BaseCheck):
 
 		self._total = 50
 		self._per_cpu = 40
-
-		self._prev_times = []
-		for i in range(0, os.cpu_count()):
-			self._prev_times.append((0.0, 0.0))
+		self._cpus = None
+		self._ignore_cpus = set()
+		self._meter = RateMeter(2)
 
 
 	def _run(self):
-		per_cpu = psutil.cpu_times(percpu=True)
+		now = time.monotonic()
+		allowed = os.sched_getaffinity(0)
 		per_cpu_percent = []
 		total = 0
-		total_idle = 0
+		evaluated = 0
 		keep_alive_total = False
 		keep_alive_per_cpu = False
+		debug_per_cpu = self._debug and self._debug.wants(self._debug.TYPE_CHECK, self)
 
-		for i in range(0, len(per_cpu)):
-			cpu = per_cpu[i]
-			(prev_total, prev_idle) = self._prev_times[i]
-
-			total_time = cpu.user + cpu.system + cpu.idle + cpu.nice + cpu.iowait + cpu.irq + cpu.softirq + cpu.steal + cpu.guest + cpu.guest_nice
+		for (cpu, busy, total_time) in cpustat.readCpuTimes():
+			if cpu not in allowed or cpu in self._ignore_cpus or (self._cpus is not None and cpu not in self._cpus):
+				continue
 
-			delta_time = total_time - prev_total
-			delta_idle = cpu.idle - prev_idle
+			rates = self._meter.update(cpu, (busy, total_time), now)
+			if rates is None:
+				continue # the first sample of this cpu
 
-			if delta_time == 0:
-				delta_time = 1
-
-			percent = (1 - delta_idle / delta_time) * 100
+			(busy_rate, total_rate) = rates
+			percent = busy_rate / total_rate * 100 if total_rate > 0 else 0.0
 			total += percent
+			evaluated += 1
 
-			self._prev_times[i] = (total_time, cpu.idle)
-
-			per_cpu_percent.append(percent)
+			if debug_per_cpu:
+				per_cpu_percent.append((cpu, percent))
 
 			if self._per_cpu != None and percent >= self._per_cpu:
 				keep_alive_per_cpu = True
 
-		total = total / os.cpu_count()
+		self._meter.sweep()
+
+		total = total / evaluated if evaluated > 0 else None
 
-		keep_alive_total = (total != None and total >= self._total)
+		keep_alive_total = (total != None and self._total != None and total >= self._total)
 		keep_alive = keep_alive_total or keep_alive_per_cpu
 
 		if keep_alive:
@@ -103,30 +115,45 @@ class ProcessorCheck(BaseCheck):
 		err_value = ""
 		err_total = ""
 		err_per_cpu = ""
+		window = 1
+		self._cpus = None
+		self._ignore_cpus = set()
 
 		try:
 			section = config[self.CONFIG_NAME]
 		except KeyError as ex:
-			err_value = ex
+			err_value = str(ex)
+			section = None
 
 		if section:
 			try:
 				total = float(section.get(self.CONFIG_ITEM_TOTAL))
-			except ValueError as ex:
+			except (TypeError, ValueError) as ex:
 				total = None
 				err_total = str(ex)
 
 			try:
-				per_cpu = section.get(self.CONFIG_ITEM_PER_CPU)
-			except ValueError as ex:
+				per_cpu = float(section.get(self.CONFIG_ITEM_PER_CPU))
+			except (TypeError, ValueError) as ex:
 				per_cpu = None
 				err_per_cpu = str(ex)
+
+			try:
+				cpus = section.get(self.CONFIG_ITEM_CPUS)
+				if cpus:
+					self._cpus = cpustat.parseCpuList(cpus)
+				self._ignore_cpus = cpustat.parseCpuList(section.get(self.CONFIG_ITEM_IGNORE_CPUS, ""))
+				window = int(section.get(self.CONFIG_ITEM_WINDOW, "1"))
+				self._meter = RateMeter(2, ratemeter.SMOOTHING_WINDOW, window)
+			except ValueError as ex:
+				err_value += str(ex)
+				self._meter = RateMeter(2)
 		else:
 			total = None
 			per_cpu = None
 
-		self._total = float(total) if total else None
-		self._per_cpu = float(per_cpu) if per_cpu else None
+		self._total = total
+		self._per_cpu = per_cpu
 
 		if self._total != None or self._per_cpu != None:
 			self._enable()
@@ -140,8 +167,8 @@ class ProcessorCheck(BaseCheck):
 			                self._per_cpu, err_value + ";" + err_per_cpu, self.isEnabled())
 
 		if self._log:
-			self._log.log(self, "Config file read!\nenabled = {0}\ntotal = {1}\nper_cpu = {2}\n".format(self.isEnabled(), self._total, self._per_cpu))
+			self._log.log(self, "Config file read!\nenabled = {0}\ntotal = {1}\nper_cpu = {2}\ncpus = {3}\nignore_cpus = {4}\nwindow = {5}\n".format(\
+			              self.isEnabled(), self._total, self._per_cpu, self._cpus, self._ignore_cpus, window))
 
 def createInstance(data_dict):
 	return ProcessorCheck(data_dict)
-
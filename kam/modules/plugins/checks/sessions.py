@@ -0,0 +1,294 @@
+##\package sessions
+# \brief This plugin checks if users are logged in. If so, the machine is kept alive.
+#
+# In the config file you can create a section [sessions] with the field \e min_sessions, the amount of sessions
+# which keeps the machine alive. A threshold for one type of session is defined by appending the type,
+# for example min_sessions_ssh. The types are tty, ssh, x11, wayland and other.
+#
+# The sessions are read from the state files of systemd-logind in /run/systemd/sessions, or from the utmp file
+# when logind is not used. They are only read again when the directory or the file changed.
+#
+# logind keeps the idle hint of a session in memory, it is not written to its state files. So a session is
+# idle when its terminal was not used for \e idle_time minutes, like the IDLE column of the command w.
+# Graphical sessions are never idle, the keyboard and mice checks follow their input.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+from kam.modules.plugins.checks.basecheck import BaseCheck
+
+import os
+import struct
+import time
+
+TYPE_TTY = "tty"
+TYPE_SSH = "ssh"
+TYPE_X11 = "x11"
+TYPE_WAYLAND = "wayland"
+TYPE_OTHER = "other"
+TYPES = [ TYPE_TTY, TYPE_SSH, TYPE_X11, TYPE_WAYLAND, TYPE_OTHER ]
+
+## \brief The types of sessions which have a terminal the user types in
+TERMINAL_TYPES = [ TYPE_TTY, TYPE_SSH ]
+
+SOURCE_AUTO = "auto"
+SOURCE_LOGIND = "logind"
+SOURCE_UTMP = "utmp"
+SOURCES = [ SOURCE_AUTO, SOURCE_LOGIND, SOURCE_UTMP ]
+
+## \brief A record of utmp on Linux: type, pid, line, id, user, host, exit, session, tv, addr_v6
+_UTMP = struct.Struct("<hxxi32s4s32s256shhi2i4i20x")
+_USER_PROCESS = 7
+
+class Session:
+	__slots__ = ("_id", "_user", "_type", "_tty")
+
+	def __init__(self, session_id, user, session_type, tty):
+		self._id = session_id
+		self._user = user
+		self._type = session_type
+		self._tty = tty
+
+	def getId(self):
+		return self._id
+
+	def getUser(self):
+		return self._user
+
+	## \brief One of the TYPE_* constants
+	def getType(self):
+		return self._type
+
+	## \brief The terminal of the session relative to /dev, for example pts/0, or an empty string
+	def getTty(self):
+		return self._tty
+
+	def __str__(self):
+		return "{0}@{1} ({2})".format(self._user, self._tty or "-", self._type)
+
+	def __repr__(self):
+		return str(self)
+
+class SessionsCheck(BaseCheck):
+	CONFIG_NAME = "sessions"
+	CONFIG_ITEM_MIN_SESSIONS = "min_sessions"
+	CONFIG_ITEM_MIN_TYPE = "min_sessions_{0}"
+	CONFIG_ITEM_IDLE_TIME = "idle_time"
+	CONFIG_ITEM_SOURCE = "source"
+	CONFIG_ITEM_UTMP = "utmp"
+
+	LOGIND_PATH = "/run/systemd/sessions"
+	UTMP_PATH = "/run/utmp"
+	DEV_PATH = "/dev"
+
+	def __init__(self, data_dict):
+		super().__init__()
+		self._debug = data_dict["debug"]
+		self._log = data_dict["log"]
+
+		self._source = SOURCE_LOGIND
+		self._utmp = self.UTMP_PATH
+		self._sessions = []
+		self._mtime = None
+
+	def _run(self):
+		sessions = self._readSessions()
+		counts = dict([ (session_type, 0) for session_type in TYPES ])
+		idle = []
+
+		now = time.time()
+		for session in sessions:
+			if self._idle_time and self._isIdle(session, now):
+				idle.append(session)
+			else:
+				counts[session.getType()] += 1
+
+		total = sum(counts.values())
+		alive = self._min_sessions is not None and total >= self._min_sessions
+		for (session_type, threshold) in self._min_types.items():
+			alive = alive or counts[session_type] >= threshold
+
+		if alive:
+			self._alive()
+		else:
+			self._dead()
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_CHECK, self, "sessions", counts, "", alive)
+			self._debug.log(self._debug.TYPE_CHECK, self, "idle", idle, "", len(idle) > 0, self._debug.LEVEL_TRACE)
+
+	## \brief Check if nobody typed in the terminal of the session for idle_time
+	def _isIdle(self, session, now):
+		if session.getType() not in TERMINAL_TYPES or not session.getTty():
+			return False
+
+		try:
+			atime = os.stat(os.path.join(self.DEV_PATH, session.getTty())).st_atime
+		except OSError:
+			return False
+
+		return now - atime >= self._idle_time
+
+	## \brief Get the sessions, they are only read again when the source changed
+	def _readSessions(self):
+		path = self.LOGIND_PATH if self._source == SOURCE_LOGIND else self._utmp
+		try:
+			mtime = os.stat(path).st_mtime_ns
+		except OSError as ex:
+			if self._mtime is not None and self._log:
+				self._log.log(self, "Cannot read the sessions: {0}\n".format(str(ex)))
+			self._mtime = None
+			self._sessions = []
+			return self._sessions
+
+		if mtime != self._mtime:
+			try:
+				if self._source == SOURCE_LOGIND:
+					self._sessions = self._readLogind()
+				else:
+					self._sessions = self._readUtmp()
+				self._mtime = mtime
+			except OSError as ex:
+				if self._log:
+					self._log.log(self, "Cannot read the sessions: {0}\n".format(str(ex)))
+				self._sessions = []
+				self._mtime = None
+
+		return self._sessions
+
+	## \brief Read the state files of logind, one file for each session
+	def _readLogind(self):
+		sessions = []
+
+		with os.scandir(self.LOGIND_PATH) as entries:
+			for entry in entries:
+				# Skip the .ref fifos and the temporary files
+				if "." in entry.name or not entry.is_file():
+					continue
+
+				try:
+					with open(entry.path, "r") as f:
+						fields = dict([ line.rstrip("\n").split("=", 1) for line in f if "=" in line ])
+				except OSError:
+					continue # the session closed
+
+				if not fields.get("CLASS", "").startswith("user") or fields.get("STATE") == "closing":
+					continue
+
+				session_type = fields.get("TYPE", "")
+				if fields.get("REMOTE") == "1" or fields.get("SERVICE") == "sshd":
+					session_type = TYPE_SSH
+				elif session_type not in TYPES:
+					session_type = TYPE_OTHER
+
+				sessions.append(Session(entry.name, fields.get("USER", ""), session_type, fields.get("TTY", "")))
+
+		return sessions
+
+	## \brief Read the login records of the utmp file
+	def _readUtmp(self):
+		with open(self._utmp, "rb") as f:
+			data = f.read()
+
+		sessions = []
+		length = len(data) - len(data) % _UTMP.size
+		for record in _UTMP.iter_unpack(data[:length]):
+			(ut_type, pid, line, _, user, host) = record[:6]
+			if ut_type != _USER_PROCESS or not os.path.exists("/proc/{0}".format(pid)):
+				continue
+
+			line = line.rstrip(b"\0").decode("utf-8", "replace")
+			host = host.rstrip(b"\0").decode("utf-8", "replace")
+			if line.startswith(":") or host.startswith(":"):
+				session_type = TYPE_X11
+				line = ""
+			elif host:
+				session_type = TYPE_SSH
+			else:
+				session_type = TYPE_TTY
+
+			sessions.append(Session(str(pid), user.rstrip(b"\0").decode("utf-8", "replace"), session_type, line))
+
+		return sessions
+
+	def loadConfig(self, config):
+		err_value = ""
+		self._min_sessions = None
+		self._min_types = {}
+		self._idle_time = 0
+		self._utmp = self.UTMP_PATH
+		source = SOURCE_AUTO
+
+		try:
+			section = config[self.CONFIG_NAME]
+		except KeyError as e:
+			section = None
+			err_value = str(e) + "; "
+
+		if section:
+			try:
+				value = section.get(self.CONFIG_ITEM_MIN_SESSIONS, "").strip()
+				self._min_sessions = int(value) if value else None
+
+				for session_type in TYPES:
+					value = section.get(self.CONFIG_ITEM_MIN_TYPE.format(session_type), "").strip()
+					if value:
+						self._min_types[session_type] = int(value)
+
+				self._idle_time = int(section.get(self.CONFIG_ITEM_IDLE_TIME, "0")) * 60
+			except ValueError as ex:
+				err_value += str(ex) + "; "
+
+			source = section.get(self.CONFIG_ITEM_SOURCE, source).strip()
+			if source not in SOURCES:
+				err_value += "Unknown source {0}; ".format(source)
+				source = SOURCE_AUTO
+
+			self._utmp = section.get(self.CONFIG_ITEM_UTMP, self._utmp).strip()
+
+		if source == SOURCE_AUTO:
+			source = SOURCE_LOGIND if os.path.isdir(self.LOGIND_PATH) else SOURCE_UTMP
+
+		self._source = source
+		self._mtime = None
+
+		if self._min_sessions is not None or len(self._min_types) > 0:
+			self._enable()
+		else:
+			self._disable()
+
+		if self._log:
+			self._log.log(self, "Config loaded: enabled={0}; source={1}; min_sessions={2}; per type={3}; idle_time={4}; {5}\n".format(\
+			              self.isEnabled(), self._source, self._min_sessions, self._min_types, self._idle_time, err_value))
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_CONFIG, self,\
+			                self.CONFIG_ITEM_MIN_SESSIONS, self._min_sessions,\
+			                err_value, self.isEnabled())
+			for (session_type, threshold) in self._min_types.items():
+				self._debug.log(self._debug.TYPE_CONFIG, self,\
+				                self.CONFIG_ITEM_MIN_TYPE.format(session_type), threshold,\
+				                "", self.isEnabled())
+
+## \brief Create an instance of this class
+#
+# \public
+# \param data_dict This dictionary must contain the keys "log" and "debug".
+# \return An object of the type SessionsCheck
+def createInstance(data_dict):
+	return SessionsCheck(data_dict)
@@ -0,0 +1,354 @@
+##\package checkrunner
+# \brief This core plugin runs the checks of a round.
+#
+# In the section [global], \e check_mode defines how the checks are run:
+# - \e serial: one after the other in the main thread (default)
+# - \e concurrent: on a pool of \e check_threads threads. The round waits for each check until its deadline,
+#   a check which did not finish in time is unknown. It is not alive, and it is not started again before
+#   it finished. So a round never takes longer than the longest deadline. When it finished before the next
+#   round it is due, that round uses its late result and the check is started again the round after.
+# - \e ordered: one after the other in the main thread, the cheapest check which is most often alive first.
+#   The round stops at the first check which is alive, one alive check is enough to keep the machine alive.
+#   A check which did not run for \e check_refresh seconds is run anyway, so its state stays fresh.
+#   The result of a skipped check is stale: it is not alive and it does not feed the idle time.
+#   A check which measures a rate since its previous run is never skipped, a skip would stretch its rate
+#   over the skipped rounds.
+#   The cost is the average time check() takes, divided by how often the check was alive recently.
+#
+# The deadline of a check is the field \e deadline in the section of the check, in seconds.
+# When it is not defined, \e check_deadline of the section [global] is used.
+#
+# Each check runs every \e interval seconds, a field in the section of the check. When it is not defined,
+# the period of the section [global] is used. The checks are kept in a heap on the time they are due,
+# a round only runs the checks which are due. The other checks keep the result of their last run.
+# PeriodSleep wakes up when the next check is due.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+from kam.modules.plugins.core.base import CoreBase
+from kam.modules.plugins.checks.basecheck import BaseCheck
+
+import concurrent.futures
+import heapq
+import itertools
+import time
+
+MODE_SERIAL = "serial"
+MODE_CONCURRENT = "concurrent"
+MODE_ORDERED = "ordered"
+MODES = [ MODE_SERIAL, MODE_CONCURRENT, MODE_ORDERED ]
+
+## \brief The weight of the newest measurement in the averages of the cost and the hit rate
+AVERAGE_WEIGHT = 0.2
+## \brief The lowest hit rate used to order the checks, so a check which is never alive is still ordered by its cost
+MIN_HIT_RATE = 0.05
+## \brief A check which is due within this amount of seconds runs in this round, so waking up early does not skip it
+DUE_SLACK = 0.1
+
+class CheckRunner(CoreBase):
+	CONFIG_NAME = "global"
+	CONFIG_ITEM_MODE = "check_mode"
+	CONFIG_ITEM_THREADS = "check_threads"
+	CONFIG_ITEM_DEADLINE = "check_deadline"
+	CONFIG_ITEM_REFRESH = "check_refresh"
+	## \brief The field in the section of a check
+	CONFIG_ITEM_CHECK_DEADLINE = BaseCheck.CONFIG_ITEM_DEADLINE
+	## \brief The field in the section of a check
+	CONFIG_ITEM_CHECK_INTERVAL = BaseCheck.CONFIG_ITEM_INTERVAL
+
+	DEFAULT_THREADS = 4
+	DEFAULT_DEADLINE = 30.0
+	DEFAULT_REFRESH = 300.0
+	MIN_INTERVAL = 1.0
+
+	def __init__(self, data_dict):
+		super().__init__()
+		self._debug = data_dict["debug"]
+		self._log = data_dict["log"]
+		self._config = data_dict["config"]
+		self._check_list = data_dict["checks"]
+
+		self._mode = MODE_SERIAL
+		self._executor = None
+		self._deadline = self.DEFAULT_DEADLINE
+		self._deadlines = {}
+		# The futures of the checks which are running, a check which missed its deadline stays here until it finished
+		self._running = {}
+
+		self._refresh = self.DEFAULT_REFRESH
+		# The averages of the ordered mode, by check
+		self._costs = {}
+		self._hit_rates = {}
+		self._last_runs = {}
+
+		# The schedule: a heap of (due time, sequence number, check)
+		self._default_interval = None
+		self._intervals = {}
+		self._schedule = []
+		self._sequence = itertools.count()
+
+	## \brief Set the interval of the checks which do not define one, normally the period of PeriodSleep
+	#
+	# \public
+	# \param interval The interval in seconds, None runs these checks each round
+	def setDefaultInterval(self, interval):
+		self._default_interval = interval
+		self._intervals = {}
+		self._schedule = []
+
+	## \brief Get the time the next check is due
+	#
+	# \public
+	# \return The time from time.monotonic(), or None when no check is scheduled
+	def nextDue(self):
+		if len(self._schedule) == 0:
+			return None
+
+		return self._schedule[0][0]
+
+	def _execute(self):
+		checks = self._dueChecks()
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_EXECUTE, self, "due",\
+			                lambda: [ check.__class__.__name__ for check in checks ], "", len(checks))
+
+		if self._mode == MODE_CONCURRENT:
+			self._runConcurrent(checks)
+		elif self._mode == MODE_ORDERED:
+			self._runOrdered(checks)
+		else:
+			for check in checks:
+				if self._log:
+					self._log.log(self, "Checking {0}".format(check.__class__.__name__))
+				check.check()
+
+	## \brief Take the checks which are due from the schedule and schedule their next run
+	#
+	# \return The checks which are due, in the order of the list of checks
+	def _dueChecks(self):
+		now = time.monotonic()
+
+		due = set()
+
+		for check in self._check_list:
+			if check not in self._intervals:
+				self._intervals[check] = self._getInterval(check)
+				if self._intervals[check] is not None:
+					heapq.heappush(self._schedule, (now, next(self._sequence), check))
+
+			# A check without an interval is not scheduled, it runs each round
+			if self._intervals[check] is None:
+				due.add(check)
+
+		while len(self._schedule) > 0 and self._schedule[0][0] <= now + DUE_SLACK:
+			(when, _, check) = heapq.heappop(self._schedule)
+			due.add(check)
+
+			# Keep the cadence, unless the check is so late it would run twice
+			interval = self._intervals[check]
+			when += interval
+			if when <= now:
+				when = now + interval
+			heapq.heappush(self._schedule, (when, next(self._sequence), check))
+
+		return [ check for check in self._check_list if check in due ]
+
+	def _runConcurrent(self, checks):
+		start = time.monotonic()
+		waiting = []
+
+		for check in checks:
+			if not check.isEnabled():
+				continue
+
+			future = self._running.get(check)
+			if future is not None:
+				if not future.done():
+					check.setUnknown(start)
+					if self._log:
+						self._log.log(self, "{0} is still running, its result is unknown".format(check.__class__.__name__))
+					continue
+
+				# Use the late result in this round, starting the check again would make it unknown again
+				self._finish(check, future)
+				if self._log:
+					self._log.log(self, "{0} finished late, its result is used".format(check.__class__.__name__))
+				continue
+
+			future = self._executor.submit(check.check)
+			self._running[check] = future
+			waiting.append((start + self._getDeadline(check), check, future))
+
+		# Wait for the check with the earliest deadline first
+		waiting.sort(key=lambda entry: entry[0])
+		for (deadline, check, future) in waiting:
+			try:
+				future.result(max(0.0, deadline - time.monotonic()))
+			except concurrent.futures.TimeoutError:
+				# The check may just have finished, do not overwrite its result
+				check.setUnknown(start)
+				if self._log:
+					self._log.log(self, "{0} missed its deadline of {1} seconds, its result is unknown".format(\
+					              check.__class__.__name__, self._getDeadline(check)))
+				continue
+
+			self._finish(check, future)
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_EXECUTE, self, "round", time.monotonic() - start, "",\
+			                lambda: [ check.__class__.__name__ for check in self._running ])
+
+	def _runOrdered(self, checks):
+		now = time.monotonic()
+		checks = [ check for check in checks if check.isEnabled() ]
+		checks.sort(key=self._getPriority)
+
+		alive = None
+		skipped = []
+		for check in checks:
+			last_run = self._last_runs.get(check)
+			if alive is not None and last_run is not None and now - last_run < self._refresh and not check.MEASURES_RATE:
+				check.setStale()
+				skipped.append(check.__class__.__name__)
+				continue
+
+			self._measure(check)
+			if alive is None and check.isAlive():
+				alive = check
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_EXECUTE, self, "skipped", skipped, "",\
+			                lambda: [ (check.__class__.__name__, self._getPriority(check)) for check in checks ])
+
+	## \brief Run a check and update its average cost and hit rate
+	def _measure(self, check):
+		if self._log:
+			self._log.log(self, "Checking {0}".format(check.__class__.__name__))
+
+		start = time.monotonic()
+		check.check()
+		cost = time.monotonic() - start
+		hit = 1.0 if check.isAlive() else 0.0
+
+		average = self._costs.get(check)
+		self._costs[check] = cost if average is None else average + AVERAGE_WEIGHT * (cost - average)
+		average = self._hit_rates.get(check)
+		self._hit_rates[check] = hit if average is None else average + AVERAGE_WEIGHT * (hit - average)
+		self._last_runs[check] = start
+
+	## \brief The order of a check in the ordered mode, lower runs first. A check which never ran is first.
+	def _getPriority(self, check):
+		cost = self._costs.get(check)
+		if cost is None:
+			return 0.0
+
+		return cost / max(self._hit_rates[check], MIN_HIT_RATE)
+
+	## \brief Forget the future of a check which finished, an exception of the check is raised again
+	def _finish(self, check, future):
+		del self._running[check]
+		future.result()
+
+	## \brief Get the deadline of a check, from the section of the check or the default
+	def _getDeadline(self, check):
+		deadline = self._deadlines.get(check)
+		if deadline is None:
+			deadline = self._getCheckOption(check, self.CONFIG_ITEM_CHECK_DEADLINE, self._deadline)
+			self._deadlines[check] = deadline
+
+		return deadline
+
+	## \brief Get the interval of a check, from the section of the check or the default
+	def _getInterval(self, check):
+		interval = self._getCheckOption(check, self.CONFIG_ITEM_CHECK_INTERVAL, self._default_interval)
+		if interval is not None and interval < self.MIN_INTERVAL:
+			interval = self.MIN_INTERVAL
+
+		return interval
+
+	## \brief Read a number of seconds from the section of a check
+	def _getCheckOption(self, check, name, default):
+		try:
+			value = self._config[check.CONFIG_NAME].get(name)
+			if value:
+				return float(value)
+		except KeyError:
+			pass
+		except ValueError as ex:
+			if self._log:
+				self._log.log(self, "Invalid {0} for {1}: {2}".format(name, check.__class__.__name__, str(ex)))
+
+		return default
+
+	def loadConfig(self, config):
+		err_value = ""
+		mode = MODE_SERIAL
+		threads = self.DEFAULT_THREADS
+		self._deadline = self.DEFAULT_DEADLINE
+		self._deadlines = {}
+		self._refresh = self.DEFAULT_REFRESH
+		self._intervals = {}
+		self._schedule = []
+
+		try:
+			section = config[self.CONFIG_NAME]
+		except KeyError as ex:
+			err_value = str(ex) + "; "
+			section = None
+
+		if section:
+			mode = section.get(self.CONFIG_ITEM_MODE, mode).strip()
+			if mode not in MODES:
+				err_value += "Unknown {0}: {1}, using {2}; ".format(self.CONFIG_ITEM_MODE, mode, MODE_SERIAL)
+				mode = MODE_SERIAL
+
+			try:
+				threads = int(section.get(self.CONFIG_ITEM_THREADS, str(threads)))
+				self._deadline = float(section.get(self.CONFIG_ITEM_DEADLINE, str(self._deadline)))
+				self._refresh = float(section.get(self.CONFIG_ITEM_REFRESH, str(self._refresh)))
+			except ValueError as ex:
+				err_value += str(ex) + "; "
+
+			if threads <= 0:
+				threads = self.DEFAULT_THREADS
+
+		# Do not wait for the checks which are still running in the old pool
+		if self._executor:
+			self._executor.shutdown(wait=False)
+			self._executor = None
+		self._running = {}
+
+		self._mode = mode
+		if mode == MODE_CONCURRENT:
+			self._executor = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix="kam-check")
+
+		self._enable()
+
+		if self._log:
+			self._log.log(self, "Config loaded, check_mode = {0}, check_threads = {1}, check_deadline = {2}, check_refresh = {3}; {4}".format(\
+			              self._mode, threads, self._deadline, self._refresh, err_value))
+
+		if self._debug:
+			self._debug.log(self._debug.TYPE_CONFIG, self,\
+			                self.CONFIG_ITEM_MODE, self._mode,\
+			                err_value, self.isEnabled())
+
+def createInstance(data_dict):
+	return CheckRunner(data_dict)
@@ -48,20 +48,31 @@ class IdleCommand(CoreBase):
 
 	def _execute(self):
 		now = time.clock_gettime(time.CLOCK_MONOTONIC)
-		delta = now - self._last_alive
 
 		is_alive = False
 		no_checks_enabled = True
+		unknown = []
+		stale = []
 		for check in self._check_list:
 			if check.isEnabled():
 				no_checks_enabled = False
-				if check.isAlive():
+				if check.isUnknown():
+					# The check did not finish in time, it does not keep the machine alive
+					unknown.append(check.__class__.__name__)
+				elif check.isStale():
+					# The check was skipped in this round, its last result is old
+					stale.append(check.__class__.__name__)
+				elif check.isAlive():
 					is_alive = True
-					break
+					# A check can know when the activity happened, for example the last key press.
+					# Use the most recent activity of all checks, so the idle time is not rounded to the period.
+					alive_time = check.getAliveTime()
+					if alive_time is not None and alive_time > self._last_alive:
+						self._last_alive = min(alive_time, now)
+
+		delta = now - self._last_alive
 
-		if is_alive:
-			self._last_alive = now
-		elif delta >= self._idle_time * 60:
+		if not is_alive and delta >= self._idle_time * 60:
 			if no_checks_enabled:
 				if self._log:
 					self._log.log(self, "No checks enable. We do not execute the idle command!")
@@ -72,7 +83,11 @@ class IdleCommand(CoreBase):
 		if self._log:
 			self._log.log(self, "It is now {0}, the server is alive: {1}, when the server is dead for {2} seconds, the server will shutdown".format(\
 			                     now, is_alive,
-			                     self._idle_time * 60 if is_alive else self._idle_time*60 - delta))
+			                     self._idle_time * 60 - delta))
+			if len(unknown) > 0:
+				self._log.log(self, "The result of these checks is unknown: {0}".format(unknown))
+			if len(stale) > 0:
+				self._log.log(self, "These checks were skipped, their result is stale: {0}".format(stale))
 
 	def loadConfig(self, config):
 		err_value = ""
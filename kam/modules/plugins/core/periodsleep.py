@@ -35,13 +35,31 @@ class PeriodSleep(CoreBase):
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
 		self._last_run = time.clock_gettime(time.CLOCK_MONOTONIC)
+		self._scheduler = None
 
+	## \brief Wake up when the next check of the scheduler is due, when that is before the end of the period
+	#
+	# \public
+	# \param scheduler An object with the function nextDue(), which returns a time from time.monotonic() or None
+	def setScheduler(self, scheduler):
+		self._scheduler = scheduler
+
+	## \brief Get the period in seconds
+	#
+	# \public
+	def getPeriod(self):
+		return self._sleep
 
 	def _execute(self):
 		now = time.clock_gettime(time.CLOCK_MONOTONIC)
 		delta = now - self._last_run
 		time_to_sleep = self._sleep - delta
 
+		if self._scheduler:
+			due = self._scheduler.nextDue()
+			if due is not None:
+				time_to_sleep = min(time_to_sleep, due - now)
+
 		if time_to_sleep > 0:
 			time.sleep(time_to_sleep)
 
@@ -4,6 +4,10 @@
 # You cannot instantiate this class directly.
 # You must use a subclass for this.
 #
+# Each debugger has a verbosity and can filter on plugins and log types. Records of the type TYPE_CHECK
+# can be sampled, so only 1 in N of them is written. The values passed to log() can be callables
+# without parameters, they are only called when the record is actually written.
+#
 # \author Philip Luyckx
 # \copyright GNU Public License
 
@@ -32,33 +36,120 @@ class Debugger:
 	## \brief Log the execute function
 	TYPE_EXECUTE = "execute"
 
+	## \brief Only the records which are always interesting
+	LEVEL_NORMAL = 1
+	## \brief Also the records of each round
+	LEVEL_VERBOSE = 2
+	## \brief Everything, also the detailed records of each round
+	LEVEL_TRACE = 3
+
+	## \brief The level of a record, when log() is called without a level
+	DEFAULT_LEVELS = { TYPE_CONFIG: LEVEL_NORMAL,\
+	                   TYPE_EXECUTE: LEVEL_NORMAL,\
+	                   TYPE_CHECK: LEVEL_VERBOSE }
+
+	CONFIG_ITEM_VERBOSITY = "verbosity"
+	CONFIG_ITEM_PLUGINS = "plugins"
+	CONFIG_ITEM_TYPES = "types"
+	CONFIG_ITEM_CHECK_SAMPLE = "check_sample"
+
 	## \brief A basic constructor
 	def __init__(self):
 		self._enabled = False
+		self._verbosity = self.LEVEL_TRACE
+		self._plugins = None
+		self._types = None
+		self._check_sample = 1
+		self._sample_counters = {}
 
 	## \brief Log a message with some handy information
 	#
 	# \public
 	#
-	# This is just a wrapper function which checks if the debugger is enabled.
+	# This is just a wrapper function which checks if the debugger is enabled and accepts the record.
 	# If so, it will pass all the parameters to the \e _log() function.
 	#
 	# \param log_type One of the TYPE_* constants of this class
 	# \param plugin The plugin which is logging, most of the time you can use \e self for this.
 	# \param parameter_name The name of the parameter you are logging
-	# \param parameter_value The value of the parameter
-	# \param err_value An error string which is appended to the line
-	# \param comments Some extra comments which are appended after the error value.
-	def log(self, log_type, plugin, parameter_name, parameter_value, err_value, comments):
-		if self._enabled:
-			self._log(log_type, plugin, parameter_name, parameter_value, err_value, comments)
+	# \param parameter_value The value of the parameter, or a callable which returns the value
+	# \param err_value An error string which is appended to the line, or a callable which returns it
+	# \param comments Some extra comments which are appended after the error value, or a callable which returns them
+	# \param level One of the LEVEL_* constants of this class. When None, the level depends on the log type.
+	def log(self, log_type, plugin, parameter_name, parameter_value, err_value, comments, level=None):
+		if self._enabled and self.accepts(log_type, plugin, parameter_name, level):
+			self._log(log_type, plugin, parameter_name, self.resolve(parameter_value),\
+			          self.resolve(err_value), self.resolve(comments))
 
 	## \brief The function which contains the code to actually log everything
 	# \protected
-	# For the parameters, please check the \e log() documentation.
+	# For the parameters, please check the \e log() documentation. The values are already resolved.
 	def _log(self, log_type, plugin, parameter_name, parameter_value, err_value, comments):
 		raise KamFunctionNotImplemented("log not implemented in class {0}".format(self.__class__.__name__))
 
+	## \brief Check if a record would pass the verbosity and the filters of this debugger
+	#
+	# \public
+	# This function has no side effects, so it can be used to skip building values which are only used for debugging.
+	#
+	# \param log_type One of the TYPE_* constants of this class
+	# \param plugin The plugin which is logging
+	# \param level One of the LEVEL_* constants of this class, or None
+	# \return True when a record of this type and plugin can be written
+	def wants(self, log_type, plugin, level=None):
+		if not self._enabled:
+			return False
+
+		if level is None:
+			level = self.DEFAULT_LEVELS.get(log_type, self.LEVEL_NORMAL)
+
+		if level > self._verbosity:
+			return False
+		if self._types is not None and log_type not in self._types:
+			return False
+		if self._plugins is not None and self.pluginName(plugin) not in self._plugins:
+			return False
+
+		return True
+
+	## \brief Check if a record must be written
+	#
+	# \public
+	# Same as wants(), but the sampling of TYPE_CHECK records is applied too.
+	# So only call this function once for each record.
+	#
+	# \return True when the record must be written
+	def accepts(self, log_type, plugin, parameter_name, level=None):
+		if not self.wants(log_type, plugin, level):
+			return False
+
+		if log_type == self.TYPE_CHECK and self._check_sample > 1:
+			key = (self.pluginName(plugin), parameter_name)
+			count = self._sample_counters.get(key, 0)
+			self._sample_counters[key] = count + 1
+
+			return count % self._check_sample == 0
+
+		return True
+
+	## \brief Resolve a value which is passed to log()
+	#
+	# \public
+	# \return The result of the value when it is callable, otherwise the value itself
+	@staticmethod
+	def resolve(value):
+		return value() if callable(value) else value
+
+	## \brief Get the name of a plugin as it is logged
+	#
+	# \public
+	@staticmethod
+	def pluginName(plugin):
+		if isinstance(plugin, str):
+			return plugin
+		else:
+			return plugin.__class__.__name__
+
 	## \brief Enable the debugger
 	def _enable(self):
 		self._enabled = True
@@ -67,6 +158,50 @@ class Debugger:
 	def _disable(self):
 		self._enabled = False
 
+	## \brief Check if the debugger is enabled
+	def isEnabled(self):
+		return self._enabled
+
+	## \brief Load the verbosity, the filters and the sampling from a config section
+	#
+	# \protected
+	# \param section The section of the debugger, or None
+	# \return An error string, empty when everything is parsed
+	def _loadFilterConfig(self, section):
+		err_value = ""
+		self._verbosity = self.LEVEL_TRACE
+		self._plugins = None
+		self._types = None
+		self._check_sample = 1
+		self._sample_counters = {}
+
+		if not section:
+			return err_value
+
+		verbosity = section.get(self.CONFIG_ITEM_VERBOSITY)
+		if verbosity:
+			try:
+				self._verbosity = int(verbosity)
+			except ValueError as ex:
+				err_value += str(ex) + ";"
+
+		plugins = section.get(self.CONFIG_ITEM_PLUGINS)
+		if plugins and plugins.strip():
+			self._plugins = set([ plugin.strip() for plugin in plugins.split(",") ])
+
+		types = section.get(self.CONFIG_ITEM_TYPES)
+		if types and types.strip():
+			self._types = set([ log_type.strip() for log_type in types.split(",") ])
+
+		check_sample = section.get(self.CONFIG_ITEM_CHECK_SAMPLE)
+		if check_sample:
+			try:
+				self._check_sample = max(int(check_sample), 1)
+			except ValueError as ex:
+				err_value += str(ex) + ";"
+
+		return err_value
+
 	## \brief Load the configuraiton.
 	#
 	# \param config The configuration file in the form of a \configparser object.
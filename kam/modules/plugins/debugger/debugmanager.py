@@ -3,6 +3,7 @@
 #
 # When you want to use multiple debuggers, you can use the DebugManager to hold all the debuggers.
 # When you want to log, call the log() function of the DebugManager and he will delegate the log call to all debuggers he is holding.
+# The values are only resolved when at least one debugger accepts the record, and then only once.
 #
 # \author Philip Luyckx
 # \copyright GNU Public License
@@ -24,15 +25,45 @@
 
 from kam.modules.plugins.debugger.debugger import Debugger
 
+from threading import Lock
+
 class DebugManager(Debugger):
 	
 	def __init__(self):
 		super().__init__()
 		self._debuggers = []
+		# The checks can run in threads, the debuggers write to their files one record at a time
+		self._lock = Lock()
+
+	def log(self, log_type, plugin, parameter_name, parameter_value, err_value, comments, level=None):
+		if not self._enabled:
+			return
 
-	def _log(self, log_type, plugin, parameter_name, parameter_value, err_value, comments):
+		debuggers = []
 		for debugger in self._debuggers:
-			debugger.log(log_type, plugin, parameter_name, parameter_value, err_value, comments)
+			if debugger.accepts(log_type, plugin, parameter_name, level):
+				debuggers.append(debugger)
+
+		if len(debuggers) == 0:
+			return
+
+		parameter_value = self.resolve(parameter_value)
+		err_value = self.resolve(err_value)
+		comments = self.resolve(comments)
+
+		with self._lock:
+			for debugger in debuggers:
+				debugger._log(log_type, plugin, parameter_name, parameter_value, err_value, comments)
+
+	def wants(self, log_type, plugin, level=None):
+		if not self._enabled:
+			return False
+
+		for debugger in self._debuggers:
+			if debugger.wants(log_type, plugin, level):
+				return True
+
+		return False
 
 	def add(self, debugger):
 		if isinstance(debugger, Debugger):
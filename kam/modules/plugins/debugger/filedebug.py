@@ -2,6 +2,7 @@
 # \brief This is a debugger and he writes everything to a file.
 #
 # The debugger is configurated through the section \e [filedebug] and the properties \e path and \e max_lines.
+# With the property \e mode set to \e binary, the records are stored in a compact binary trace, see tracefile.
 #
 # \author Philip Luyckx
 # \copyright GNU Public License
@@ -24,28 +25,36 @@
 import os
 from datetime import datetime
 from kam.modules.plugins.debugger.debugger import Debugger
+from kam.modules.plugins.debugger.tracefile import TraceWriter
+from kam.utils.segmentfile import SegmentFile
 
 class FileDebug(Debugger):
 	CONFIG_NAME = "filedebug"
 	CONFIG_ITEM_LINES = "max_lines"
 	CONFIG_ITEM_PATH = "path"
+	CONFIG_ITEM_MODE = "mode"
+	CONFIG_ITEM_RECORD_SIZE = "record_size"
 	MSG_FORMAT = "{0} [{1}:{2}] {3} = {4}; {5} // {6}\n"
 
+	## \brief Write text lines and remove the oldest lines when max_lines is exceeded
+	MODE_TRUNCATE = "truncate"
+	## \brief Write binary records to a ring of max_lines records
+	MODE_BINARY = "binary"
+	## \brief Append text lines to the active segment, rotate it by size or age and compress the old segments
+	MODE_ROTATE = "rotate"
+
 	def __init__(self, data_dict):
+		super().__init__()
 		self._logger = data_dict["log"]
-		
+		self._trace = None
+		self._segments = None
 
 	def _log(self, log_type, plugin, parameter_name, parameter_value, err_value, comments):
-		if isinstance(plugin, str):
-			plugin_name = plugin
-		else:
-			plugin_name = plugin.__class__.__name__
+		plugin_name = self.pluginName(plugin)
 
-		content = []
-		if os.path.exists(self._path):
-			with open(self._path, "r+") as f:
-				for line in f:
-					content.append(line.rstrip("\n"))
+		if self._trace:
+			self._trace.append(log_type, plugin_name, parameter_name, parameter_value, err_value, comments)
+			return
 
 		now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -53,6 +62,16 @@ class FileDebug(Debugger):
 		                                  parameter_name, parameter_value,\
 		                                  err_value, comments)
 
+		if self._segments:
+			self._segments.write(line)
+			return
+
+		content = []
+		if os.path.exists(self._path):
+			with open(self._path, "r+") as f:
+				for old_line in f:
+					content.append(old_line.rstrip("\n"))
+
 		if len(content) + 1 < self._max_lines or self._max_lines == 0:
 			with open(self._path, "a") as f:
 				f.write(line)
@@ -72,15 +91,10 @@ class FileDebug(Debugger):
 			section = None
 
 		if section:
-			try:
-				max_lines = section.get(self.CONFIG_ITEM_LINES)
-			except KeyError:
-				max_lines = None
-
-			try:
-				path = section.get(self.CONFIG_ITEM_PATH)
-			except KeyError:
-				path = None
+			max_lines = section.get(self.CONFIG_ITEM_LINES)
+			path = section.get(self.CONFIG_ITEM_PATH)
+			mode = section.get(self.CONFIG_ITEM_MODE)
+			record_size = section.get(self.CONFIG_ITEM_RECORD_SIZE)
 
 			self._enable()
 
@@ -88,11 +102,17 @@ class FileDebug(Debugger):
 			self._disable()
 			max_lines = None
 			path = None
+			mode = None
+			record_size = None
 
 		if path == None:
 			path = "/var/log/kam.debug"
 		if max_lines == None:
 			max_lines = 0
+		if mode == None:
+			mode = self.MODE_TRUNCATE
+		if record_size == None:
+			record_size = 512
 
 		self._path = path
 		try:
@@ -101,16 +121,75 @@ class FileDebug(Debugger):
 			self._max_lines = 0
 
 			if self._logger:
-				self._logger.log("[DebugLog] Failed to parse max_lines from {0}\n".format(max_lines))
+				self._logger.log(self, "Failed to parse max_lines from {0}\n".format(max_lines))
 		except TypeError:
 			self._max_lines = 0
 
+		try:
+			self._record_size = int(record_size)
+		except ValueError:
+			self._record_size = 512
+
+			if self._logger:
+				self._logger.log(self, "Failed to parse record_size from {0}\n".format(record_size))
+
 		directory = os.path.dirname(self._path)
 		if not os.path.exists(directory):
 			os.makedirs(directory)
 
+		self._mode = mode.strip()
+		self._openTrace()
+		err_value = self._openSegments(section)
+
+		err_value += self._loadFilterConfig(section)
+
 		if self._logger:
-			self._logger.log(self, "Config read, path={0}; max_lines={1}\n".format(self._path, self._max_lines))
+			self._logger.log(self, "Config read, path={0}; max_lines={1}; mode={2}; verbosity={3}; plugins={4}; types={5}; check_sample={6}; {7}\n".format(\
+			                       self._path, self._max_lines, self._mode, self._verbosity, self._plugins,\
+			                       self._types, self._check_sample, err_value))
+
+	## \brief Open the segments when the rotate mode is configured
+	#
+	# \return An error string, empty when the segment settings are parsed
+	def _openSegments(self, section):
+		if self._segments:
+			self._segments.close()
+			self._segments = None
+
+		if not self._enabled or self._mode != self.MODE_ROTATE:
+			return ""
+
+		try:
+			(self._segments, err_value) = SegmentFile.fromSection(self._path, section)
+		except OSError as ex:
+			if self._logger:
+				self._logger.log(self, "Failed to open {0}: {1}; falling back to mode {2}".format(self._path, str(ex), self.MODE_TRUNCATE))
+			self._mode = self.MODE_TRUNCATE
+			return ""
+
+		return err_value
+
+	## \brief Open the binary trace when the binary mode is configured
+	def _openTrace(self):
+		if self._trace:
+			self._trace.close()
+			self._trace = None
+
+		if not self._enabled or self._mode != self.MODE_BINARY:
+			return
+
+		if self._max_lines <= 0:
+			if self._logger:
+				self._logger.log(self, "The binary mode needs max_lines > 0, falling back to mode {0}".format(self.MODE_TRUNCATE))
+			self._mode = self.MODE_TRUNCATE
+			return
+
+		try:
+			self._trace = TraceWriter(self._path, self._max_lines, self._record_size)
+		except (OSError, ValueError) as ex:
+			if self._logger:
+				self._logger.log(self, "Failed to open trace {0}: {1}; falling back to mode {2}".format(self._path, str(ex), self.MODE_TRUNCATE))
+			self._mode = self.MODE_TRUNCATE
 
 def createInstance(data_dict):
 	return FileDebug(data_dict)
@@ -0,0 +1,299 @@
+##\package tracefile
+# \brief A compact binary format for debug records, stored in a ring file.
+#
+# Each record contains a timestamp and the ids of the plugin name, the log type and the parameter name
+# as fixed width fields. The ids refer to a string table, which is kept in a file next to the ring
+# (the path of the ring with the extension \e .strings). New strings are appended to this table,
+# so each name is only written once. The table holds at most MAX_STRINGS strings, so names which keep changing,
+# like the names of interfaces of containers, cannot let it grow forever. When it is full, new names are stored
+# in the record itself.
+#
+# After these fields, the error value, the comments and the parameter value follow in a compact
+# tagged encoding. Only when a record does not fit in the ring, the parameter value is stored as a
+# truncated string.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import struct
+import time
+from datetime import datetime
+
+from kam.utils.ringfile import RingFile
+
+## \brief The magic of a ring file which contains debug records
+MAGIC = b"KAMDBG01"
+## \brief The extension of the string table
+STRINGS_EXTENSION = ".strings"
+
+## \brief timestamp, plugin id, log type id, parameter name id, flags
+RECORD_HEADER = struct.Struct("<dHHHB")
+## \brief The parameter value did not fit and is stored as a truncated string
+FLAG_TRUNCATED = 0x01
+## \brief The plugin name, the log type or the parameter name is stored in the record, in this order before
+# the error value, and its id is INLINE_ID
+FLAG_INLINE_PLUGIN = 0x02
+FLAG_INLINE_TYPE = 0x04
+FLAG_INLINE_NAME = 0x08
+_INLINE_FLAGS = [ FLAG_INLINE_PLUGIN, FLAG_INLINE_TYPE, FLAG_INLINE_NAME ]
+
+## \brief The maximum amount of strings in the string table, the ids must fit in the header
+MAX_STRINGS = 4096
+INLINE_ID = 0xFFFF
+
+_TAG_NONE = 0
+_TAG_FALSE = 1
+_TAG_TRUE = 2
+_TAG_INT = 3
+_TAG_FLOAT = 4
+_TAG_STR = 5
+_TAG_LIST = 6
+_TAG_TUPLE = 7
+## \brief A string which is rendered as is, also when it is part of a list
+_TAG_RAW = 8
+
+_FLOAT = struct.Struct("<d")
+
+class TraceWriter:
+	## \brief Open or create a trace
+	#
+	# \param path The path of the ring file
+	# \param capacity The amount of records the trace can hold
+	# \param record_size The size of one record in bytes
+	def __init__(self, path, capacity, record_size):
+		self._ring = RingFile(path, capacity, record_size, MAGIC)
+		self._max_length = record_size - RingFile.LENGTH.size - RECORD_HEADER.size
+
+		strings_path = path + STRINGS_EXTENSION
+		self._ids = {}
+		if self._ring.wasCreated():
+			mode = "w"
+		else:
+			mode = "a+"
+			for (string_id, string) in enumerate(_readStrings(strings_path)):
+				self._ids[string] = string_id
+
+		self._strings = open(strings_path, mode)
+
+	## \brief Append a record to the trace
+	#
+	# \public
+	# For the parameters, check Debugger.log().
+	def append(self, log_type, plugin_name, parameter_name, parameter_value, err_value, comments):
+		flags = 0
+		ids = []
+
+		tail = bytearray()
+		for (string, flag) in zip([ plugin_name, log_type, str(parameter_name) ], _INLINE_FLAGS):
+			string_id = self._intern(string)
+			if string_id is None:
+				flags |= flag
+				string_id = INLINE_ID
+				_encode(string.replace("\n", " "), tail, True)
+			ids.append(string_id)
+
+		_encode(err_value, tail, True)
+		_encode(comments, tail, True)
+
+		value = bytearray()
+		_encode(parameter_value, value, True)
+
+		if len(tail) + len(value) > self._max_length:
+			flags |= FLAG_TRUNCATED
+			value = bytearray()
+			room = self._max_length - len(tail) - 6
+			_encode(str(parameter_value).encode("utf-8", "replace")[:max(room, 0)].decode("utf-8", "ignore"),\
+			        value, True)
+
+		header = RECORD_HEADER.pack(time.time(), ids[0], ids[1], ids[2], flags)
+
+		self._ring.append(header + tail + value)
+
+	def flush(self):
+		self._strings.flush()
+		self._ring.flush()
+
+	def close(self):
+		self._strings.close()
+		self._ring.close()
+
+	## \brief Return the id of a string, and add it to the string table when it is new
+	#
+	# \return The id, or None when the string is new and the table is full
+	def _intern(self, string):
+		string = string.replace("\n", " ")
+		string_id = self._ids.get(string)
+
+		if string_id is None:
+			if len(self._ids) >= MAX_STRINGS:
+				return None
+
+			string_id = len(self._ids)
+			self._ids[string] = string_id
+			self._strings.write(string)
+			self._strings.write("\n")
+			self._strings.flush()
+
+		return string_id
+
+## \brief Read a trace and render each record
+#
+# \param path The path of the ring file
+# \param msg_format The format of a line, with the same fields as FileDebug.MSG_FORMAT
+# \return A list of lines, the oldest first
+# \throws ValueError when the file is not a trace
+def render(path, msg_format):
+	records = RingFile.read(path, MAGIC)
+	strings = _readStrings(path + STRINGS_EXTENSION)
+	lines = []
+
+	for record in records:
+		(timestamp, plugin_id, type_id, name_id, flags) = RECORD_HEADER.unpack_from(record, 0)
+		offset = RECORD_HEADER.size
+		names = []
+
+		try:
+			for (string_id, flag) in zip([ plugin_id, type_id, name_id ], _INLINE_FLAGS):
+				if flags & flag:
+					(name, offset) = _decode(record, offset, True)
+				else:
+					name = _string(strings, string_id)
+				names.append(name)
+
+			(err_value, offset) = _decode(record, offset, True)
+			(comments, offset) = _decode(record, offset, True)
+			(parameter_value, offset) = _decode(record, offset, True)
+		except (IndexError, ValueError, struct.error):
+			names = (names + [ "<corrupt record>" ] * 3)[:3]
+			err_value = comments = ""
+			parameter_value = "<corrupt record>"
+
+		if flags & FLAG_TRUNCATED:
+			parameter_value += "..."
+
+		now = datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+		lines.append(msg_format.format(now, names[0], names[1], names[2], parameter_value, err_value, comments))
+
+	return lines
+
+def _readStrings(path):
+	strings = []
+	if os.path.exists(path):
+		with open(path, "r") as f:
+			for line in f:
+				strings.append(line.rstrip("\n"))
+
+	return strings
+
+def _string(strings, string_id):
+	if string_id < len(strings):
+		return strings[string_id]
+	else:
+		return "<{0}>".format(string_id)
+
+def _encodeVarint(value, out):
+	while value >= 0x80:
+		out.append((value & 0x7F) | 0x80)
+		value >>= 7
+	out.append(value)
+
+def _decodeVarint(buf, offset):
+	value = 0
+	shift = 0
+	while True:
+		byte = buf[offset]
+		offset += 1
+		value |= (byte & 0x7F) << shift
+		if byte < 0x80:
+			return (value, offset)
+		shift += 7
+
+def _encodeString(tag, string, out):
+	data = string.encode("utf-8", "replace")
+	out.append(tag)
+	_encodeVarint(len(data), out)
+	out += data
+
+## \brief Encode a value
+#
+# Values which are not a basic type are stored as the string they are rendered to.
+# At the top level this is str(value), inside a list this is repr(value), the same as the text format.
+def _encode(value, out, top_level):
+	if value is None:
+		out.append(_TAG_NONE)
+	elif value is False:
+		out.append(_TAG_FALSE)
+	elif value is True:
+		out.append(_TAG_TRUE)
+	elif isinstance(value, int) and -2**63 <= value < 2**63:
+		out.append(_TAG_INT)
+		_encodeVarint((value << 1) ^ (value >> 63), out)
+	elif isinstance(value, float):
+		out.append(_TAG_FLOAT)
+		out += _FLOAT.pack(value)
+	elif isinstance(value, str):
+		_encodeString(_TAG_STR, value, out)
+	elif isinstance(value, (list, tuple)):
+		out.append(_TAG_LIST if isinstance(value, list) else _TAG_TUPLE)
+		_encodeVarint(len(value), out)
+		for item in value:
+			_encode(item, out, False)
+	else:
+		_encodeString(_TAG_RAW, str(value) if top_level else repr(value), out)
+
+## \brief Decode a value and render it as the text format would do
+#
+# \return A tuple (rendered string, offset after the value)
+def _decode(buf, offset, top_level):
+	tag = buf[offset]
+	offset += 1
+
+	if tag == _TAG_NONE:
+		return ("None", offset)
+	elif tag == _TAG_FALSE:
+		return ("False", offset)
+	elif tag == _TAG_TRUE:
+		return ("True", offset)
+	elif tag == _TAG_INT:
+		(value, offset) = _decodeVarint(buf, offset)
+		return (str((value >> 1) ^ -(value & 1)), offset)
+	elif tag == _TAG_FLOAT:
+		(value,) = _FLOAT.unpack_from(buf, offset)
+		return (str(value), offset + _FLOAT.size)
+	elif tag == _TAG_STR or tag == _TAG_RAW:
+		(length, offset) = _decodeVarint(buf, offset)
+		string = bytes(buf[offset:offset + length]).decode("utf-8")
+		if tag == _TAG_STR and not top_level:
+			string = repr(string)
+		return (string, offset + length)
+	elif tag == _TAG_LIST or tag == _TAG_TUPLE:
+		(count, offset) = _decodeVarint(buf, offset)
+		items = []
+		for i in range(0, count):
+			(item, offset) = _decode(buf, offset, False)
+			items.append(item)
+
+		if tag == _TAG_LIST:
+			return ("[" + ", ".join(items) + "]", offset)
+		elif count == 1:
+			return ("(" + items[0] + ",)", offset)
+		else:
+			return ("(" + ", ".join(items) + ")", offset)
+	else:
+		raise ValueError("Unknown tag {0}".format(tag))
@@ -25,47 +25,102 @@ import os
 import syslog
 from datetime import datetime
 from kam.modules.plugins.log.logger import Logger
+from kam.utils.ringfile import RingFile
+import kam.utils.ringfile as ringfile
+from kam.utils.segmentfile import SegmentFile
 
 class FileLog(Logger):
 	CONFIG_NAME = "filelog"
 	CONFIG_ITEM_LINES = "max_lines"
 	CONFIG_ITEM_PATH = "path"
+	CONFIG_ITEM_MODE = "mode"
+	CONFIG_ITEM_LINE_SIZE = "line_size"
+
+	## \brief Keep the log as text and remove the oldest lines when max_lines is exceeded
+	MODE_TRUNCATE = "truncate"
+	## \brief Keep the log in a ring file of max_lines records of line_size bytes, an existing text log is renamed
+	MODE_RING = "ring"
+	## \brief Append to the active segment, rotate it by size or age and compress the old segments
+	MODE_ROTATE = "rotate"
+
+	## \brief The magic of the ring file, so the reader can check it opens a log
+	RING_MAGIC = b"KAMLOG01"
+
+	MODES = [ MODE_TRUNCATE, MODE_RING, MODE_ROTATE ]
 
 	def __init__(self, data_dict):
-		super().__init__()	
+		super().__init__()
+		self._ring = None
+		self._segments = None
+		self._dirty = False
+
+	def _log(self, plugin, msg):
+		self._logRecords([ (datetime.now(), plugin, msg) ])
+
+	def _logRecords(self, records):
+		lines = []
+		for (now, plugin, msg) in records:
+			lines.append(self._formatLine(now, plugin, msg))
+
+		if self._ring:
+			for line in lines:
+				self._ring.append(line.encode("utf-8", "replace"))
+		elif self._segments:
+			self._segments.write("\n".join(lines) + "\n")
+		else:
+			self._writeLines(lines)
+
+		self._dirty = True
 
-	def log(self, plugin, msg):
+	def flush(self):
+		if not self._dirty:
+			return
+
+		self._dirty = False
+		if self._ring:
+			self._ring.flush()
+		elif self._segments:
+			self._segments.flush()
+		elif os.path.exists(self._path):
+			with open(self._path, "a") as f:
+				os.fsync(f.fileno())
+
+	## \brief Create the line as it is written to the log, without the trailing newline
+	def _formatLine(self, now, plugin, msg):
 		if isinstance(plugin, str):
 			plugin_name = plugin
 		else:
 			plugin_name = plugin.__class__.__name__
 
+		# we do not allow to print multiple lines, make one line of it!
+		msg = msg.rstrip("\n").replace("\n", "; ")
+		return "{0} [{1}]: {2}".format(now.strftime("%Y-%m-%d %H:%M:%S"),\
+		                               plugin_name,\
+		                               msg)
+
+	## \brief Append lines to the text log and remove the oldest lines when max_lines is exceeded
+	def _writeLines(self, lines):
 		content = []
-		if os.path.exists(self._path):
-			with open(self._path, "r+") as f:
+		if self._max_lines != 0 and os.path.exists(self._path):
+			with open(self._path, "r") as f:
 				for line in f:
 					content.append(line.rstrip("\n"))
 
-		# we do not allow to print multiple lines, make one line of it!
-		msg = msg.rstrip("\n").replace("\n", "; ")
-		line = "{0} [{1}]: {2}\n".format(\
-		                            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),\
-		                            plugin_name,\
-		                            msg)
-		                            
-
-		if len(content) + 1 < self._max_lines or self._max_lines == 0:
+		if len(content) + len(lines) <= self._max_lines or self._max_lines == 0:
 			with open(self._path, "a") as f:
-				f.write(line)
+				for line in lines:
+					f.write(line)
+					f.write("\n")
 		else:
-			start = len(content) - self._max_lines - 1
+			content.extend(lines)
+			start = len(content) - self._max_lines
 			with open(self._path, "w") as f:
 				f.write("\n".join(content[start:]))
 				f.write("\n")
-				f.write(line)
 
 	def loadConfig(self, config):
 		config_name = self.CONFIG_NAME
+		err_value = ""
 
 		try:
 			section = config[config_name]
@@ -73,27 +128,28 @@ class FileLog(Logger):
 			section = None
 
 		if section:
-			try:
-				max_lines = section.get(self.CONFIG_ITEM_LINES)
-			except KeyError:
-				max_lines = None
-
-			try:
-				path = section.get(self.CONFIG_ITEM_PATH)
-			except KeyError:
-				path = None
+			max_lines = section.get(self.CONFIG_ITEM_LINES)
+			path = section.get(self.CONFIG_ITEM_PATH)
+			mode = section.get(self.CONFIG_ITEM_MODE)
+			line_size = section.get(self.CONFIG_ITEM_LINE_SIZE)
 
 			self._enable()
 		else:
 			self._disable()
 			max_lines = None
 			path = None
+			mode = None
+			line_size = None
 			syslog.syslog("[Kam-FileLog] No file log specified. File logging not enabled")
 
 		if path == None:
 			path = "/var/log/kam.log"
 		if max_lines == None:
 			max_lines = 200
+		if mode == None or not mode.strip():
+			mode = self.MODE_TRUNCATE
+		if line_size == None:
+			line_size = 256
 
 		self._path = path
 		try:
@@ -106,11 +162,83 @@ class FileLog(Logger):
 			self._max_lines = 0
 			syslog.syslog("[Kam-FileLog] Failed to parse max_lines from {0}; Type Error {1}\n".format(max_lines, str(ex)))
 
+		try:
+			self._line_size = int(line_size)
+		except ValueError as ex:
+			self._line_size = 256
+			syslog.syslog("[Kam-FileLog] Failed to parse line_size from {0}; ValueError: {1}\n".format(line_size, str(ex)))
+
 		directory = os.path.dirname(self._path)
 		if not os.path.exists(directory):
 			os.makedirs(directory)
 
-		self.log(self, "Config read, path={0}; max_lines={1}\n".format(self._path, self._max_lines))
+		self._mode = mode.strip()
+		if self._mode not in self.MODES:
+			err_value += "Unknown {0}: {1}, using {2}; ".format(self.CONFIG_ITEM_MODE, self._mode, self.MODE_TRUNCATE)
+			self._mode = self.MODE_TRUNCATE
+
+		err_value += self._openRing()
+		self._openSegments(section)
+
+		self.log(self, "Config read, path={0}; max_lines={1}; mode={2}; {3} {4}\n".format(\
+		               self._path, self._max_lines, self._mode, self._segments if self._segments else "", err_value))
+
+	## \brief Open the segments when the rotate mode is configured
+	def _openSegments(self, section):
+		if self._segments:
+			self._segments.close()
+			self._segments = None
+
+		if not self.isEnabled() or self._mode != self.MODE_ROTATE:
+			return
+
+		try:
+			(self._segments, err_value) = SegmentFile.fromSection(self._path, section)
+		except OSError as ex:
+			syslog.syslog("[Kam-FileLog] Failed to open {0}: {1}; falling back to mode {2}".format(self._path, str(ex), self.MODE_TRUNCATE))
+			self._mode = self.MODE_TRUNCATE
+			return
+
+		if err_value:
+			syslog.syslog("[Kam-FileLog] Failed to parse the segment settings: {0}".format(err_value))
+
+	## \brief Open the ring file when the ring mode is configured
+	#
+	# \return A message to log, empty when there is nothing to report
+	def _openRing(self):
+		if self._ring:
+			self._ring.close()
+			self._ring = None
+
+		if not self.isEnabled():
+			return ""
+
+		if self._mode != self.MODE_RING:
+			# The other modes cannot append to the ring of a previous config
+			if not ringfile.hasMagic(self._path, self.RING_MAGIC):
+				return ""
+
+			try:
+				return "{0} is a ring file, it is renamed to {1}; ".format(self._path, ringfile.moveAside(self._path))
+			except OSError as ex:
+				return "Cannot rename the ring file {0}: {1}; ".format(self._path, str(ex))
+
+		if self._max_lines <= 0:
+			syslog.syslog("[Kam-FileLog] The ring mode needs max_lines > 0, falling back to mode {0}".format(self.MODE_TRUNCATE))
+			self._mode = self.MODE_TRUNCATE
+			return ""
+
+		try:
+			self._ring = RingFile(self._path, self._max_lines, self._line_size, self.RING_MAGIC)
+		except (OSError, ValueError) as ex:
+			syslog.syslog("[Kam-FileLog] Failed to open ring file {0}: {1}; falling back to mode {2}".format(self._path, str(ex), self.MODE_TRUNCATE))
+			self._mode = self.MODE_TRUNCATE
+			return ""
+
+		if self._ring.getMovedTo():
+			return "{0} was not a ring file, it is renamed to {1}; ".format(self._path, self._ring.getMovedTo())
+
+		return ""
 
 def createInstance(data_dict):
 	return FileLog(data_dict)
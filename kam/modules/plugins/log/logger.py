@@ -46,12 +46,40 @@ class Logger:
 	def _log(self, plugin, msg):
 		raise KamFunctionNotImplemented("log not implemented in class {0}".format(self.__class__.__name__))
 
+	## \brief Log a batch of records at once
+	# \public
+	#
+	# This is a wrapper which checks if the logger is enabled. Then it calls the _logRecords() function.
+	#
+	# \param records A list of tuples (time, plugin, msg), where time is a \e datetime object which tells when the message was logged.
+	def logRecords(self, records):
+		if self._enabled:
+			self._logRecords(records)
+
+	## \brief The actual implementation to log a batch of records
+	# \protected
+	#
+	# The default implementation logs each record with _log(). Override it when the logger can write a batch cheaper.
+	def _logRecords(self, records):
+		for (_, plugin, msg) in records:
+			self._log(plugin, msg)
+
+	## \brief Make sure everything logged so far is written to the storage
+	# \public
+	def flush(self):
+		pass
+
 	def _enable(self):
 		self._enabled = True
 
 	def _disable(self):
 		self._enabled = False
 
+	## \brief Check if the logger is enabled
+	# \public
+	def isEnabled(self):
+		return self._enabled
+
 	## \brief Load the configuration
 	# \public
 	# 
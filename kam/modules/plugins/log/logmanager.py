@@ -3,6 +3,10 @@
 #
 # This manager can hold multiple loggers and will delegate calls to the log() function to them.
 #
+# When \e log_async is enabled in the section \e [global], the messages are put on a bounded queue.
+# A single writer thread drains the queue and passes the messages in batches to the loggers,
+# so the caller never waits for the disk.
+#
 # \author Philip Luyckx
 # \copyright GNU Public License
 
@@ -21,19 +25,184 @@
 # You should have received a copy of the GNU General Public License
 # along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
 
+import queue
+import sys
+import threading
+from datetime import datetime
+
+import kam.utils.utils as utils
 from kam.modules.plugins.log.logger import Logger
 
 class LogManager(Logger):
-	
+	CONFIG_NAME = "global"
+	CONFIG_ITEM_ASYNC = "log_async"
+	CONFIG_ITEM_QUEUE_SIZE = "log_queue_size"
+	CONFIG_ITEM_QUEUE_FULL = "log_queue_full"
+
+	## \brief Drop new messages when the queue is full
+	POLICY_DROP = "drop"
+	## \brief Wait until the writer thread made room in the queue
+	POLICY_BLOCK = "block"
+
+	## \brief The maximum amount of messages passed to the loggers at once
+	BATCH_SIZE = 256
+
 	def __init__(self):
 		super().__init__()
 		self._loggers = []
 
+		self._queue = None
+		self._writer = None
+		self._policy = self.POLICY_DROP
+		self._dropped = 0
+		self._dropped_lock = threading.Lock()
+		# The checks can run in threads, do not let their messages interleave in the log files
+		self._sync_lock = threading.Lock()
+
 	def _log(self, plugin, msg):
-		for logger in self._loggers:
-			logger.log(plugin, msg)
+		log_queue = self._queue
+		if log_queue is None:
+			with self._sync_lock:
+				for logger in self._loggers:
+					logger.log(plugin, msg)
+			return
+
+		record = (datetime.now(), plugin, msg)
+		if self._policy == self.POLICY_BLOCK:
+			log_queue.put(record)
+		else:
+			try:
+				log_queue.put_nowait(record)
+			except queue.Full:
+				with self._dropped_lock:
+					self._dropped += 1
 
 	def add(self, logger):
 		if isinstance(logger, Logger):
 			self._enable()
 			self._loggers.append(logger)
+
+	## \brief Load the configuration and start the writer thread when the asynchronous mode is enabled.
+	#
+	# Call this function after all loggers are added.
+	#
+	# \public
+	# \param config The configuration in the form of a \e configparser object
+	def loadConfig(self, config):
+		try:
+			section = config[self.CONFIG_NAME]
+		except KeyError:
+			section = None
+
+		if section:
+			enable_async = utils.toBool(section.get(self.CONFIG_ITEM_ASYNC))
+			queue_size = section.get(self.CONFIG_ITEM_QUEUE_SIZE)
+			policy = section.get(self.CONFIG_ITEM_QUEUE_FULL)
+		else:
+			enable_async = False
+			queue_size = None
+			policy = None
+
+		err_value = ""
+		try:
+			queue_size = int(queue_size) if queue_size else 1000
+		except ValueError as ex:
+			err_value = str(ex)
+			queue_size = 1000
+
+		if queue_size <= 0:
+			queue_size = 1000
+
+		policy = policy.strip() if policy else self.POLICY_DROP
+		if policy not in [ self.POLICY_DROP, self.POLICY_BLOCK ]:
+			err_value += ";Unknown value for {0}: {1}, using {2}".format(self.CONFIG_ITEM_QUEUE_FULL, policy, self.POLICY_DROP)
+			policy = self.POLICY_DROP
+
+		self.stop()
+		self._policy = policy
+
+		if enable_async:
+			self._queue = queue.Queue(queue_size)
+			self._writer = threading.Thread(target=self._writeLoop, name="kam-log-writer", daemon=True)
+			self._writer.start()
+
+		self.log(self, "Config loaded: async={0}; queue_size={1}; queue_full={2}; {3}".format(\
+		               enable_async, queue_size, policy, err_value))
+
+	## \brief Stop the writer thread after it wrote all queued messages.
+	#
+	# After this call, messages are passed synchronously to the loggers again.
+	#
+	# \public
+	def stop(self):
+		if self._writer is None:
+			return
+
+		writer = self._writer
+		self._queue.put(None)
+		writer.join()
+
+		self._writer = None
+		self._queue = None
+
+	## \brief The writer thread. It takes everything which is queued, and passes it as one batch to each logger.
+	def _writeLoop(self):
+		running = True
+
+		while running:
+			records = [ self._queue.get() ]
+			while len(records) < self.BATCH_SIZE:
+				try:
+					records.append(self._queue.get_nowait())
+				except queue.Empty:
+					break
+
+			if None in records:
+				running = False
+				records = [ record for record in records if record is not None ]
+
+			with self._dropped_lock:
+				dropped = self._dropped
+				self._dropped = 0
+
+			if dropped > 0:
+				records.append((datetime.now(), self, "The log queue was full, {0} messages are dropped".format(dropped)))
+
+			if len(records) == 0:
+				continue
+
+			# A logger which fails, for example because the disk is full, must not stop this thread,
+			# or log() blocks or drops everything from now on
+			failed = []
+			for logger in self._loggers:
+				try:
+					logger.logRecords(records)
+					logger.flush()
+				except Exception as ex:
+					failed.append((logger, ex))
+
+			if len(failed) > 0:
+				self._reportFailures(failed)
+
+	## \brief Report the loggers which failed to the loggers which still work, and to stderr
+	def _reportFailures(self, failed):
+		records = [ (datetime.now(), self, "Writing to {0} failed: {1}".format(logger.__class__.__name__, str(ex)))\
+		            for (logger, ex) in failed ]
+		failed_loggers = [ logger for (logger, _) in failed ]
+
+		for logger in self._loggers:
+			if logger in failed_loggers:
+				continue
+
+			try:
+				logger.logRecords(records)
+				logger.flush()
+			except Exception:
+				pass
+
+		try:
+			for (_, _, msg) in records:
+				sys.stderr.write(msg + "\n")
+			sys.stderr.flush()
+		except (OSError, ValueError):
+			pass # no stderr after the daemon forked
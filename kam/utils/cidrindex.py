@@ -0,0 +1,62 @@
+##\package cidrindex
+# \brief An index to check if an address is in one of many networks.
+#
+# The networks are converted to address ranges, which are sorted and merged once when the index is built.
+# A lookup is a binary search in these ranges, so it costs O(log n) for n networks instead of O(n).
+# IPv4 and IPv6 networks are kept in separate indexes.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+from bisect import bisect_right
+
+class CidrIndex:
+	## \brief Build the index
+	#
+	# \param ranges A list of tuples (version, first address, last address), the addresses as integers
+	def __init__(self, ranges):
+		self._starts = {}
+		self._ends = {}
+
+		for version in (4, 6):
+			merged = []
+			for (first, last) in sorted([ (first, last) for (v, first, last) in ranges if v == version ]):
+				if len(merged) > 0 and first <= merged[-1][1] + 1:
+					if last > merged[-1][1]:
+						merged[-1][1] = last
+				else:
+					merged.append([first, last])
+
+			self._starts[version] = [ first for (first, _) in merged ]
+			self._ends[version] = [ last for (_, last) in merged ]
+
+	## \brief Check if an address is in one of the networks
+	#
+	# \param version 4 or 6
+	# \param ip The address as an integer
+	def contains(self, version, ip):
+		starts = self._starts.get(version)
+		if not starts:
+			return False
+
+		i = bisect_right(starts, ip) - 1
+		return i >= 0 and ip <= self._ends[version][i]
+
+	## \brief The amount of ranges after merging, for the given version
+	def rangeCount(self, version):
+		return len(self._starts.get(version, []))
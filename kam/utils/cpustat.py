@@ -0,0 +1,74 @@
+##\package cpustat
+# \brief Read the time each cpu spent busy from /proc/stat.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+PROC_STAT = "/proc/stat"
+
+## \brief Read the times of each online cpu
+#
+# The busy time is the sum of user, nice, system, irq, softirq and steal. The time spent in guests is not
+# added, because the kernel already counts it in user and nice. The total time adds idle and iowait.
+#
+# \param path The path of the stat file
+# \return A list of tuples (cpu id, busy time, total time), the times in clock ticks
+def readCpuTimes(path=PROC_STAT):
+	with open(path, "rb") as f:
+		lines = f.read().splitlines()
+
+	times = []
+	for line in lines:
+		if not line.startswith(b"cpu"):
+			# the cpu lines are at the start of the file
+			if len(times) > 0:
+				break
+			continue
+
+		fields = line.split()
+		if len(fields[0]) == 3:
+			continue # the line with the sum of all cpus
+
+		# cpuN user nice system idle iowait irq softirq steal guest guest_nice
+		values = [ int(value) for value in fields[1:9] ] + [ 0 ] * (9 - len(fields))
+		(user, nice, system, idle, iowait, irq, softirq, steal) = values
+		busy = user + nice + system + irq + softirq + steal
+		times.append((int(fields[0][3:]), busy, busy + idle + iowait))
+
+	return times
+
+## \brief Parse a list of cpus in the notation of the kernel, for example "0-3,8"
+#
+# \return A set with the ids of the cpus
+# \throws ValueError when the list cannot be parsed
+def parseCpuList(cpu_list):
+	cpus = set()
+	for item in cpu_list.split(","):
+		item = item.strip()
+		if not item:
+			continue
+
+		(first, _, last) = item.partition("-")
+		first = int(first)
+		last = int(last) if last else first
+		if last < first:
+			raise ValueError("Invalid cpu range {0}".format(item))
+
+		cpus.update(range(first, last + 1))
+
+	return cpus
@@ -0,0 +1,205 @@
+##\package inetdiag
+# \brief Query the TCP sockets of the kernel through the netlink sock_diag interface (inet_diag).
+#
+# Unlike the tables in /proc/net, the kernel filters the sockets on their state and on their remote address
+# before they are returned, and the byte counters of each socket are read from its tcp_info.
+# The address filter is compiled to inet_diag bytecode. When the bytecode would be too large, no address
+# filter is sent to the kernel and the caller has to filter the sockets itself.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import errno
+import socket
+import struct
+
+import kam.utils.netsockets as netsockets
+
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+INET_DIAG_REQ_BYTECODE = 1
+INET_DIAG_INFO = 2
+
+INET_DIAG_BC_JMP = 1
+INET_DIAG_BC_D_COND = 8
+
+## \brief The largest bytecode which is sent to the kernel, larger filters are applied by the caller
+MAX_BYTECODE = 16 * 1024
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_NLATTR = struct.Struct("=HH")
+_NLMSGERR = struct.Struct("=i")
+# family, protocol, extensions, pad, states, sport, dport, src, dst, interface, cookie
+_REQ_V2 = struct.Struct("=BBBxIHH16s16sI8s")
+_DIAG_MSG = struct.Struct("=BBBB2s2s16s16sI8sIIIII")
+_BC_OP = struct.Struct("=BBH")
+_HOSTCOND = struct.Struct("=BBxxi")
+_TCP_INFO_BYTES = struct.Struct("=QQ")
+
+## \brief The offset of tcpi_bytes_acked in struct tcp_info, followed by tcpi_bytes_received
+_TCP_INFO_BYTES_OFFSET = 120
+
+_FAMILIES = { "tcp": socket.AF_INET, "tcp6": socket.AF_INET6 }
+_V4_MAPPED = b"\0" * 10 + b"\xff\xff"
+
+## \brief Convert state names to the bit mask of the request
+#
+# \param states A list of names of netsockets.STATES
+# \throws KeyError when a state name is unknown
+def stateMask(states):
+	mask = 0
+	for state in states:
+		mask |= 1 << netsockets.STATES[state.strip().upper()]
+
+	return mask
+
+## \brief Compile a list of networks to bytecode which accepts the sockets connected to one of them
+#
+# For each network there is a condition on the remote address, followed by a jump to the end which accepts
+# the socket. When the condition does not match, the jump is skipped. The last condition jumps past the end,
+# which rejects the socket.
+#
+# \param networks A list of ipaddress.IPv4Network or ipaddress.IPv6Network objects
+# \return The bytecode, None when it is larger than MAX_BYTECODE
+def compileFilter(networks):
+	conditions = []
+	for network in networks:
+		family = socket.AF_INET if network.version == 4 else socket.AF_INET6
+		conditions.append(_HOSTCOND.pack(family, network.prefixlen, -1) + network.network_address.packed)
+
+	size = sum([ _BC_OP.size + len(cond) + _BC_OP.size for cond in conditions ])
+	if size > MAX_BYTECODE or len(conditions) == 0:
+		return None
+
+	code = []
+	remaining = size
+	for (i, cond) in enumerate(conditions):
+		cond_size = _BC_OP.size + len(cond)
+		jump_size = cond_size + _BC_OP.size
+		no = jump_size if i < len(conditions) - 1 else jump_size + 4
+
+		code.append(_BC_OP.pack(INET_DIAG_BC_D_COND, cond_size, no) + cond)
+		code.append(_BC_OP.pack(INET_DIAG_BC_JMP, _BC_OP.size, remaining - cond_size))
+		remaining -= jump_size
+
+	return b"".join(code)
+
+class TcpSocket:
+	__slots__ = ("version", "address", "cookie", "bytes_acked", "bytes_received")
+
+	def __init__(self, version, address, cookie, bytes_acked, bytes_received):
+		self.version = version
+		self.address = address
+		self.cookie = cookie
+		self.bytes_acked = bytes_acked
+		self.bytes_received = bytes_received
+
+class InetDiag:
+	def __init__(self):
+		self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_SOCK_DIAG)
+		self._seq = 0
+
+	def close(self):
+		self._socket.close()
+
+	## \brief Get the TCP sockets in the given states
+	#
+	# \public
+	# \param protocols A list of names of netsockets.PROTOCOLS, only tcp and tcp6 are used
+	# \param state_mask A mask returned by stateMask()
+	# \param bytecode A filter returned by compileFilter(), or None to get all sockets
+	# \return A list of TcpSocket objects. An IPv4 address mapped in an IPv6 socket is returned as an IPv4 address.
+	#         The byte counters are None when the kernel does not report them.
+	# \throws OSError when the kernel refuses the request
+	def query(self, protocols, state_mask, bytecode=None):
+		sockets = []
+
+		for protocol in protocols:
+			family = _FAMILIES.get(protocol)
+			if family is None:
+				continue
+
+			self._seq += 1
+			request = _REQ_V2.pack(family, socket.IPPROTO_TCP, 1 << (INET_DIAG_INFO - 1), state_mask,\
+			                       0, 0, b"", b"", 0, b"\xff" * 8)
+			if bytecode:
+				request += _NLATTR.pack(_NLATTR.size + len(bytecode), INET_DIAG_REQ_BYTECODE) + bytecode
+
+			header = _NLMSGHDR.pack(_NLMSGHDR.size + len(request), SOCK_DIAG_BY_FAMILY, NLM_F_REQUEST | NLM_F_DUMP, self._seq, 0)
+			self._socket.send(header + request)
+			self._receive(sockets)
+
+		return sockets
+
+	def _receive(self, sockets):
+		while True:
+			data = self._socket.recv(65536)
+			offset = 0
+
+			while offset + _NLMSGHDR.size <= len(data):
+				(length, msg_type, _, seq, _) = _NLMSGHDR.unpack_from(data, offset)
+				if length < _NLMSGHDR.size:
+					return
+
+				if seq == self._seq:
+					if msg_type == NLMSG_DONE:
+						return
+					elif msg_type == NLMSG_ERROR:
+						(error,) = _NLMSGERR.unpack_from(data, offset + _NLMSGHDR.size)
+						if error != 0:
+							raise OSError(-error, errno.errorcode.get(-error, str(-error)))
+						return
+					elif msg_type == SOCK_DIAG_BY_FAMILY:
+						sockets.append(self._parse(data, offset + _NLMSGHDR.size, offset + length))
+
+				offset += (length + 3) & ~3
+
+	def _parse(self, data, start, end):
+		(family, _, _, _, _, _, _, dst, _, cookie, _, _, _, _, _) = _DIAG_MSG.unpack_from(data, start)
+
+		if family == socket.AF_INET:
+			version = 4
+			address = int.from_bytes(dst[:4], "big")
+		elif dst[:12] == _V4_MAPPED:
+			version = 4
+			address = int.from_bytes(dst[12:], "big")
+		else:
+			version = 6
+			address = int.from_bytes(dst, "big")
+
+		bytes_acked = None
+		bytes_received = None
+
+		offset = start + _DIAG_MSG.size
+		while offset + _NLATTR.size <= end:
+			(length, attr_type) = _NLATTR.unpack_from(data, offset)
+			if length < _NLATTR.size:
+				break
+
+			if attr_type == INET_DIAG_INFO and length - _NLATTR.size >= _TCP_INFO_BYTES_OFFSET + _TCP_INFO_BYTES.size:
+				(bytes_acked, bytes_received) = _TCP_INFO_BYTES.unpack_from(data, offset + _NLATTR.size + _TCP_INFO_BYTES_OFFSET)
+
+			offset += (length + 3) & ~3
+
+		return TcpSocket(version, address, cookie, bytes_acked, bytes_received)
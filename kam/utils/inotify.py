@@ -0,0 +1,124 @@
+##\package inotify
+# \brief A minimal wrapper around the inotify interface of the kernel, using ctypes.
+#
+# The inotify file descriptor is non-blocking, so it can be registered with the pollmanager.
+# Call events() when it is readable to get the events which arrived.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import ctypes
+import ctypes.util
+import os
+import struct
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+## \brief The queue of the kernel overflowed, events were lost
+IN_Q_OVERFLOW = 0x00004000
+## \brief The watch was removed, for example because the directory was removed
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+## \brief The event is about a directory in the watched directory
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = os.O_CLOEXEC
+IN_NONBLOCK = os.O_NONBLOCK
+
+_EVENT = struct.Struct("=iIII")
+
+_libc = None
+
+def _getLibc():
+	global _libc
+	if _libc is None:
+		_libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+		_libc.inotify_init1.argtypes = [ ctypes.c_int ]
+		_libc.inotify_add_watch.argtypes = [ ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32 ]
+		_libc.inotify_rm_watch.argtypes = [ ctypes.c_int, ctypes.c_int ]
+
+	return _libc
+
+def _check(result):
+	if result < 0:
+		errno = ctypes.get_errno()
+		raise OSError(errno, os.strerror(errno))
+
+	return result
+
+class Inotify:
+	## \brief Create an inotify instance
+	#
+	# \throws OSError when inotify is not available
+	def __init__(self):
+		self._libc = _getLibc()
+		self._fd = _check(self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+	def fileno(self):
+		return self._fd
+
+	def close(self):
+		if self._fd >= 0:
+			os.close(self._fd)
+			self._fd = -1
+
+	## \brief Watch a file or a directory
+	#
+	# \public
+	# \param path The path to watch
+	# \param mask The IN_* events to watch
+	# \return The watch descriptor, which is returned with the events of this path
+	# \throws OSError when the path cannot be watched
+	def addWatch(self, path, mask):
+		return _check(self._libc.inotify_add_watch(self._fd, os.fsencode(path), mask))
+
+	## \brief Stop watching a path
+	#
+	# \public
+	# \param wd The watch descriptor returned by addWatch()
+	def removeWatch(self, wd):
+		self._libc.inotify_rm_watch(self._fd, wd)
+
+	## \brief Read the events which arrived
+	#
+	# \public
+	# \return A list of tuples (watch descriptor, mask, name). The name is the name of the file in a watched
+	#         directory, an empty string for events of the watched path itself.
+	def events(self):
+		events = []
+
+		while True:
+			try:
+				data = os.read(self._fd, 65536)
+			except BlockingIOError:
+				break
+
+			offset = 0
+			while offset + _EVENT.size <= len(data):
+				(wd, mask, _, length) = _EVENT.unpack_from(data, offset)
+				offset += _EVENT.size
+				name = data[offset:offset + length].rstrip(b"\0")
+				offset += length
+
+				events.append((wd, mask, os.fsdecode(name)))
+
+		return events
@@ -0,0 +1,224 @@
+##\package inputdevices
+# \brief Find the input devices and classify them by their capabilities.
+#
+# The kernel publishes the events, keys and axes each device supports as bitmaps in
+# /sys/class/input/eventN/device/capabilities. A device is classified from these bitmaps, not from its name,
+# so for example a wireless receiver or a touchpad is found too. A device can have more than one type,
+# for example a keyboard with a touchpad.
+#
+# The types are cached by device name and the inode of its entry in /sys/class/input, so a device which is
+# removed and added again under the same name is classified again. The list of devices is only read again
+# after a device event of the udevmonitor.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import struct
+
+TYPE_KEYBOARD = "keyboard"
+TYPE_MOUSE = "mouse"
+TYPE_TOUCHPAD = "touchpad"
+TYPE_TOUCHSCREEN = "touchscreen"
+TYPE_TABLET = "tablet"
+TYPE_JOYSTICK = "joystick"
+
+## \brief The types of devices which move a pointer
+POINTER_TYPES = [ TYPE_MOUSE, TYPE_TOUCHPAD, TYPE_TOUCHSCREEN, TYPE_TABLET ]
+
+# The constants of linux/input-event-codes.h
+EV_KEY = 0x01
+EV_REL = 0x02
+EV_ABS = 0x03
+REL_X = 0x00
+REL_Y = 0x01
+ABS_X = 0x00
+ABS_Y = 0x01
+BTN_MOUSE = 0x110
+BTN_JOYSTICK = 0x120
+BTN_GAMEPAD = 0x130
+BTN_TOOL_PEN = 0x140
+BTN_TOOL_FINGER = 0x145
+BTN_TOUCH = 0x14a
+BTN_STYLUS = 0x14b
+
+## \brief A keyboard has all keys from KEY_ESC (1) up to KEY_S (31), like udev tests it
+_KEYBOARD_KEYS = 0xfffffffe
+
+## \brief The bitmaps are written as words of the size of a long, the most significant word first
+_WORD_BITS = struct.calcsize("L") * 8
+
+class InputDevices:
+	CLASS_PATH = "/sys/class/input"
+
+	def __init__(self, data_dict):
+		self._debug = data_dict["debug"]
+		self._log = data_dict["log"]
+
+		self._cache = {}
+		self._devices = None
+
+		udevmonitor = data_dict.get("udevmonitor")
+		if udevmonitor:
+			udevmonitor.addListener(self._udevEvent)
+
+	## \brief Get all event devices with their types
+	#
+	# \public
+	# \return A dictionary which maps the name of the device (for example event3) to a frozenset of types
+	def devices(self):
+		if self._devices is None:
+			self._devices = self._scan()
+
+		return self._devices
+
+	## \brief Get the event devices which have one of the given types
+	#
+	# \public
+	# \param types A list of TYPE_* constants
+	# \return A sorted list of device names
+	def find(self, types):
+		return sorted([ name for (name, device_types) in self.devices().items() if not device_types.isdisjoint(types) ])
+
+	## \brief Get the types of one device
+	#
+	# \public
+	# \param name The name of the device, for example event3
+	# \return A frozenset of types, empty when the device does not exist
+	def classify(self, name):
+		try:
+			inode = os.lstat(os.path.join(self.CLASS_PATH, name)).st_ino
+			class_fd = os.open(self.CLASS_PATH, os.O_RDONLY | os.O_DIRECTORY)
+		except OSError:
+			return frozenset()
+
+		try:
+			return self._classifyCached(class_fd, name, inode)
+		finally:
+			os.close(class_fd)
+
+	## \brief Forget the list of devices, it is read again the next time it is needed
+	#
+	# \public
+	def invalidate(self):
+		self._devices = None
+
+	def _udevEvent(self, event):
+		self.invalidate()
+
+	def _scan(self):
+		devices = {}
+		cache = {}
+
+		try:
+			class_fd = os.open(self.CLASS_PATH, os.O_RDONLY | os.O_DIRECTORY)
+		except OSError:
+			return devices
+
+		try:
+			with os.scandir(class_fd) as entries:
+				for entry in entries:
+					if not entry.name.startswith("event"):
+						continue
+
+					key = (entry.name, entry.inode())
+					types = self._classifyCached(class_fd, entry.name, key[1])
+					cache[key] = types
+					devices[entry.name] = types
+		finally:
+			os.close(class_fd)
+
+		# Drop the devices which do not exist anymore
+		self._cache = cache
+		return devices
+
+	def _classifyCached(self, class_fd, name, inode):
+		key = (name, inode)
+		types = self._cache.get(key)
+		if types is None:
+			types = _classify(_readCapabilities(class_fd, name))
+			self._cache[key] = types
+
+		return types
+
+## \brief Read the capability bitmaps of a device
+#
+# \param class_fd A file descriptor of /sys/class/input
+# \param name The name of the device
+# \return A dictionary which maps ev, key, rel and abs to the bitmap as an integer
+def _readCapabilities(class_fd, name):
+	capabilities = {}
+
+	try:
+		cap_fd = os.open(name + "/device/capabilities", os.O_RDONLY | os.O_DIRECTORY, dir_fd=class_fd)
+	except OSError:
+		return capabilities
+
+	try:
+		for bitmap in ("ev", "key", "rel", "abs"):
+			try:
+				fd = os.open(bitmap, os.O_RDONLY, dir_fd=cap_fd)
+			except OSError:
+				continue
+
+			try:
+				words = os.read(fd, 4096).split()
+			finally:
+				os.close(fd)
+
+			value = 0
+			for word in words:
+				value = (value << _WORD_BITS) | int(word, 16)
+			capabilities[bitmap] = value
+	finally:
+		os.close(cap_fd)
+
+	return capabilities
+
+def _bit(bitmap, bit):
+	return (bitmap >> bit) & 1 == 1
+
+## \brief Classify a device from its capabilities, like the input_id builtin of udev does
+#
+# \return A frozenset of types
+def _classify(capabilities):
+	ev = capabilities.get("ev", 0)
+	key = capabilities.get("key", 0)
+	rel = capabilities.get("rel", 0)
+	absolute = capabilities.get("abs", 0)
+	types = set()
+
+	if _bit(ev, EV_KEY) and key & _KEYBOARD_KEYS == _KEYBOARD_KEYS:
+		types.add(TYPE_KEYBOARD)
+
+	if _bit(ev, EV_REL) and _bit(rel, REL_X) and _bit(rel, REL_Y) and _bit(key, BTN_MOUSE):
+		types.add(TYPE_MOUSE)
+
+	if _bit(ev, EV_ABS) and _bit(absolute, ABS_X) and _bit(absolute, ABS_Y):
+		if _bit(key, BTN_STYLUS) or _bit(key, BTN_TOOL_PEN):
+			types.add(TYPE_TABLET)
+		elif _bit(key, BTN_TOOL_FINGER) and not _bit(key, BTN_TOOL_PEN):
+			types.add(TYPE_TOUCHPAD)
+		elif _bit(key, BTN_TOUCH):
+			types.add(TYPE_TOUCHSCREEN)
+		elif _bit(key, BTN_MOUSE):
+			types.add(TYPE_MOUSE) # for example the absolute pointer of a virtual machine
+		elif _bit(key, BTN_JOYSTICK) or _bit(key, BTN_GAMEPAD):
+			types.add(TYPE_JOYSTICK)
+
+	return frozenset(types)
@@ -0,0 +1,145 @@
+##\package inputtracker
+# \brief Track the activity of input devices (/dev/input/event*) in the background.
+#
+# The devices are read by the pollmanager as soon as events arrive, so the buffers of the kernel never overflow.
+# For each device the time of the last event is remembered, so a check can ask if a device was active since
+# a given time without reading the device itself.
+# A device can be tracked by more than one check, it is opened once and closed when the last check stops tracking it.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import select
+import time
+from threading import Lock
+
+class _Device:
+	__slots__ = ("path", "fd", "users", "last_activity")
+
+	def __init__(self, path):
+		self.path = path
+		self.fd = None
+		self.users = 0
+		self.last_activity = None
+
+class InputTracker:
+	## \brief The amount of bytes read at once, a multiple of the size of an input event
+	READ_SIZE = 64 * 24
+
+	def __init__(self, data_dict):
+		self._debug = data_dict["debug"]
+		self._log = data_dict["log"]
+		self._pollmanager = data_dict["pollmanager"]
+
+		self._devices = {}
+		self._fds = {}
+		self._lock = Lock()
+
+	## \brief Start tracking a device
+	#
+	# \public
+	# \param path The path of the device, for example /dev/input/event3
+	# \throws OSError when the device cannot be opened
+	def track(self, path):
+		with self._lock:
+			device = self._devices.get(path)
+			if device is None:
+				device = _Device(path)
+				self._devices[path] = device
+
+			if device.fd is None:
+				try:
+					self._open(device)
+				except OSError:
+					if device.users == 0:
+						del self._devices[path]
+					raise
+
+			device.users += 1
+
+	## \brief Stop tracking a device, it is closed when no other check tracks it
+	#
+	# \public
+	# \param path The path of the device
+	def untrack(self, path):
+		with self._lock:
+			device = self._devices.get(path)
+			if device is None:
+				return
+
+			device.users -= 1
+			if device.users <= 0:
+				self._close(device)
+				del self._devices[path]
+
+	## \brief The time of the last event of a device
+	#
+	# \public
+	# \param path The path of the device
+	# \return The time from time.monotonic(), or None when the device had no events since it is tracked
+	def lastActivity(self, path):
+		device = self._devices.get(path)
+		return device.last_activity if device else None
+
+	## \brief Check if a device is open. A device is closed when it disappeared, track() opens it again.
+	#
+	# \public
+	def isOpen(self, path):
+		device = self._devices.get(path)
+		return device is not None and device.fd is not None
+
+	def _open(self, device):
+		fd = os.open(device.path, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+		device.fd = fd
+		self._fds[fd] = device
+		self._pollmanager.register(fd, self._onInput)
+
+	def _close(self, device):
+		if device.fd is None:
+			return
+
+		self._pollmanager.unregister(device.fd)
+		del self._fds[device.fd]
+		os.close(device.fd)
+		device.fd = None
+
+	## \brief Read all events of a device, called by the pollmanager
+	def _onInput(self, fd, events):
+		now = time.monotonic()
+		gone = (events & (select.EPOLLHUP | select.EPOLLERR)) != 0
+		read = False
+
+		try:
+			while os.read(fd, self.READ_SIZE):
+				read = True
+		except BlockingIOError:
+			pass
+		except OSError:
+			# ENODEV when the device is unplugged
+			gone = True
+
+		with self._lock:
+			device = self._fds.get(fd)
+			if device is None:
+				return
+
+			if read:
+				device.last_activity = now
+			if gone:
+				self._close(device)
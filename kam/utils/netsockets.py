@@ -0,0 +1,101 @@
+##\package netsockets
+# \brief Read the socket tables of the kernel from /proc/net/{tcp,tcp6,udp,udp6}.
+#
+# The sockets are filtered on their state while the tables are parsed, and the addresses are decoded
+# straight from the hexadecimal notation of the kernel to integers.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+
+PROC_PATH = "/proc/net"
+PROTOCOLS = [ "tcp", "tcp6", "udp", "udp6" ]
+
+## \brief The socket states, as they are numbered by the kernel
+STATES = { "ESTABLISHED": 0x01,\
+           "SYN_SENT": 0x02,\
+           "SYN_RECV": 0x03,\
+           "FIN_WAIT1": 0x04,\
+           "FIN_WAIT2": 0x05,\
+           "TIME_WAIT": 0x06,\
+           "CLOSE": 0x07,\
+           "CLOSE_WAIT": 0x08,\
+           "LAST_ACK": 0x09,\
+           "LISTEN": 0x0A,\
+           "CLOSING": 0x0B }
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+_V4_MAPPED_PREFIX = 0xFFFF
+
+## \brief Convert state names to the state field as it is written in the tables
+#
+# \param states A list of names of STATES
+# \return A set of the states as bytes, for example b"01"
+# \throws KeyError when a state name is unknown
+def stateFilter(states):
+	return set([ "{0:02X}".format(STATES[state.upper()]).encode() for state in states ])
+
+## \brief Read the remote addresses of the sockets in the given states
+#
+# \param protocols A list of names of PROTOCOLS
+# \param state_filter A set returned by stateFilter()
+# \param path The directory which contains the tables, normally /proc/net
+# \return A list of tuples (version, address), version is 4 or 6 and address is an integer.
+#         An IPv4 address mapped in an IPv6 socket is returned as an IPv4 address.
+def readRemoteAddresses(protocols, state_filter, path=PROC_PATH):
+	addresses = []
+
+	for protocol in protocols:
+		try:
+			with open("{0}/{1}".format(path, protocol), "rb") as f:
+				lines = f.read().splitlines()
+		except OSError:
+			# For example, there are no tables for IPv6 when it is disabled
+			continue
+
+		for line in lines[1:]:
+			# sl local_address rem_address st ...
+			fields = line.split(None, 4)
+			if len(fields) < 4 or fields[3] not in state_filter:
+				continue
+
+			remote = fields[2]
+			addresses.append(decodeAddress(remote[:remote.find(b":")]))
+
+	return addresses
+
+## \brief Decode an address of the socket tables
+#
+# The kernel writes an address as 32 bit words in the byte order of the machine.
+#
+# \param hex_address The address as hexadecimal bytes, without the port
+# \return A tuple (version, address)
+def decodeAddress(hex_address):
+	raw = bytes.fromhex(hex_address.decode())
+	if _LITTLE_ENDIAN:
+		raw = b"".join([ raw[i:i + 4][::-1] for i in range(0, len(raw), 4) ])
+
+	address = int.from_bytes(raw, "big")
+
+	if len(raw) == 4:
+		return (4, address)
+	elif address >> 32 == _V4_MAPPED_PREFIX:
+		return (4, address & 0xFFFFFFFF)
+	else:
+		return (6, address)
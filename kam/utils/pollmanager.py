@@ -1,6 +1,11 @@
 ##\package pollmanager
 # \brief This utility class can be used to poll files using a thread so they are "non-blocking".
 #
+# The PollManager is a reactor: it runs one thread with one long-lived epoll instance.
+# A plugin registers a file descriptor once with a callback. Each time the file descriptor is ready,
+# the callback is called in the thread of the PollManager, so it should only read the data and remember it.
+# The check which uses the data runs in the main thread.
+#
 # \author Philip Luyckx
 # \copyright GNU Public License
 
@@ -20,23 +25,114 @@
 # along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
 
 from threading import Thread, Lock
+import os
 import select
+import traceback
 
 class PollManager(Thread):
+	## \brief The maximum amount of events returned by one call of epoll
+	MAX_EVENTS = 64
+
 	def __init__(self, data_dict):
-		super().__init__()
+		super().__init__(name="kam-poll", daemon=True)
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
 
+		self._epoll = select.epoll()
+		self._callbacks = {}
+		self._lock = Lock()
+		self._running = True
+
+		# Writing to this pipe wakes up the thread, so it can stop
+		(self._wake_read, self._wake_write) = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+		self._epoll.register(self._wake_read, select.EPOLLIN)
+
+	## \brief Call a function each time a file descriptor is ready
+	#
+	# \public
+	# \param fd A file descriptor or an object with a fileno() method
+	# \param callback A function callback(fd, events), called in the thread of the PollManager.
+	#                 fd is the file descriptor as an integer, events the epoll events which are ready.
+	# \param events The epoll events to wait for
+	def register(self, fd, callback, events=select.EPOLLIN):
+		fd = self._fileno(fd)
+
+		with self._lock:
+			if fd in self._callbacks:
+				self._epoll.modify(fd, events)
+			else:
+				self._epoll.register(fd, events)
+			self._callbacks[fd] = callback
+
+	## \brief Stop calling the callback of a file descriptor
+	#
+	# Call this function before the file descriptor is closed.
+	#
+	# \public
+	# \param fd A file descriptor or an object with a fileno() method
+	def unregister(self, fd):
+		fd = self._fileno(fd)
+
+		with self._lock:
+			if self._callbacks.pop(fd, None) is not None:
+				try:
+					self._epoll.unregister(fd)
+				except OSError:
+					pass # the file descriptor is already closed
+
+	## \brief Check if a file descriptor has input, without waiting
+	#
+	# \public
+	# \param fd A file descriptor or an object with a fileno() method
 	def hasInput(self, fd):
-		poll = select.poll()
-		poll.register(fd, select.POLLIN)
-		more_input = len(poll.poll(0)) == 1
-		poll.unregister(fd)
+		(readable, _, _) = select.select([ fd ], [], [], 0)
+		return len(readable) > 0
+
+	def run(self):
+		while self._running:
+			try:
+				events = self._epoll.poll(-1, self.MAX_EVENTS)
+			except InterruptedError:
+				continue
+
+			for (fd, mask) in events:
+				if fd == self._wake_read:
+					self._drainWake()
+					continue
+
+				with self._lock:
+					callback = self._callbacks.get(fd)
+
+				if callback is None:
+					continue
+
+				try:
+					callback(fd, mask)
+				except Exception:
+					if self._log:
+						self._log.log(self, "Callback of fd {0} failed:\n{1}".format(fd, traceback.format_exc()))
+
+	## \brief Stop the thread and wait until it stopped
+	#
+	# \public
+	def stop(self):
+		if not self.is_alive():
+			return
+
+		self._running = False
+		os.write(self._wake_write, b"\0")
+		self.join()
+
+	def _drainWake(self):
+		try:
+			while os.read(self._wake_read, 64):
+				pass
+		except BlockingIOError:
+			pass
+
+	def _fileno(self, fd):
+		return fd if isinstance(fd, int) else fd.fileno()
 
-		return more_input
-	
 
 def createInstance(data_dict):
 	return PollManager(data_dict)
-
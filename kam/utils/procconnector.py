@@ -0,0 +1,144 @@
+##\package procconnector
+# \brief Receive process events (fork, exec, exit) from the kernel through the netlink proc connector.
+#
+# The socket is non-blocking. Call events() to get the events which arrived since the previous call.
+# Only events of processes are returned, events of threads are skipped.
+# Opening the socket needs the capability CAP_NET_ADMIN, so kam must run as root.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import errno
+import socket
+import struct
+
+from kam.modules.exceptions.exceptions import KamException
+
+NETLINK_CONNECTOR = 11
+CN_IDX_PROC = 1
+CN_VAL_PROC = 1
+PROC_CN_MCAST_LISTEN = 1
+NLMSG_DONE = 3
+
+## \brief A process forked, the pid is the pid of the child
+EVENT_FORK = 0x00000001
+## \brief A process called exec()
+EVENT_EXEC = 0x00000002
+## \brief A process changed its name
+EVENT_COMM = 0x00000200
+## \brief A process exited
+EVENT_EXIT = 0x80000000
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_CN_MSG = struct.Struct("=IIIIHH")
+_PROC_EVENT = struct.Struct("=IIQ")
+_TWO_PIDS = struct.Struct("=ii")
+_FORK = struct.Struct("=iiii")
+
+_EVENT_OFFSET = _NLMSGHDR.size + _CN_MSG.size
+_DATA_OFFSET = _EVENT_OFFSET + _PROC_EVENT.size
+
+## \brief Thrown when the kernel dropped events because the socket buffer was full
+class ProcConnectorOverrun(KamException):
+	def __init__(self, msg):
+		super().__init__(msg)
+
+class ProcConnector:
+	## \brief The size of the receive buffer, so bursts of events between two calls of events() are not lost
+	RECEIVE_BUFFER = 4 * 1024 * 1024
+
+	## \brief Open the netlink socket and subscribe to the process events
+	#
+	# \throws OSError when the socket cannot be opened, for example when kam does not run as root
+	def __init__(self):
+		self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_CONNECTOR)
+		try:
+			self._socket.bind((0, CN_IDX_PROC))
+
+			try:
+				self._socket.setsockopt(socket.SOL_SOCKET, 33, self.RECEIVE_BUFFER) # SO_RCVBUFFORCE
+			except OSError:
+				self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RECEIVE_BUFFER)
+
+			op = struct.pack("=I", PROC_CN_MCAST_LISTEN)
+			cn_msg = _CN_MSG.pack(CN_IDX_PROC, CN_VAL_PROC, 0, 0, len(op), 0)
+			header = _NLMSGHDR.pack(_NLMSGHDR.size + len(cn_msg) + len(op), NLMSG_DONE, 0, 0, 0)
+			self._socket.send(header + cn_msg + op)
+
+			self._socket.setblocking(False)
+		except:
+			self._socket.close()
+			raise
+
+	def fileno(self):
+		return self._socket.fileno()
+
+	def close(self):
+		self._socket.close()
+
+	## \brief Get all events which arrived since the previous call
+	#
+	# \public
+	# \return A list of tuples (event, pid), where event is one of the EVENT_* constants
+	# \throws ProcConnectorOverrun when events were lost. The events in the socket buffer are dropped too.
+	def events(self):
+		events = []
+
+		while True:
+			try:
+				data = self._socket.recv(65536)
+			except BlockingIOError:
+				break
+			except OSError as ex:
+				if ex.errno == errno.ENOBUFS:
+					self._drain()
+					raise ProcConnectorOverrun("The kernel dropped process events")
+				raise
+
+			offset = 0
+			while offset + _NLMSGHDR.size <= len(data):
+				(length, msg_type, _, _, _) = _NLMSGHDR.unpack_from(data, offset)
+				if length < _NLMSGHDR.size:
+					break
+
+				if msg_type == NLMSG_DONE and length >= _DATA_OFFSET:
+					self._parse(data, offset, length, events)
+
+				offset += (length + 3) & ~3
+
+		return events
+
+	def _parse(self, data, offset, length, events):
+		(what, _, _) = _PROC_EVENT.unpack_from(data, offset + _EVENT_OFFSET)
+		data_offset = offset + _DATA_OFFSET
+
+		if what == EVENT_FORK and length >= _DATA_OFFSET + _FORK.size:
+			(_, _, child_pid, child_tgid) = _FORK.unpack_from(data, data_offset)
+			if child_pid == child_tgid:
+				events.append((EVENT_FORK, child_tgid))
+		elif what in (EVENT_EXEC, EVENT_COMM, EVENT_EXIT) and length >= _DATA_OFFSET + _TWO_PIDS.size:
+			(pid, tgid) = _TWO_PIDS.unpack_from(data, data_offset)
+			if pid == tgid:
+				events.append((what, tgid))
+
+	def _drain(self):
+		while True:
+			try:
+				self._socket.recv(65536)
+			except OSError:
+				return
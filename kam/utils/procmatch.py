@@ -0,0 +1,189 @@
+##\package procmatch
+# \brief Match processes against a large set of rules at once.
+#
+# A rule contains one or more conditions on the fields of a process: the name (comm), the full command line
+# (cmdline), the path of the executable (exe) and the name of the owner (user).
+# A process matches a rule when it matches all conditions of the rule.
+#
+# A condition is a pattern:
+# - \e =value matches when the field is exactly \e value
+# - \e ~regex matches when \e regex is found in the field
+# - \e value matches when the field starts with \e value
+#
+# All conditions of all rules on the same field are compiled in one structure: a hash for the exact values,
+# a trie for the prefixes and one combined regex. So the cost to match a process does not depend on the
+# amount of rules.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+import pwd
+
+FIELD_COMM = "comm"
+FIELD_CMDLINE = "cmdline"
+FIELD_EXE = "exe"
+FIELD_USER = "user"
+
+## \brief The fields in the order they are matched, the cheapest first
+FIELDS = [ FIELD_COMM, FIELD_USER, FIELD_EXE, FIELD_CMDLINE ]
+
+_user_names = {}
+
+def _userName(uid):
+	name = _user_names.get(uid)
+	if name is None:
+		try:
+			name = pwd.getpwuid(uid).pw_name
+		except KeyError:
+			name = str(uid)
+		_user_names[uid] = name
+
+	return name
+
+_GETTERS = { FIELD_COMM: lambda info: info.getName(),\
+             FIELD_CMDLINE: lambda info: info.getCmdline(),\
+             FIELD_EXE: lambda info: info.getExe(),\
+             FIELD_USER: lambda info: _userName(info.getUid()) }
+
+class PrefixTrie:
+	def __init__(self):
+		self._root = ({}, [])
+
+	## \brief Add a prefix
+	#
+	# \param prefix The prefix string
+	# \param value The value which is returned by match() for strings which start with the prefix
+	def add(self, prefix, value):
+		node = self._root
+		for ch in prefix:
+			child = node[0].get(ch)
+			if child is None:
+				child = ({}, [])
+				node[0][ch] = child
+			node = child
+
+		node[1].append(value)
+
+	## \brief Get the values of all prefixes the string starts with
+	def match(self, string, out):
+		node = self._root
+		out.extend(node[1])
+
+		for ch in string:
+			node = node[0].get(ch)
+			if node is None:
+				break
+			out.extend(node[1])
+
+class FieldMatcher:
+	def __init__(self):
+		self._exact = {}
+		self._prefixes = PrefixTrie()
+		self._regexes = []
+		self._combined = None
+
+	## \brief Add a pattern
+	#
+	# \param pattern The pattern, see the description of this module
+	# \param value The value which is returned by match() for fields which match the pattern
+	# \throws re.error when the regex is invalid
+	def add(self, pattern, value):
+		if pattern.startswith("="):
+			self._exact.setdefault(pattern[1:], []).append(value)
+		elif pattern.startswith("~"):
+			self._regexes.append((re.compile(pattern[1:]), value))
+		else:
+			self._prefixes.add(pattern, value)
+
+	## \brief Build the combined regex, call this after all patterns are added
+	def compile(self):
+		self._combined = None
+		if len(self._regexes) > 1:
+			try:
+				self._combined = re.compile("|".join([ "(?:{0})".format(regex.pattern) for (regex, _) in self._regexes ]))
+			except re.error:
+				# For example when a pattern uses a back reference, just test the regexes one by one then
+				self._combined = None
+
+	## \brief Get the values of all patterns which match the field
+	def match(self, field):
+		out = []
+
+		exact = self._exact.get(field)
+		if exact:
+			out.extend(exact)
+
+		self._prefixes.match(field, out)
+
+		if len(self._regexes) > 0:
+			# Most fields do not match any regex, then one search is enough
+			if self._combined is None or self._combined.search(field):
+				for (regex, value) in self._regexes:
+					if regex.search(field):
+						out.append(value)
+
+		return out
+
+class ProcessMatcher:
+	## \brief Compile the rules
+	#
+	# \param rules A list of dictionaries, one for each rule, which map a field to a pattern
+	# \throws re.error when a regex is invalid
+	def __init__(self, rules):
+		self._condition_counts = []
+		matchers = {}
+		first_fields = set()
+
+		for (rule_id, conditions) in enumerate(rules):
+			self._condition_counts.append(len(conditions))
+			first_fields.add(min([ FIELDS.index(field) for field in conditions if field in FIELDS ], default=-1))
+			for (field, pattern) in conditions.items():
+				if field not in _GETTERS:
+					raise ValueError("Unknown process field {0}".format(field))
+
+				if field not in matchers:
+					matchers[field] = FieldMatcher()
+				matchers[field].add(pattern, rule_id)
+
+		# A field only needs to be read when a rule starts with it, or when a rule matched the previous fields
+		self._matchers = []
+		for (i, field) in enumerate(FIELDS):
+			if field in matchers:
+				matchers[field].compile()
+				self._matchers.append((_GETTERS[field], matchers[field], i in first_fields))
+
+	## \brief Get the rules a process matches
+	#
+	# \param info A ProcessInfo object
+	# \return A list of the indexes of the rules, in the order they were passed to the constructor
+	def match(self, info):
+		hits = {}
+
+		for (getter, matcher, first_field) in self._matchers:
+			if not first_field and len(hits) == 0:
+				continue
+
+			for rule_id in matcher.match(getter(info)):
+				hits[rule_id] = hits.get(rule_id, 0) + 1
+
+		if len(hits) == 0:
+			return []
+
+		condition_counts = self._condition_counts
+		return [ rule_id for (rule_id, count) in hits.items() if count == condition_counts[rule_id] ]
@@ -0,0 +1,236 @@
+##\package proctable
+# \brief A cached view of the process table, read directly from /proc.
+#
+# The table is refreshed with scan(). Only processes which are not in the cache yet are read.
+# A process is identified by its pid and its start time, so a reused pid is detected.
+# A new process is read a second time on the next scan, so a process which called exec() just after
+# it was forked gets its final name. Processes which exited are removed from the cache.
+#
+# The table is shared by all checks which need the process list, so it is only scanned once a round.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+from threading import Lock
+
+## \brief The kernel truncates the name of a process (comm) to this length
+COMM_LENGTH = 15
+
+class ProcessInfo:
+	__slots__ = ("_pid", "_start_time", "_name", "_inode", "_confirmed", "_cmdline", "_exe", "_uid")
+
+	def __init__(self, pid, start_time, name, inode):
+		self._pid = pid
+		self._start_time = start_time
+		self._name = name
+		self._inode = inode
+		self._confirmed = False
+		self._cmdline = None
+		self._exe = None
+		self._uid = None
+
+	def getPid(self):
+		return self._pid
+
+	## \brief The start time of the process in clock ticks after boot
+	def getStartTime(self):
+		return self._start_time
+
+	## \brief The name of the process. When the kernel truncated it, it is completed from the command line.
+	def getName(self):
+		return self._name
+
+	## \brief The command line of the process, the arguments separated by spaces. It is read the first time it is asked.
+	def getCmdline(self):
+		if self._cmdline is None:
+			self._cmdline = " ".join(_readArgs(self._pid))
+
+		return self._cmdline
+
+	## \brief The path of the executable. It is read the first time it is asked, an empty string if it cannot be read.
+	def getExe(self):
+		if self._exe is None:
+			try:
+				self._exe = os.readlink("/proc/{0}/exe".format(self._pid))
+			except OSError:
+				self._exe = ""
+
+		return self._exe
+
+	## \brief The uid of the owner of the process. It is read the first time it is asked, -1 if it cannot be read.
+	def getUid(self):
+		if self._uid is None:
+			try:
+				self._uid = os.stat("/proc/{0}".format(self._pid)).st_uid
+			except OSError:
+				self._uid = -1
+
+		return self._uid
+
+	def __str__(self):
+		return "{0} ({1})".format(self._name, self._pid)
+
+	def __repr__(self):
+		return str(self)
+
+class ProcessTable:
+	PROC_PATH = "/proc"
+
+	def __init__(self, data_dict):
+		self._debug = data_dict["debug"]
+		self._log = data_dict["log"]
+
+		self._processes = {}
+		self._last_scan = None
+		self._lock = Lock()
+
+	## \brief Refresh the cached process table
+	#
+	# \public
+	# \param max_age When the last scan is less than max_age seconds ago, the table is not scanned again.
+	#                This way multiple checks in the same round share one scan.
+	def scan(self, max_age=0):
+		with self._lock:
+			now = time.monotonic()
+			if self._last_scan is not None and now - self._last_scan < max_age:
+				return
+
+			self._scan()
+			self._last_scan = time.monotonic()
+
+	## \brief Get the processes found by the last scan
+	#
+	# \public
+	# \return A list of ProcessInfo objects
+	def processes(self):
+		with self._lock:
+			return list(self._processes.values())
+
+	## \brief Read one process, and update the cache with it
+	#
+	# \public
+	# Use this function when you know the process changed, for example after an exec().
+	# \param pid The pid of the process
+	# \return A ProcessInfo object, or None when the process does not exist
+	def lookup(self, pid):
+		try:
+			inode = os.stat("{0}/{1}".format(self.PROC_PATH, pid)).st_ino
+		except OSError:
+			inode = None
+
+		info = self._read(pid, inode)
+
+		with self._lock:
+			if info is None:
+				self._processes.pop(pid, None)
+			else:
+				info._confirmed = True
+				self._processes[pid] = info
+
+		return info
+
+	## \brief Remove a process from the cache
+	#
+	# \public
+	# \param pid The pid of the process which exited
+	def forget(self, pid):
+		with self._lock:
+			self._processes.pop(pid, None)
+
+	def _scan(self):
+		processes = self._processes
+		seen = set()
+
+		with os.scandir(self.PROC_PATH) as entries:
+			for entry in entries:
+				name = entry.name
+				if not name.isdigit():
+					continue
+
+				pid = int(name)
+				inode = entry.inode()
+				info = processes.get(pid)
+
+				if info is None:
+					info = self._read(pid, inode)
+					if info is None:
+						continue # the process exited while we were scanning
+
+					processes[pid] = info
+				elif info._inode != inode or not info._confirmed:
+					new_info = self._read(pid, inode)
+					if new_info is None:
+						continue
+
+					if new_info._start_time == info._start_time:
+						new_info._confirmed = True
+
+					processes[pid] = new_info
+
+				seen.add(pid)
+
+		if len(seen) != len(processes):
+			for pid in [ pid for pid in processes if pid not in seen ]:
+				del processes[pid]
+
+	## \brief Read the name and the start time of a process from /proc/{pid}/stat
+	#
+	# \return A ProcessInfo object or None when the process does not exist anymore
+	def _read(self, pid, inode):
+		try:
+			with open("{0}/{1}/stat".format(self.PROC_PATH, pid), "rb") as f:
+				data = f.read()
+		except OSError:
+			return None
+
+		# The name is between parentheses and can contain spaces and parentheses itself
+		name_start = data.find(b"(")
+		name_end = data.rfind(b")")
+		if name_start < 0 or name_end < 0:
+			return None
+
+		name = data[name_start + 1:name_end].decode("utf-8", "replace")
+		fields = data[name_end + 2:].split()
+
+		try:
+			start_time = int(fields[19])
+		except (IndexError, ValueError):
+			return None
+
+		info = ProcessInfo(pid, start_time, name, inode)
+
+		if len(name) >= COMM_LENGTH:
+			args = _readArgs(pid)
+			if len(args) > 0:
+				full_name = os.path.basename(args[0])
+				if full_name.startswith(name):
+					info._name = full_name
+
+		return info
+
+## \brief Read the arguments of a process, an empty list for kernel threads or when it cannot be read
+def _readArgs(pid):
+	try:
+		with open("/proc/{0}/cmdline".format(pid), "rb") as f:
+			data = f.read()
+	except OSError:
+		return []
+
+	return [ arg.decode("utf-8", "replace") for arg in data.split(b"\0") if arg ]
@@ -0,0 +1,160 @@
+##\package ratemeter
+# \brief Calculate smoothed rates from counters which only increase, for example the bytes sent by an interface.
+#
+# Each key (an interface, a disk, ...) has a slot with a fixed amount of counters. The state of all slots
+# is kept in flat arrays of doubles, so updating a key does not create objects.
+# A slot is reused after its key disappeared.
+#
+# The rates can be smoothed:
+# - \e none: the rate since the previous update
+# - \e ewma: an exponentially weighted moving average, with a weight of 2 / (window + 1) for the newest rate
+# - \e window: the average rate over the last \e window updates
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+from array import array
+
+SMOOTHING_NONE = "none"
+SMOOTHING_EWMA = "ewma"
+SMOOTHING_WINDOW = "window"
+SMOOTHING = [ SMOOTHING_NONE, SMOOTHING_EWMA, SMOOTHING_WINDOW ]
+
+## \brief A counter from this value up to _WRAP which goes back wrapped at 32 bit, any other counter which goes back was reset
+_WRAP_THRESHOLD = 1 << 31
+_WRAP = 1 << 32
+
+class RateMeter:
+	## \brief Create a meter
+	#
+	# \param counters The amount of counters of each key
+	# \param smoothing One of SMOOTHING
+	# \param window The amount of updates to smooth over, not used when smoothing is none
+	# \throws ValueError when smoothing is unknown or window is smaller than 1
+	def __init__(self, counters, smoothing=SMOOTHING_NONE, window=1):
+		if smoothing not in SMOOTHING:
+			raise ValueError("Unknown smoothing {0}".format(smoothing))
+		if window < 1:
+			raise ValueError("The smoothing window must be at least 1")
+
+		self._counters = counters
+		self._smoothing = smoothing
+		self._window = window if smoothing == SMOOTHING_WINDOW else 1
+		self._alpha = 2.0 / (window + 1)
+
+		self._slots = {}
+		self._free = []
+		self._seen = set()
+		# per slot: the previous counter values, the smoothed rates and the time of the previous update
+		self._previous = array("d")
+		self._rates = array("d")
+		self._times = array("d")
+		self._samples = array("l")
+		# per slot, only for the window smoothing: a ring of the deltas and of the durations of the last updates
+		self._deltas = array("d")
+		self._durations = array("d")
+
+	## \brief Update the counters of a key
+	#
+	# \public
+	# \param key The key
+	# \param values A list with the current value of each counter
+	# \param now The time of the values in seconds, from a monotonic clock
+	# \return A list with the rate of each counter per second, None for the first update of a key
+	def update(self, key, values, now):
+		self._seen.add(key)
+
+		slot = self._slots.get(key)
+		if slot is None:
+			slot = self._allocate(key)
+			base = slot * self._counters
+			for i in range(self._counters):
+				self._previous[base + i] = values[i]
+			self._times[slot] = now
+			return None
+
+		duration = now - self._times[slot]
+		if duration <= 0:
+			return None
+		self._times[slot] = now
+
+		n = self._counters
+		base = slot * n
+		previous = self._previous
+		rates = self._rates
+		samples = self._samples[slot]
+		self._samples[slot] = samples + 1
+
+		if self._smoothing == SMOOTHING_WINDOW:
+			ring = slot * self._window
+			pos = samples % self._window
+			self._durations[ring + pos] = duration
+			total_duration = sum(self._durations[ring:ring + min(samples + 1, self._window)])
+
+		for i in range(n):
+			value = values[i]
+			delta = value - previous[base + i]
+			if delta < 0:
+				# Only a 32 bit counter wraps, a 64 bit counter which goes back was reset
+				if _WRAP_THRESHOLD <= previous[base + i] < _WRAP:
+					delta = value + _WRAP - previous[base + i]
+				else:
+					delta = value
+			previous[base + i] = value
+
+			if self._smoothing == SMOOTHING_WINDOW:
+				deltas = (ring + pos) * n
+				self._deltas[deltas + i] = delta
+				total = 0.0
+				for j in range(min(samples + 1, self._window)):
+					total += self._deltas[(ring + j) * n + i]
+				rates[base + i] = total / total_duration
+			elif self._smoothing == SMOOTHING_EWMA and samples > 0:
+				rates[base + i] += self._alpha * (delta / duration - rates[base + i])
+			else:
+				rates[base + i] = delta / duration
+
+		return rates[base:base + n].tolist()
+
+	## \brief Free the slots of the keys which were not updated since the previous call
+	#
+	# \public
+	# Call this once after each round of updates.
+	def sweep(self):
+		if len(self._seen) != len(self._slots):
+			for key in [ key for key in self._slots if key not in self._seen ]:
+				self._free.append(self._slots.pop(key))
+
+		self._seen = set()
+
+	def _allocate(self, key):
+		if len(self._free) > 0:
+			slot = self._free.pop()
+		else:
+			slot = len(self._times)
+			self._previous.extend([ 0.0 ] * self._counters)
+			self._rates.extend([ 0.0 ] * self._counters)
+			self._times.append(0.0)
+			self._samples.append(0)
+			if self._smoothing == SMOOTHING_WINDOW:
+				self._deltas.extend([ 0.0 ] * (self._counters * self._window))
+				self._durations.extend([ 0.0 ] * self._window)
+
+		self._samples[slot] = 0
+		self._slots[key] = slot
+		return slot
@@ -0,0 +1,241 @@
+##\package ringfile
+# \brief A preallocated, memory mapped file which holds a fixed amount of fixed size records.
+#
+# The file starts with a small header which contains the geometry of the ring and a head pointer.
+# Appending a record overwrites the oldest record when the ring is full, so an append always
+# costs the same, no matter how many records are kept. The file is never rewritten.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import mmap
+import struct
+
+## \brief Rename a file to path.old, or path.old.1, ... when that exists already
+#
+# \param path The path of the file
+# \return The new path
+# \throws OSError when the file cannot be renamed
+def moveAside(path):
+	moved_to = path + ".old"
+	suffix = 1
+	while os.path.lexists(moved_to):
+		moved_to = "{0}.old.{1}".format(path, suffix)
+		suffix += 1
+
+	os.rename(path, moved_to)
+	return moved_to
+
+## \brief Check if a file is a ring file with the given magic
+#
+# \return True when the file starts with the magic, False when it does not or does not exist
+def hasMagic(path, magic):
+	try:
+		with open(path, "rb") as f:
+			return f.read(len(magic)) == magic
+	except FileNotFoundError:
+		return False
+
+class RingFile:
+	## \brief The magic used when no magic is passed to the constructor
+	MAGIC = b"KAMRING1"
+	## \brief magic, record_size, capacity, head, count
+	HEADER = struct.Struct("<8sIIII")
+	## \brief The header is padded to this size, so records are nicely aligned
+	HEADER_SIZE = 64
+	## \brief Each record starts with the length of its payload
+	LENGTH = struct.Struct("<H")
+
+	_OFFSET_HEAD = 16
+	_OFFSET_COUNT = 20
+
+	## \brief Open or create a ring file
+	#
+	# When the file exists and has the same magic and geometry, the records in it are kept.
+	# A ring with the same magic and another geometry is recreated. Any other file which is not empty,
+	# for example a text log, is renamed to path.old (or path.old.1, ...) first, so it is never overwritten.
+	#
+	# \param path The path of the file
+	# \param capacity The amount of records the ring can hold
+	# \param record_size The size of one record in bytes, including the length field
+	# \param magic 8 bytes which identify the content of the ring
+	def __init__(self, path, capacity, record_size, magic=MAGIC):
+		if capacity <= 0:
+			raise ValueError("The capacity of a ring file must be larger than 0")
+		if record_size <= self.LENGTH.size or record_size > 0xFFFF:
+			raise ValueError("Invalid record size {0}".format(record_size))
+
+		self._path = path
+		self._capacity = capacity
+		self._record_size = record_size
+		self._magic = magic
+		self._size = self.HEADER_SIZE + capacity * record_size
+		self._moved_to = self._moveAside()
+
+		self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+		try:
+			self._created = not self._hasGeometry()
+			if self._created:
+				self._create()
+
+			self._map = mmap.mmap(self._fd, self._size)
+		except:
+			os.close(self._fd)
+			raise
+
+		(_, _, _, self._head, self._count) = self.HEADER.unpack_from(self._map, 0)
+
+	## \brief Append a record to the ring. Payloads which do not fit in a record are truncated.
+	#
+	# \public
+	# \param data The payload as bytes
+	def append(self, data):
+		max_length = self._record_size - self.LENGTH.size
+		if len(data) > max_length:
+			data = data[:max_length]
+
+		offset = self.HEADER_SIZE + self._head * self._record_size
+		self.LENGTH.pack_into(self._map, offset, len(data))
+		offset += self.LENGTH.size
+		self._map[offset:offset + len(data)] = data
+
+		self._head = (self._head + 1) % self._capacity
+		if self._count < self._capacity:
+			self._count += 1
+
+		struct.pack_into("<II", self._map, self._OFFSET_HEAD, self._head, self._count)
+
+	## \brief Return the records in chronological order
+	#
+	# \public
+	# \return A list of payloads, the oldest first
+	def records(self):
+		return self._records(self._map, self._head, self._count, self._capacity, self._record_size)
+
+	## \brief Write the dirty pages to disk
+	#
+	# \public
+	def flush(self):
+		self._map.flush()
+
+	## \brief Unmap and close the file
+	#
+	# \public
+	def close(self):
+		self._map.close()
+		os.close(self._fd)
+
+	## \brief Check if the file was (re)created when it was opened, so it did not contain old records
+	#
+	# \public
+	def wasCreated(self):
+		return self._created
+
+	## \brief Get the path the existing file was renamed to, because it was not a ring of this type
+	#
+	# \public
+	# \return The new path of the old file, or None when no file was renamed
+	def getMovedTo(self):
+		return self._moved_to
+
+	def getCapacity(self):
+		return self._capacity
+
+	def getRecordSize(self):
+		return self._record_size
+
+	def getPath(self):
+		return self._path
+
+	## \brief Read all records from an existing ring file, without modifying it.
+	#
+	# \public
+	# \param path The path of the ring file
+	# \param magic The magic the file must have
+	# \return A list of payloads, the oldest first
+	# \throws ValueError when the file is not a ring file with the given magic
+	@classmethod
+	def read(cls, path, magic=MAGIC):
+		with open(path, "rb") as f:
+			content = f.read()
+
+		if len(content) < cls.HEADER_SIZE:
+			raise ValueError("{0} is not a ring file".format(path))
+
+		(file_magic, record_size, capacity, head, count) = cls.HEADER.unpack_from(content, 0)
+		if file_magic != magic:
+			raise ValueError("{0} is not a ring file of the expected type".format(path))
+		if len(content) < cls.HEADER_SIZE + capacity * record_size:
+			raise ValueError("{0} is truncated".format(path))
+
+		return cls._records(content, head, count, capacity, record_size)
+
+	## \brief Check if the file on disk has the magic and geometry we expect
+	def _hasGeometry(self):
+		if os.fstat(self._fd).st_size != self._size:
+			return False
+
+		header = os.pread(self._fd, self.HEADER.size, 0)
+		(magic, record_size, capacity, head, count) = self.HEADER.unpack(header)
+
+		return magic == self._magic and record_size == self._record_size and \
+		       capacity == self._capacity and head < capacity and count <= capacity
+
+	## \brief Rename the file when it is not empty and is not a ring with our magic
+	#
+	# \return The new path, or None when the file was not renamed
+	def _moveAside(self):
+		try:
+			with open(self._path, "rb") as f:
+				magic = f.read(len(self._magic))
+		except FileNotFoundError:
+			return None
+
+		if len(magic) == 0 or magic == self._magic:
+			return None
+
+		return moveAside(self._path)
+
+	## \brief Create an empty ring and preallocate the blocks on disk
+	def _create(self):
+		os.ftruncate(self._fd, 0)
+		os.ftruncate(self._fd, self._size)
+		try:
+			os.posix_fallocate(self._fd, 0, self._size)
+		except OSError:
+			# Not all filesystems support this, the file is sparse then
+			pass
+
+		header = self.HEADER.pack(self._magic, self._record_size, self._capacity, 0, 0)
+		os.pwrite(self._fd, header, 0)
+
+	@classmethod
+	def _records(cls, buf, head, count, capacity, record_size):
+		records = []
+		start = (head - count) % capacity
+		max_length = record_size - cls.LENGTH.size
+
+		for i in range(0, count):
+			offset = cls.HEADER_SIZE + ((start + i) % capacity) * record_size
+			(length,) = cls.LENGTH.unpack_from(buf, offset)
+			length = min(length, max_length)
+			offset += cls.LENGTH.size
+			records.append(bytes(buf[offset:offset + length]))
+
+		return records
@@ -0,0 +1,239 @@
+##\package segmentfile
+# \brief A text file which is rotated in segments.
+#
+# New data is always appended to the active segment. When the active segment becomes too large or
+# too old, it is closed and renamed to \e {path}.{YYYYmmdd-HHMMSS}. A background thread compresses
+# the closed segments with gzip and removes the oldest segments when all segments together use more
+# disk space than the configured budget.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
+
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+import gzip
+import time
+import queue
+import shutil
+import syslog
+import threading
+from datetime import datetime
+
+import kam.utils.utils as utils
+
+class SegmentFile:
+	CONFIG_ITEM_SEGMENT_SIZE = "segment_size"
+	CONFIG_ITEM_SEGMENT_AGE = "segment_age"
+	CONFIG_ITEM_MAX_DISK = "max_disk"
+
+	## \brief The extension of a compressed segment
+	COMPRESSED_EXTENSION = ".gz"
+
+	## \brief Open the active segment
+	#
+	# \param path The path of the active segment
+	# \param max_size The size in bytes at which the active segment is rotated, 0 for no limit
+	# \param max_age The age in seconds at which the active segment is rotated, 0 for no limit.
+	#                The age is counted from the moment the segment is opened.
+	# \param max_total The disk space in bytes all segments together may use, 0 for no limit
+	def __init__(self, path, max_size, max_age, max_total):
+		self._path = path
+		self._max_size = max_size
+		self._max_age = max_age
+		self._max_total = max_total
+
+		directory = os.path.dirname(os.path.abspath(path))
+		name = re.escape(os.path.basename(path))
+		self._directory = directory
+		self._segment_pattern = re.compile("^" + name + r"\.[0-9]{8}-[0-9]{6}(-[0-9]+)?(" +\
+		                                   re.escape(self.COMPRESSED_EXTENSION) + ")?$")
+
+		self._queue = queue.Queue()
+		self._compressor = threading.Thread(target=self._compressLoop, name="kam-segment-compressor", daemon=True)
+		self._compressor.start()
+
+		self._open()
+		# Compress the segments a previous run did not compress yet, and apply the budget
+		self._queue.put(True)
+
+	## \brief Create a segment file with the settings of a config section
+	#
+	# \public
+	# The section can contain \e segment_size (bytes, K, M and G can be used), \e segment_age (minutes)
+	# and \e max_disk (bytes, K, M and G can be used).
+	#
+	# \param path The path of the active segment
+	# \param section The config section, or None to use the defaults
+	# \return A tuple of the SegmentFile and an error string, which is empty when everything is parsed
+	@classmethod
+	def fromSection(cls, path, section):
+		err_value = ""
+		max_size = 1024 * 1024
+		max_age = 0
+		max_total = 10 * 1024 * 1024
+
+		if section:
+			try:
+				value = section.get(cls.CONFIG_ITEM_SEGMENT_SIZE)
+				if value:
+					max_size = utils.toSize(value)
+			except ValueError as ex:
+				err_value += str(ex) + ";"
+
+			try:
+				value = section.get(cls.CONFIG_ITEM_SEGMENT_AGE)
+				if value:
+					max_age = int(value) * 60
+			except ValueError as ex:
+				err_value += str(ex) + ";"
+
+			try:
+				value = section.get(cls.CONFIG_ITEM_MAX_DISK)
+				if value:
+					max_total = utils.toSize(value)
+			except ValueError as ex:
+				err_value += str(ex) + ";"
+
+		return (cls(path, max_size, max_age, max_total), err_value)
+
+	def __str__(self):
+		return "segment_size={0}; segment_age={1}; max_disk={2}".format(self._max_size, self._max_age // 60, self._max_total)
+
+	## \brief Append text to the active segment, and rotate it first when needed
+	#
+	# \public
+	# \param text The text to append, normally one or more complete lines
+	def write(self, text):
+		if self._needsRotation():
+			self._rotate()
+
+		self._file.write(text)
+		self._file.flush()
+		self._size += len(text.encode("utf-8", "replace"))
+
+	## \brief Write the active segment to disk
+	#
+	# \public
+	def flush(self):
+		self._file.flush()
+		os.fsync(self._file.fileno())
+
+	## \brief Close the active segment and stop the background thread after it finished its work
+	#
+	# \public
+	def close(self):
+		self._file.close()
+		self._queue.put(None)
+		self._compressor.join()
+
+	def _open(self):
+		self._file = open(self._path, "a", encoding="utf-8", errors="replace")
+		self._size = self._file.tell()
+		self._opened = time.monotonic()
+
+	def _needsRotation(self):
+		if self._size == 0:
+			return False
+
+		if self._max_size > 0 and self._size >= self._max_size:
+			return True
+		if self._max_age > 0 and time.monotonic() - self._opened >= self._max_age:
+			return True
+
+		return False
+
+	## \brief Close the active segment, rename it and hand it to the background thread
+	def _rotate(self):
+		self._file.close()
+
+		base = "{0}.{1}".format(self._path, datetime.now().strftime("%Y%m%d-%H%M%S"))
+		segment = base
+		i = 1
+		while os.path.exists(segment) or os.path.exists(segment + self.COMPRESSED_EXTENSION):
+			segment = "{0}-{1}".format(base, i)
+			i += 1
+
+		os.rename(self._path, segment)
+		self._open()
+
+		self._queue.put(True)
+
+	## \brief The background thread, each item in the queue triggers a compress and cleanup pass
+	def _compressLoop(self):
+		while True:
+			item = self._queue.get()
+			if item is None:
+				return
+
+			try:
+				self._compressSegments()
+				self._applyBudget()
+			except OSError as ex:
+				syslog.syslog("[Kam-SegmentFile] Failed to compress or remove segments of {0}: {1}".format(self._path, str(ex)))
+
+	## \brief Return the names of all closed segments, the oldest first
+	def _segments(self):
+		segments = []
+		for entry in os.scandir(self._directory):
+			if self._segment_pattern.match(entry.name):
+				segments.append(entry.name)
+
+		# The names contain the time of the rotation, so sorting them sorts them chronologically
+		segments.sort(key=lambda name: name[:-len(self.COMPRESSED_EXTENSION)] if name.endswith(self.COMPRESSED_EXTENSION) else name)
+		return segments
+
+	def _compressSegments(self):
+		for name in self._segments():
+			if name.endswith(self.COMPRESSED_EXTENSION):
+				continue
+
+			segment = os.path.join(self._directory, name)
+			compressed = segment + self.COMPRESSED_EXTENSION
+			tmp = compressed + ".tmp"
+
+			with open(segment, "rb") as src:
+				with gzip.open(tmp, "wb") as dst:
+					shutil.copyfileobj(src, dst)
+
+			os.rename(tmp, compressed)
+			os.remove(segment)
+
+	## \brief Remove the oldest segments until all segments fit in the budget
+	def _applyBudget(self):
+		if self._max_total <= 0:
+			return
+
+		segments = []
+		total = 0
+		for name in self._segments():
+			segment = os.path.join(self._directory, name)
+			size = os.stat(segment).st_size
+			segments.append((segment, size))
+			total += size
+
+		try:
+			total += os.stat(self._path).st_size
+		except FileNotFoundError:
+			pass
+
+		for (segment, size) in segments:
+			if total <= self._max_total:
+				break
+
+			os.remove(segment)
+			total -= size
@@ -1,25 +1,188 @@
+##\package udevmonitor
+# \brief Receive the device events (uevents) of the kernel through a NETLINK_KOBJECT_UEVENT socket.
+#
+# The socket is registered with the pollmanager. The events are parsed and filtered in its thread and queued.
+# check() passes the queued events to the listeners in the thread which calls it, normally the main thread.
+# Only the events of the input subsystem for event devices (/dev/input/event*) are kept.
+# When the socket buffer overflowed and events were lost, the listeners get an event with ACTION_RESCAN.
+#
+# \author Philip Luyckx
+# \copyright GNU Public License
 
-import subprocess
+# This file is part of Keep Alive Monitor (kam).
+#
+# Keep Alive Monitor is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Keep Alive Monitor is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Keep Alive Monitor.  If not, see <http://www.gnu.org/licenses/>.
+
+import errno
+import socket
+from threading import Lock
+
+NETLINK_KOBJECT_UEVENT = 15
+## \brief The multicast group of the events sent by the kernel itself, udev sends its events to group 2
+UEVENT_GROUP_KERNEL = 1
+
+ACTION_ADD = "add"
+ACTION_REMOVE = "remove"
+## \brief Not an event of the kernel: events were lost, the listeners must find their devices again
+ACTION_RESCAN = "rescan"
+
+SUBSYSTEM_INPUT = "input"
+## \brief The prefix of the device name of the event devices, relative to /dev
+INPUT_EVENT_PREFIX = "input/event"
+
+class UEvent:
+	__slots__ = ("_action", "_devpath", "_subsystem", "_devname")
+
+	def __init__(self, action, devpath, subsystem, devname):
+		self._action = action
+		self._devpath = devpath
+		self._subsystem = subsystem
+		self._devname = devname
+
+	## \brief ACTION_ADD, ACTION_REMOVE or another action of the kernel (change, bind, ...)
+	def getAction(self):
+		return self._action
+
+	## \brief The path of the device in /sys, for example /devices/.../input/input5/event3
+	def getDevpath(self):
+		return self._devpath
+
+	def getSubsystem(self):
+		return self._subsystem
+
+	## \brief The name of the device node relative to /dev, for example input/event3
+	def getDevname(self):
+		return self._devname
+
+	## \brief The name of the device node without its directory, for example event3
+	def getName(self):
+		return self._devname[self._devname.rfind("/") + 1:]
+
+	def __str__(self):
+		return "{0} {1}".format(self._action, self._devname)
+
+	def __repr__(self):
+		return str(self)
 
 class UDevMonitor(object):
+	RECEIVE_BUFFER = 1024 * 1024
+
 	def __init__(self, data_dict):
 		self._debug = data_dict["debug"]
 		self._log = data_dict["log"]
 		self._pollmanager = data_dict["pollmanager"]
 
 		self._callbacks = []
+		self._listeners = []
+		self._lock = Lock()
+		self._events = []
+		self._socket = None
 
+	## \brief Open the netlink socket and register it with the pollmanager
 	def start(self):
-		self._proc = subprocess.Popen([ "udevadm", "monitor" ], stdout=subprocess.PIPE, bufsize=0)
+		try:
+			self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_CLOEXEC | socket.SOCK_NONBLOCK,\
+			                             NETLINK_KOBJECT_UEVENT)
+			self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RECEIVE_BUFFER)
+			self._socket.bind((0, UEVENT_GROUP_KERNEL))
+		except OSError as ex:
+			if self._log:
+				self._log.log(self, "Cannot receive device events: {0}\n".format(str(ex)))
+			if self._socket:
+				self._socket.close()
+				self._socket = None
+			return
+
+		self._pollmanager.register(self._socket, self._onEvents)
 
+	## \brief Add a function which is called for each event of an input event device
+	#
+	# \public
+	# \param listener A function listener(event), event is a UEvent object
+	def addListener(self, listener):
+		self._listeners.append(listener)
+
+	## \brief Add a function which is called once when one or more input event devices changed
+	#
+	# \public
+	# \param callback A function without parameters
 	def addCallback(self, callback):
 		self._callbacks.append(callback)
 
+	## \brief Pass the events since the previous call to the listeners
+	#
+	# The listeners are called in the thread which calls this function.
 	def check(self):
-		if self._pollmanager.hasInput(self._proc.stdout):
-			while self._pollmanager.hasInput(self._proc.stdout):
-				igonore = self._proc.stdout.read(1000)
+		with self._lock:
+			events = self._events
+			self._events = []
+
+		if len(events) == 0:
+			return
+
+		for event in events:
+			for listener in self._listeners:
+				listener(event)
+
+		for callback in self._callbacks:
+			callback()
+
+	## \brief Read the events from the socket, called by the pollmanager
+	def _onEvents(self, fd, events):
+		received = []
+
+		while True:
+			try:
+				data = self._socket.recv(8192)
+			except BlockingIOError:
+				break
+			except OSError as ex:
+				if self._log:
+					self._log.log(self, "Receiving device events failed: {0}\n".format(str(ex)))
+
+				# ENOBUFS: events were lost, the next events are received normally.
+				# A lost add or remove is only noticed by looking at the devices again.
+				if ex.errno == errno.ENOBUFS:
+					received.append(UEvent(ACTION_RESCAN, "", "", ""))
+				break
+
+			event = self._parse(data)
+			if event is not None:
+				received.append(event)
+
+		if len(received) > 0:
+			with self._lock:
+				self._events.extend(received)
+
+	## \brief Parse an event of the kernel: "action@devpath\0KEY=value\0KEY=value\0..."
+	#
+	# \return A UEvent object or None when the event is not about an input event device
+	def _parse(self, data):
+		fields = data.split(b"\0")
+		if b"@" not in fields[0]:
+			return None # not an event of the kernel
+
+		properties = {}
+		for field in fields[1:]:
+			(key, _, value) = field.partition(b"=")
+			properties[key] = value
 
-			for callback in self._callbacks:
-				callback()
+		subsystem = properties.get(b"SUBSYSTEM", b"").decode()
+		devname = properties.get(b"DEVNAME", b"").decode()
+		if subsystem != SUBSYSTEM_INPUT or not devname.startswith(INPUT_EVENT_PREFIX):
+			return None
 
+		return UEvent(properties.get(b"ACTION", b"").decode(),\
+		              properties.get(b"DEVPATH", b"").decode(),\
+		              subsystem, devname)
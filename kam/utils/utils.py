@@ -40,3 +40,17 @@ def toBool(value):
 		return value != 0.0
 	else:
 		return False
+
+## \brief Convert a size like 512, 10K, 5M or 1G to a number of bytes
+#
+# \param value The size as a string, K, M and G are powers of 1024
+# \return The size as an integer
+# \throws ValueError when the value cannot be parsed
+def toSize(value):
+	value = value.strip()
+	multipliers = { "K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024 }
+
+	if len(value) > 0 and value[-1].upper() in multipliers:
+		return int(float(value[:-1]) * multipliers[value[-1].upper()])
+	else:
+		return int(value)
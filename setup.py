@@ -35,20 +35,6 @@ def check_version():
 		sys.exit(1)
 
 
-def check_psutil():
-	missing = []
-
-	try:
-		import psutil
-	except:
-		missing.append("psutil")
-
-
-	if len(missing) > 0:
-		print("Please install the following packages for python3 first:")
-		print(", ".join(missing))
-		sys.exit(1)
-
 def find_packages(relative_dir, packages, package_dir):
 	abs_dir = os.path.abspath(relative_dir)
 	init_file = os.path.join(abs_dir, "__init__.py")
@@ -69,7 +55,6 @@ def has_bin(bin_name):
 
 def main():
 	check_version()
-	check_psutil()
 
 	packages = []
 	package_dir = {}
@@ -86,7 +71,7 @@ def main():
 	      license="GPLV2",
 	      packages=packages,
 	      package_dir=package_dir,
-	      scripts=["kam/bin/kamd"],
+	      scripts=["kam/bin/kamd", "kam/bin/kamlease", "kam/bin/kamlog", "kam/bin/kamtrace"],
 	      data_files=[
 	                  ("/etc/kam", ["kam.conf", "version"]),
 	                  ("/etc/init.d", ["kam/init/kam"]),